@@ -29,7 +29,9 @@ from aiohttp import web
 
 from libhusky import HuskyConfig
 from libhusky import HuskyHTTP
+from libhusky import HuskyHTTPClient
 from libhusky import HuskyUtils
+from libhusky import HuskyWatchdog
 from libhusky.HuskyStatics import *
 from libhusky.discord.HuskyHelpFormatter import HuskyHelpFormatter
 
@@ -65,6 +67,9 @@ class HuskyBot(commands.Bot, metaclass=HuskyUtils.Singleton):
         # Load in HuskyBot's API
         self.webapp = web.Application()
 
+        # Outbound HTTP for plugins. Plugins should use this instead of making their own sessions.
+        self.http_client = HuskyHTTPClient.HttpClient(self.config.get('httpClient', {}))
+
         # Allow setting custom routes (litecord/canary/apiv7 support)
         discord.http.Route.BASE = os.getenv('DISCORD_API_URL', discord.http.Route.BASE)
 
@@ -124,6 +129,23 @@ class HuskyBot(commands.Bot, metaclass=HuskyUtils.Singleton):
 
         await super().logout()
 
+    async def close(self):
+        HuskyWatchdog.get_watchdog().stop()
+        await self.http_client.close()
+
+        await super().close()
+
+    def add_cog(self, cog: commands.Cog):
+        super().add_cog(cog)
+        HuskyHTTP.get_router().bind_plugin(cog)
+
+    def remove_cog(self, name: str):
+        cog = self.get_cog(name)
+        super().remove_cog(name)
+
+        if cog is not None:
+            HuskyHTTP.get_router().unload_plugin(cog)
+
     def __check_developer_mode(self):
         return bool(os.environ.get('HUSKYBOT_DEVMODE', self.config.get('developerMode', False)))
 
@@ -207,9 +229,8 @@ class HuskyBot(commands.Bot, metaclass=HuskyUtils.Singleton):
                 ssl_context = ssl.SSLContext()
                 ssl_context.load_cert_chain(cert.read())
 
-        for method in ["GET", "HEAD", "POST", "PATCH", "PUT", "DELETE", "VIEW"]:
-            # Abuse the hell out of aiohttp's own router to load in HuskyRouter.
-            self.webapp.router.add_route(method, '/{tail:.*}', HuskyHTTP.get_router().handle(self))
+        # Abuse the hell out of aiohttp's own router to load in HuskyRouter. HuskyRouter does its own method matching.
+        self.webapp.router.add_route('*', '/{tail:.*}', HuskyHTTP.get_router().handle(self))
 
         runner = web.AppRunner(self.webapp)
         await runner.setup()
@@ -302,6 +323,10 @@ class HuskyBot(commands.Bot, metaclass=HuskyUtils.Singleton):
         Initialize the bot logger and other critical services. Init stage 1 will *not* re-run if it has executed.
         """
 
+        # Start watching for event loop stalls
+        stall_threshold = self.config.get('watchdog', {}).get('stallThresholdMs')
+        HuskyWatchdog.get_watchdog().start(self.loop, stall_threshold / 1000 if stall_threshold else None)
+
         # Load in application information
         app_info = await self.application_info()
         self.session_store.set("appInfo", app_info)
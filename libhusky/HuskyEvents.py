@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import logging
+import time
+from enum import Enum
+
+LOG = logging.getLogger("HuskyBot.Events")
+
+# How many events a subscriber may have waiting before new events are dropped for it.
+DEFAULT_BUFFER_SIZE = 256
+
+
+class Subscription:
+    """
+    A single consumer of the event bus.
+
+    Events wait in a bounded buffer until the consumer reads them. A consumer that falls behind far enough to fill its
+    buffer has new events dropped (and counted) instead of holding up the bot; the next read after a gap returns a
+    `dropped` event saying how many were lost, in the position they would have been.
+
+    Once closed (see EventBus.unsubscribe), reads return None straight away.
+    """
+
+    def __init__(self, types=None, guild_id: int = None, max_buffer: int = DEFAULT_BUFFER_SIZE):
+        self.types = frozenset(types) if types else None
+        self.guild_id = guild_id
+
+        # (events dropped just before this one, event)
+        self._queue = asyncio.Queue(maxsize=max_buffer)
+        self._unreported = 0
+        self._held = None
+
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+
+    def wants(self, event_type: str, guild_id: int) -> bool:
+        if self.types is not None and event_type not in self.types:
+            return False
+
+        if self.guild_id is not None and guild_id != self.guild_id:
+            return False
+
+        return True
+
+    def offer(self, event: dict):
+        if self.closed:
+            return
+
+        try:
+            self._queue.put_nowait((self._unreported, event))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._unreported += 1
+            return
+
+        self._unreported = 0
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self._held = None
+
+        # Anything still buffered is abandoned. Wake up a reader that's waiting on an empty buffer.
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+        self._queue.put_nowait((0, None))
+
+    async def get(self, timeout: float = None):
+        """
+        Wait for the next event.
+
+        :param timeout: How long to wait, in seconds. None waits forever.
+        :return: The next event, or None if the timeout passed first or the subscription is closed.
+        """
+        if self.closed and self._queue.empty():
+            return None
+
+        if self._held is not None:
+            event, self._held = self._held, None
+            self.delivered += 1
+            return event
+
+        try:
+            dropped, event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        if event is None:
+            return None
+
+        if dropped:
+            self._held = event
+            return {"type": "dropped", "count": dropped, "timestamp": time.time()}
+
+        self.delivered += 1
+        return event
+
+
+class EventBus:
+    """
+    An in-process publish/subscribe bus for moderation events.
+
+    Publishing never waits: each event is offered to every interested subscriber's buffer and the publisher carries
+    on. With no subscribers, publishing costs next to nothing. Everything here runs on the bot's event loop, so it
+    must only be used from there.
+    """
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._sequence = itertools.count(1)
+
+        self._stats = {"published": 0, "dropped": 0, "subscriptions": 0}
+
+    def subscribe(self, types=None, guild_id: int = None, max_buffer: int = DEFAULT_BUFFER_SIZE) -> Subscription:
+        """
+        Start receiving events.
+
+        :param types: An iterable of event types to receive. None (or empty) receives every type.
+        :param guild_id: Only receive events from this guild. None receives events from every guild.
+        :param max_buffer: How many events may wait unread before new ones are dropped.
+        """
+        subscription = Subscription(types, guild_id, max_buffer)
+
+        self._subscriptions.add(subscription)
+        self._stats['subscriptions'] += 1
+        LOG.debug(f"New event subscription (types={types}, guild={guild_id}). {len(self._subscriptions)} active.")
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        Stop delivering events to a subscription, and close it. Unsubscribing more than once is harmless.
+        """
+        if subscription not in self._subscriptions:
+            return
+
+        self._subscriptions.remove(subscription)
+        self._stats['dropped'] += subscription.dropped
+        subscription.close()
+
+    def publish(self, event_type, guild_id: int = None, **data):
+        """
+        Publish an event to every interested subscriber. Extra keyword arguments become fields of the event, and
+        must be JSON serializable.
+        """
+        if isinstance(event_type, Enum):
+            event_type = event_type.value
+
+        self._stats['published'] += 1
+
+        if not self._subscriptions:
+            return
+
+        event = {
+            "id": next(self._sequence),
+            "type": event_type,
+            "timestamp": time.time(),
+            "guild": guild_id,
+            **data
+        }
+
+        for subscription in self._subscriptions:
+            if subscription.wants(event_type, guild_id):
+                subscription.offer(event)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+
+        stats['active'] = len(self._subscriptions)
+        stats['dropped'] += sum(s.dropped for s in self._subscriptions)
+
+        return stats
+
+
+bus = EventBus()
+
+
+def get_bus():
+    return bus
+
+
+def publish(event_type, guild_id: int = None, **data):
+    bus.publish(event_type, guild_id, **data)
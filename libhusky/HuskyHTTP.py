@@ -1,4 +1,6 @@
+import hmac
 import logging
+import time
 
 from aiohttp import web
 from discord.ext import commands
@@ -6,31 +8,107 @@ from discord.ext import commands
 LOG = logging.getLogger("HuskyBot.HttpServer")
 
 
+class RouteEntry:
+    """
+    A single routed method: the handler, the plugin that owns it, and counters for how it's been used.
+    """
+
+    __slots__ = ('method', 'path', 'plugin', 'func', 'instance', 'requests', 'errors', 'total_time', 'max_time')
+
+    def __init__(self, method: str, path: str, plugin: str, func):
+        self.method = method
+        self.path = path
+        self.plugin = plugin
+        self.func = func
+
+        # The plugin (cog) instance to pass as `self`. Bound when the plugin is loaded.
+        self.instance = None
+
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "averageMs": (self.total_time / self.requests) * 1000 if self.requests else 0.0,
+            "maxMs": self.max_time * 1000
+        }
+
+
+class RouteNode:
+    """
+    One path segment in the route tree. Static children are matched before the parameter child.
+    """
+
+    __slots__ = ('children', 'param_name', 'param_child', 'methods')
+
+    def __init__(self):
+        self.children = {}
+        self.param_name = None
+        self.param_child = None
+
+        # METHOD -> RouteEntry
+        self.methods = {}
+
+
+def split_path(path: str) -> list:
+    return [segment for segment in path.split('/') if segment]
+
+
 class HuskyRouter:
     """
     A simple dynamic router that allows methods to be added/removed freely.
+
+    Paths may contain `{name}` segments, which match any single path segment and are passed to the handler as keyword
+    arguments. Paths without parameters are dispatched from a flat lookup table; the rest walk a route tree. Both are
+    rebuilt whenever routes change, rather than on every request.
     """
 
     def __init__(self):
+        # path -> {METHOD: RouteEntry}
         self.routes = {}
 
+        # plugin name -> plugin instance, for plugins that are currently loaded
+        self._plugins = {}
+
+        self._static_routes = {}
+        self._tree = RouteNode()
+
     def add_route(self, method: str, path: str, plugin: str, handler):
         """
         Add a new route to the internal routing table.
 
         :param method: The method that this route should target.
-        :param path: The path that this route should handle.
+        :param path: The path that this route should handle. `{name}` segments capture a path segment.
         :param plugin: The plugin name this works on
         :param handler: The function/def that will handle this route.
         """
-        path_route = self.routes.setdefault(path, {})
-        path_route[method.upper()] = {}
-
-        path_route[method.upper()]['func'] = handler
+        entry = RouteEntry(method.upper(), path, plugin, handler)
 
         # This is discordpy related bullshit, because we need to be able to
         # pass a self()
-        path_route[method.upper()]['plugin'] = plugin
+        entry.instance = self._plugins.get(plugin)
+
+        path_route = self.routes.setdefault(path, {})
+        previous = path_route.get(method.upper())
+        path_route[method.upper()] = entry
+
+        try:
+            self._compile()
+        except ValueError:
+            # Put things back the way they were, so one bad route doesn't break every other one.
+            if previous is not None:
+                path_route[method.upper()] = previous
+            else:
+                del path_route[method.upper()]
+
+                if not path_route:
+                    del self.routes[path]
+
+            raise
 
     def remove_method(self, path: str, method: str):
         """
@@ -46,6 +124,11 @@ class HuskyRouter:
 
         del path_route[method.upper()]
 
+        if not path_route:
+            del self.routes[path]
+
+        self._compile()
+
     def remove_path(self, path: str):
         """
         Remove a specific path from our routing table.
@@ -53,6 +136,7 @@ class HuskyRouter:
         :param path: The path (and methods) to remove.
         """
         del self.routes[path]
+        self._compile()
 
     def remove_paths(self, path: str):
         """
@@ -65,37 +149,170 @@ class HuskyRouter:
             if p.startswith(path):
                 del self.routes[p]
 
+        self._compile()
+
+    def bind_plugin(self, instance):
+        """
+        Point every route owned by a newly loaded plugin at its instance.
+        """
+        plugin_name = instance.__class__.__name__
+        self._plugins[plugin_name] = instance
+
+        for path_o in self.routes.values():
+            for method_o in path_o.values():
+                if method_o.plugin == plugin_name:
+                    method_o.instance = instance
+
     def unload_plugin(self, instance):
         plugin_name = instance.__class__.__name__
 
+        if self._plugins.get(plugin_name) is instance:
+            del self._plugins[plugin_name]
+
         for path in list(self.routes.keys()):
             path_o = self.routes[path]
 
             for method in list(path_o.keys()):
                 method_o = path_o[method]
 
-                if method_o['plugin'] == plugin_name:
+                if method_o.plugin == plugin_name:
                     del self.routes[path][method]
 
             if len(path_o.keys()) == 0:
                 del self.routes[path]
 
+        self._compile()
+
+    def _compile(self):
+        static_routes = {}
+        tree = RouteNode()
+
+        for path, methods in self.routes.items():
+            segments = split_path(path)
+
+            if not any(s.startswith('{') and s.endswith('}') for s in segments):
+                static_routes['/' + '/'.join(segments)] = methods
+                continue
+
+            node = tree
+            for segment in segments:
+                if segment.startswith('{') and segment.endswith('}'):
+                    name = segment[1:-1]
+
+                    if node.param_child is None:
+                        node.param_name = name
+                        node.param_child = RouteNode()
+                    elif node.param_name != name:
+                        raise ValueError(f"Path {path} names parameter {{{name}}}, but another route already uses "
+                                         f"{{{node.param_name}}} in the same position.")
+
+                    node = node.param_child
+                else:
+                    node = node.children.setdefault(segment, RouteNode())
+
+            node.methods = methods
+
+        self._static_routes = static_routes
+        self._tree = tree
+
+    def resolve(self, path: str):
+        """
+        Find the routes for a request path.
+
+        :return: A tuple of ({METHOD: RouteEntry}, {param: value}), or (None, None) if nothing matches.
+        """
+        segments = split_path(path)
+
+        methods = self._static_routes.get('/' + '/'.join(segments))
+        if methods is not None:
+            return methods, {}
+
+        return self._walk(self._tree, segments, 0, {})
+
+    def _walk(self, node: RouteNode, segments: list, index: int, params: dict):
+        if index == len(segments):
+            return (node.methods, params) if node.methods else (None, None)
+
+        child = node.children.get(segments[index])
+        if child is not None:
+            result = self._walk(child, segments, index + 1, params)
+
+            if result[0] is not None:
+                return result
+
+        if node.param_child is not None:
+            return self._walk(node.param_child, segments, index + 1, {**params, node.param_name: segments[index]})
+
+        return None, None
+
+    def get_stats(self) -> dict:
+        return {f"{method} {path}": entry.get_stats()
+                for path, methods in self.routes.items() for method, entry in methods.items()}
+
     def handle(self, bot: commands.Bot):
         async def wrapped(request: web.BaseRequest):
-            if request.path not in self.routes:
+            path_routes, params = self.resolve(request.path)
+
+            if path_routes is None:
                 raise web.HTTPNotFound()
 
-            path_routes = self.routes[request.path]
+            method = request.method
+            entry = path_routes.get(method)
+
+            # HEAD falls back to GET. aiohttp leaves the body off HEAD responses for us.
+            if entry is None and method == "HEAD":
+                entry = path_routes.get("GET")
+
+            if entry is None:
+                allowed = set(path_routes.keys()) | {"OPTIONS"}
+                if "GET" in allowed:
+                    allowed.add("HEAD")
+
+                if method == "OPTIONS":
+                    return web.Response(status=204, headers={"Allow": ", ".join(sorted(allowed))})
+
+                raise web.HTTPMethodNotAllowed(method=method, allowed_methods=allowed)
+
+            if entry.instance is None:
+                entry.instance = bot.get_cog(name=entry.plugin)
 
-            if request.method not in path_routes:
-                raise web.HTTPMethodNotAllowed(method=request.method, allowed_methods=path_routes.keys())
+            started = time.perf_counter()
+            try:
+                return await entry.func(entry.instance, request=request, **params)
+            except web.HTTPException:
+                raise
+            except Exception:
+                entry.errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+
+                entry.requests += 1
+                entry.total_time += elapsed
+                entry.max_time = max(entry.max_time, elapsed)
 
-            method = path_routes[request.method]
-            result = await method['func'](bot.get_cog(name=method['plugin']), request=request)
-            return result
         return wrapped
 
 
+def check_token(request: web.BaseRequest, expected_token):
+    """
+    Make sure a request carries a token, sent either as a bearer token or as a `token` query parameter.
+
+    Routes guarded by this are off unless a token is configured, so a missing `expected_token` denies every request.
+    """
+    if not expected_token:
+        raise web.HTTPForbidden(text="This endpoint is disabled until a token is configured for it.")
+
+    supplied_token = request.query.get('token', '')
+
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        supplied_token = auth_header[len('Bearer '):]
+
+    if not hmac.compare_digest(supplied_token.encode('utf-8'), str(expected_token).encode('utf-8')):
+        raise web.HTTPUnauthorized()
+
+
 router = HuskyRouter()
 
 
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+from yarl import URL
+
+LOG = logging.getLogger("HuskyBot.HttpClient")
+
+# Defaults for the `httpClient` config section.
+DEFAULT_CONFIG = {
+    # Open connections, in total and to any single host
+    "limit": 100,
+    "limitPerHost": 10,
+
+    # Seconds to keep idle connections open for reuse
+    "keepaliveTimeout": 30,
+
+    # Seconds to cache DNS lookups for
+    "dnsCacheTtl": 300,
+
+    # Seconds allowed for a whole request, and for connecting
+    "timeout": 30,
+    "connectTimeout": 10,
+
+    # Largest response body (in bytes) that will be read
+    "maxResponseSize": 8 * 1024 * 1024,
+
+    # host -> {"limit": concurrent requests, "timeout": seconds}, for hosts that need something different
+    "hosts": {}
+}
+
+
+class ResponseTooLargeError(aiohttp.ClientPayloadError):
+    pass
+
+
+class CappedClientResponse(aiohttp.ClientResponse):
+    """
+    A client response that refuses to read a body larger than `max_size` bytes.
+    """
+
+    max_size = None
+    bytes_read = 0
+
+    async def read(self) -> bytes:
+        if self._body is not None or self.max_size is None:
+            return await super().read()
+
+        if self.content_length is not None and self.content_length > self.max_size:
+            self.close()
+            raise ResponseTooLargeError(f"Response from {self.url.host} is {self.content_length} bytes, over the "
+                                        f"limit of {self.max_size} bytes.")
+
+        chunks = []
+        try:
+            async for chunk in self.content.iter_any():
+                self.bytes_read += len(chunk)
+
+                if self.bytes_read > self.max_size:
+                    raise ResponseTooLargeError(f"Response from {self.url.host} is over the limit of "
+                                                f"{self.max_size} bytes.")
+
+                chunks.append(chunk)
+        except BaseException:
+            self.close()
+            raise
+
+        self._body = b"".join(chunks)
+        return self._body
+
+
+class ClientStats:
+    __slots__ = ('requests', 'errors', 'bytes', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "averageMs": (self.total_time / self.requests) * 1000 if self.requests else 0.0,
+            "maxMs": self.max_time * 1000
+        }
+
+
+class PluginRequest:
+    """
+    A request made through a PluginHttpClient, used as `async with client.request(...) as response`. Waits for the
+    host's limiter (if it has one), then records the request's time, size and outcome against the plugin once the
+    response is released.
+    """
+
+    def __init__(self, client: 'HttpClient', stats: ClientStats, method: str, url: str, max_size: int, kwargs: dict):
+        self._client = client
+        self._stats = stats
+        self._method = method
+        self._url = url
+        self._max_size = max_size
+        self._kwargs = kwargs
+
+        self._limiter = None
+        self._response = None
+        self._started = None
+
+    async def __aenter__(self) -> aiohttp.ClientResponse:
+        host = URL(self._url).host
+
+        self._stats.requests += 1
+        self._started = time.perf_counter()
+
+        try:
+            limiter = self._client.get_host_limiter(host)
+            if limiter is not None:
+                await limiter.acquire()
+                self._limiter = limiter
+
+            self._kwargs.setdefault('timeout', self._client.get_host_timeout(host))
+
+            self._response = await self._client.session.request(self._method, self._url, **self._kwargs)
+            self._response.max_size = self._max_size or self._client.max_response_size
+        except BaseException as e:
+            self._finish(e)
+            raise
+
+        return self._response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._finish(exc)
+
+    def _finish(self, exc: BaseException = None):
+        if self._response is not None:
+            self._response.release()
+            self._stats.bytes += self._response.bytes_read
+
+        if self._limiter is not None:
+            self._limiter.release()
+
+        if isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError)):
+            self._stats.errors += 1
+
+        elapsed = time.perf_counter() - self._started
+
+        self._stats.total_time += elapsed
+        self._stats.max_time = max(self._stats.max_time, elapsed)
+
+
+class PluginHttpClient:
+    """
+    A plugin's handle on the shared HTTP client. Requests made through it are counted against the plugin.
+    """
+
+    def __init__(self, client: 'HttpClient', plugin: str):
+        self._client = client
+        self.plugin = plugin
+
+    def request(self, method: str, url: str, *, max_size: int = None, **kwargs) -> PluginRequest:
+        """
+        Make a request through the shared session. Use as `async with client.request(...) as response`.
+
+        :param max_size: The largest body (in bytes) to read from the response, if not the configured default.
+        :param kwargs: Anything else `aiohttp.ClientSession.request` accepts.
+        """
+        return PluginRequest(self._client, self._client.get_plugin_stats(self.plugin), method, url, max_size, kwargs)
+
+    def get(self, url: str, **kwargs) -> PluginRequest:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> PluginRequest:
+        return self.request("POST", url, **kwargs)
+
+
+class HttpClient:
+    """
+    The bot's outbound HTTP client. Every plugin shares one session (and so one connection pool and DNS cache), with
+    default timeouts and response size limits, and usage is tracked per plugin.
+
+    Settings come from the `httpClient` config section; see DEFAULT_CONFIG. The session itself is created on first
+    use, and must be closed (with close()) when the bot shuts down.
+    """
+
+    def __init__(self, config: dict = None):
+        self._config = {**DEFAULT_CONFIG, **(config or {})}
+        self._session = None
+
+        self.max_response_size = self._config['maxResponseSize']
+        self._default_timeout = aiohttp.ClientTimeout(total=self._config['timeout'],
+                                                      sock_connect=self._config['connectTimeout'])
+
+        # host -> Semaphore / ClientTimeout, for hosts with their own settings
+        self._host_limiters = {}
+        self._host_timeouts = {}
+
+        for host, host_config in self._config['hosts'].items():
+            if host_config.get('limit'):
+                self._host_limiters[host] = asyncio.Semaphore(host_config['limit'])
+
+            if host_config.get('timeout'):
+                self._host_timeouts[host] = aiohttp.ClientTimeout(total=host_config['timeout'],
+                                                                  sock_connect=self._config['connectTimeout'])
+
+        # plugin name -> ClientStats
+        self._stats = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._config['limit'],
+                limit_per_host=self._config['limitPerHost'],
+                keepalive_timeout=self._config['keepaliveTimeout'],
+                use_dns_cache=True,
+                ttl_dns_cache=self._config['dnsCacheTtl']
+            )
+
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._default_timeout,
+                                                  response_class=CappedClientResponse)
+
+            LOG.debug("Opened the shared HTTP client session.")
+
+        return self._session
+
+    def for_plugin(self, plugin) -> PluginHttpClient:
+        """
+        Get a client for a plugin. The plugin may be given as a name or as the plugin (cog) itself.
+        """
+        if not isinstance(plugin, str):
+            plugin = plugin.__class__.__name__
+
+        return PluginHttpClient(self, plugin)
+
+    def get_host_limiter(self, host: str):
+        return self._host_limiters.get(host)
+
+    def get_host_timeout(self, host: str) -> aiohttp.ClientTimeout:
+        return self._host_timeouts.get(host, self._default_timeout)
+
+    def get_plugin_stats(self, plugin: str) -> ClientStats:
+        stats = self._stats.get(plugin)
+
+        if stats is None:
+            stats = self._stats[plugin] = ClientStats()
+
+        return stats
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            LOG.debug("Closed the shared HTTP client session.")
+
+        self._session = None
+
+    def get_stats(self) -> dict:
+        return {plugin: stats.get_stats() for plugin, stats in self._stats.items()}
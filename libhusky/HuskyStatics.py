@@ -47,6 +47,28 @@ class SpecialRoleKeys(Enum):
     BOT_DEVS = "botDevelopers"
 
 
+class ModerationEvents(Enum):
+    """
+    Event types published to the moderation event feed.
+
+    BAN/UNBAN - A user was banned or unbanned, by anyone (including through the Discord client).
+    KICK - The bot kicked a user (UBL, GuildSecurity, AntiSpam).
+    MESSAGE_DELETE - A message (or a bulk delete of messages) was deleted.
+    MUTE/UNMUTE - A mute was applied or lifted through the MuteManager.
+    ANTISPAM_STRIKE - An AntiSpam filter warned (or punished) a user.
+    AUTOFLAG - AutoFlag raised a message to staff.
+    """
+
+    BAN = "ban"
+    UNBAN = "unban"
+    KICK = "kick"
+    MESSAGE_DELETE = "message_delete"
+    MUTE = "mute"
+    UNMUTE = "unmute"
+    ANTISPAM_STRIKE = "antispam_strike"
+    AUTOFLAG = "autoflag"
+
+
 class Emojis:
     NO_ENTRY = "\U0001F6AB"
     TRIANGLE = "\U000026A0"
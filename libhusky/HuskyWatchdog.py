@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+LOG = logging.getLogger("HuskyBot.Watchdog")
+
+# How often (in seconds) the loop is checked for lag.
+LAG_SAMPLE_INTERVAL = 0.5
+
+# Default lag (in seconds) at which the loop is considered stalled and its stack is captured.
+LAG_STALL_THRESHOLD = 0.25
+
+# How many lag samples are kept for percentiles. At the default interval, this is the last 10 minutes.
+LAG_HISTORY_SIZE = 1200
+
+# How many of the innermost frames of a stalled loop's stack are logged.
+STALL_STACK_DEPTH = 25
+
+# How many recent stall reports are kept for debugging.
+STALL_HISTORY_SIZE = 10
+
+# asyncio.current_task() only exists from Python 3.7.
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+def _percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class LoopWatchdog:
+    """
+    Measures how late the event loop runs its callbacks, and catches whatever is blocking it.
+
+    A task on the loop wakes up every LAG_SAMPLE_INTERVAL seconds and records how late it woke up. A helper thread
+    watches for that task going quiet: once the loop has been stuck for longer than the stall threshold, the helper
+    captures the loop thread's stack (and the task that was running) and logs it while the stall is still happening,
+    which is the only time the offending code is still on the stack.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+        self.threshold = LAG_STALL_THRESHOLD
+
+        # Lag samples, in seconds
+        self._samples = collections.deque(maxlen=LAG_HISTORY_SIZE)
+        self._last_beat = None
+
+        self._stall_count = 0
+        self._stalls = collections.deque(maxlen=STALL_HISTORY_SIZE)
+
+    def start(self, loop: asyncio.AbstractEventLoop, threshold: float = None):
+        if self._task is not None:
+            return
+
+        if threshold is not None:
+            self.threshold = threshold
+
+        self._loop = loop
+        self._stopping.clear()
+        self._task = loop.create_task(self._measure())
+
+        self._thread = threading.Thread(target=self._watch, name="HuskyBot-LoopWatchdog", daemon=True)
+        self._thread.start()
+
+        LOG.info(f"Event loop watchdog started (stall threshold {self.threshold * 1000:.0f} ms).")
+
+    def stop(self):
+        self._stopping.set()
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+
+        while True:
+            expected = self._loop.time() + LAG_SAMPLE_INTERVAL
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+
+            lag = max(0.0, self._loop.time() - expected)
+            self._samples.append(lag)
+            self._last_beat = time.monotonic()
+
+            if lag >= self.threshold:
+                LOG.warning(f"Event loop was blocked for {lag * 1000:.0f} ms.")
+
+    def _watch(self):
+        stalled_since = None
+
+        while not self._stopping.wait(LAG_SAMPLE_INTERVAL / 2):
+            last_beat = self._last_beat
+
+            if last_beat is None:
+                continue
+
+            overdue = time.monotonic() - last_beat - LAG_SAMPLE_INTERVAL
+
+            if overdue < self.threshold:
+                stalled_since = None
+                continue
+
+            # Only capture each stall once, at the point it crosses the threshold.
+            if stalled_since == last_beat:
+                continue
+
+            stalled_since = last_beat
+            self._capture_stall(overdue)
+
+    def _capture_stall(self, overdue: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+
+        if frame is None:
+            return
+
+        stack = "".join(traceback.format_stack(frame, limit=STALL_STACK_DEPTH))
+
+        try:
+            task = _current_task(self._loop)
+        except RuntimeError:
+            task = None
+
+        self._stall_count += 1
+        # The stack and task only go to the log. Stats are served over HTTP, and shouldn't expose code paths.
+        self._stalls.append({
+            "timestamp": time.time(),
+            "lagMs": overdue * 1000
+        })
+
+        LOG.warning(f"Event loop has been blocked for {overdue * 1000:.0f} ms. Current task: {task!r}\n"
+                    f"Loop thread stack (most recent call last):\n{stack}")
+
+    def get_stats(self) -> dict:
+        ordered = sorted(self._samples)
+
+        return {
+            "samples": len(ordered),
+            "p50Ms": _percentile(ordered, 0.50) * 1000,
+            "p90Ms": _percentile(ordered, 0.90) * 1000,
+            "p99Ms": _percentile(ordered, 0.99) * 1000,
+            "maxMs": (ordered[-1] if ordered else 0.0) * 1000,
+            "thresholdMs": self.threshold * 1000,
+            "stalls": self._stall_count,
+            "recentStalls": list(self._stalls)
+        }
+
+
+watchdog = LoopWatchdog()
+
+
+def get_watchdog():
+    return watchdog
@@ -101,6 +101,8 @@ class AttachmentFilter(AntiSpamModule):
 
             # And we increment the offense counter here.
             cooldown_record['offenseCount'] += 1
+            self.report_strike(message, offenses=cooldown_record['offenseCount'],
+                               attachments=len(message.attachments))
 
             # Give them a fair warning on attachment #3
             if filter_config['warnLimit'] != 0 and cooldown_record['offenseCount'] == filter_config['warnLimit']:
@@ -76,6 +76,7 @@ class EmbedFilter(AntiSpamModule):
                 await message.delete()
                 actions.append("Message Deleted")
 
+            self.report_strike(message, actions=actions)
             LOG.info(f"User ID {message.author.id} sent embed without accompanying message content. "
                      f"Actions taken: {','.join(actions)}")
 
@@ -9,6 +9,7 @@ import discord
 from discord.ext import commands
 from discord.http import Route
 
+from libhusky import HuskyEvents
 from libhusky.HuskyStatics import *
 from libhusky.antispam import AntiSpamModule
 
@@ -151,6 +152,7 @@ class InviteFilter(AntiSpamModule):
             # And we increment the offense counter here, and extend their expiry
             record['offenseCount'] += 1
             record['expiry'] = datetime.datetime.utcnow() + datetime.timedelta(minutes=filter_settings['minutes'])
+            self.report_strike(message, offenses=record['offenseCount'], invite=fragment)
 
             user_fate = UserFate.WARN
 
@@ -158,6 +160,9 @@ class InviteFilter(AntiSpamModule):
             if new_user:
                 await message.author.kick(reason="New user (less than 60 seconds old) posted invite.")
                 LOG.info(f"User {message.author} kicked for posting invite within 60 seconds of joining.")
+                HuskyEvents.publish(ModerationEvents.KICK, message.guild.id, user_id=message.author.id,
+                                    user=str(message.author), source=self.name,
+                                    reason="New user (less than 60 seconds old) posted invite.")
                 user_fate = UserFate.KICK_NEW
 
             # Ban the user if necessary (performance)
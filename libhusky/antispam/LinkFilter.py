@@ -126,6 +126,8 @@ class LinkFilter(AntiSpamModule):
             if cooldown_record['totalLinks'] >= warn_limit and cooldown_record['offenseCount'] == 0:
                 await message.channel.send(embed=link_warning, delete_after=90.0)
                 cooldown_record['offenseCount'] += 1
+                self.report_strike(message, offenses=cooldown_record['offenseCount'],
+                                   links=cooldown_record['totalLinks'])
 
                 if log_channel is not None:
                     embed = discord.Embed(
@@ -170,6 +172,7 @@ class LinkFilter(AntiSpamModule):
 
             # Get the offender's cooldown record, and increment it.
             cooldown_record['offenseCount'] += 1
+            self.report_strike(message, offenses=cooldown_record['offenseCount'], links=len(regex_matches))
 
             # Post something to logs
             if log_channel is not None:
@@ -100,6 +100,7 @@ class MentionFilter(AntiSpamModule):
                 ).set_author(name="Mass Ping Alert", icon_url=message.author.avatar_url))
 
             LOG.info(f"Got message from {message.author} containing {len(message.mentions)} pings.")
+            self.report_strike(message, mentions=len(message.mentions))
 
         if ping_config['hard'] is not None:
             if len(message.mentions) >= ping_config['hard']:
@@ -118,6 +118,7 @@ class NonAsciiFilter(AntiSpamModule):
             LOG.info(f"Warned user {message.author} for non-ascii spam publicly. A cooldown record has been created.")
 
         cooldown_record['offenseCount'] += 1
+        self.report_strike(message, offenses=cooldown_record['offenseCount'], non_ascii=nonascii_percentage)
         LOG.info(f"Offense record for {message.author} incremented. User has "
                  f"{cooldown_record['offenseCount']} / {check_config['banLimit']} warnings.")
 
@@ -94,6 +94,7 @@ class NonUniqueFilter(AntiSpamModule):
                 LOG.info(f"Message from {message.author} is too similar to past message, strike added. "
                          f"Similarity = {diff:.3f}")
                 message_cache[s_message] += 1
+                self.report_strike(message, offenses=sum(message_cache.values()), similarity=diff)
                 break
         else:
             while len(message_cache) >= nonunique_config['cacheSize']:
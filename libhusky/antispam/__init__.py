@@ -5,6 +5,9 @@ import discord
 from discord.ext import commands
 from discord.ext.commands import MissingPermissions, CogMeta
 
+from libhusky import HuskyEvents
+from libhusky.HuskyStatics import ModerationEvents
+
 
 class AntiSpamModule(commands.Group, metaclass=CogMeta):
     """
@@ -40,6 +43,15 @@ class AntiSpamModule(commands.Group, metaclass=CogMeta):
     def clear_all(self):
         raise NotImplementedError
 
+    def report_strike(self, message: discord.Message, **details):
+        """
+        Publish a strike against a message's author to the moderation event feed. Keyword arguments are added to the
+        event as-is.
+        """
+        HuskyEvents.publish(ModerationEvents.ANTISPAM_STRIKE, message.guild.id, filter=self.name,
+                            user_id=message.author.id, user=str(message.author), channel_id=message.channel.id,
+                            message_id=message.id, **details)
+
     async def base(self, ctx):
         pass
 
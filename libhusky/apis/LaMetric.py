@@ -1,25 +1,21 @@
-import aiohttp
+from libhusky.HuskyHTTPClient import PluginHttpClient
 
 APP_BASE = "https://developer.lametric.com/api/v1/dev/widget/update/com.lametric.{app_id}"
 
 
 class LaMetricApi:
-    def __init__(self, loop):
-        self.__async_loop__ = loop
+    def __init__(self, http_client: PluginHttpClient):
+        self._http_client = http_client
 
-        self._http_client = aiohttp.ClientSession(loop=loop)
-
-    def cleanup(self):
-        self.__async_loop__.create_task(self._http_client.close())
-
-    async def push(self, app_id: str, data: dict, access_token: str):
+    async def push(self, app_id: str, data: dict, access_token: str) -> int:
         headers = {
             "Accept": "application/json",
             "X-Access-Token": access_token,
             "Cache-Control": "no-cache"
         }
 
-        return await self._http_client.post(APP_BASE.format(app_id=app_id), json=data, headers=headers)
+        async with self._http_client.post(APP_BASE.format(app_id=app_id), json=data, headers=headers) as response:
+            return response.status
 
 
 def build_data(icon: str, text: str) -> dict:
@@ -0,0 +1,183 @@
+import array
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import sqlite3
+import time
+
+import discord
+
+from libhusky.HuskyStatics import *
+
+LOG = logging.getLogger("HuskyBot.Managers.ActivityRollupManager")
+
+HOURS_PER_WEEK = 7 * 24
+
+# 1970-01-01 (hour zero) was a Thursday. Adding this makes day zero a Monday.
+EPOCH_WEEKDAY_OFFSET = 3
+
+# What a rollup counts messages by.
+SCOPE_CHANNEL = "channel"
+SCOPE_USER = "user"
+
+
+def hour_of_snowflake(snowflake: int) -> int:
+    """
+    Get the hour (since the Unix epoch, UTC) a snowflake was created in.
+    """
+    return ((snowflake >> 22) // 1000 + DISCORD_EPOCH) // 3600
+
+
+def hour_of_week(hour: int) -> int:
+    """
+    Convert an absolute hour into an hour of the week, where 0 is Monday 00:00 UTC.
+    """
+    return ((hour // 24 + EPOCH_WEEKDAY_OFFSET) % 7) * 24 + hour % 24
+
+
+def current_hour() -> int:
+    return int(time.time() // 3600)
+
+
+class ActivityRollupManager:
+    """
+    Keeps hourly message counts per channel and per user for each guild, so activity analytics can be answered
+    without touching message history.
+
+    Counts are stored sparsely in SQLite, one row per (guild, channel or user, hour) that saw any messages, and kept
+    for `retention_days`. New messages are counted in memory and added to the database whenever flush() is called.
+    All database work runs on a single worker thread, so it never stalls the bot.
+    """
+
+    def __init__(self, path: str, retention_days: int = 180):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS activity (
+                guild_id INTEGER NOT NULL,
+                scope TEXT NOT NULL,
+                key INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (guild_id, scope, key, hour)
+            );
+            CREATE INDEX IF NOT EXISTS activity_by_hour ON activity (hour);
+        """)
+        self._db.commit()
+
+        self._retention_hours = retention_days * 24
+
+        # (guild_id, scope, key, hour) -> messages not yet written
+        self._pending = collections.Counter()
+        self._trimmed_hour = None
+
+        LOG.info("Manager load complete.")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def record(self, message: discord.Message):
+        hour = hour_of_snowflake(message.id)
+
+        self._pending[(message.guild.id, SCOPE_CHANNEL, message.channel.id, hour)] += 1
+        self._pending[(message.guild.id, SCOPE_USER, message.author.id, hour)] += 1
+
+    async def flush(self):
+        hour = current_hour()
+
+        # Old rows only need trimming once an hour.
+        oldest = None
+        if hour != self._trimmed_hour:
+            oldest = hour - self._retention_hours
+            self._trimmed_hour = hour
+
+        if not self._pending and oldest is None:
+            return
+
+        pending, self._pending = self._pending, collections.Counter()
+        await self._run(self._write, pending, oldest)
+
+    def _write(self, pending: dict, oldest: int = None):
+        if pending:
+            self._db.executemany("INSERT OR IGNORE INTO activity VALUES (?, ?, ?, ?, 0)", pending.keys())
+            self._db.executemany("UPDATE activity SET count = count + ? "
+                                 "WHERE guild_id = ? AND scope = ? AND key = ? AND hour = ?",
+                                 [(count, *row) for row, count in pending.items()])
+
+        if oldest is not None:
+            self._db.execute("DELETE FROM activity WHERE hour < ?", (oldest,))
+
+        self._db.commit()
+
+    async def rebuild(self, guild_id: int, channel_counts: list, user_counts: list):
+        """
+        Replace a guild's activity data with the given (key, hour, count) rows.
+        """
+        # Anything still pending for this guild is already part of the new counts.
+        for row in [row for row in self._pending if row[0] == guild_id]:
+            del self._pending[row]
+
+        rows = collections.Counter()
+        for (scope, counts) in ((SCOPE_CHANNEL, channel_counts), (SCOPE_USER, user_counts)):
+            for (key, hour, count) in counts:
+                rows[(guild_id, scope, key, hour)] += count
+
+        await self._run(self._replace_guild, guild_id, rows)
+
+    def _replace_guild(self, guild_id: int, rows: dict):
+        self._db.execute("DELETE FROM activity WHERE guild_id = ?", (guild_id,))
+        self._write(rows, current_hour() - self._retention_hours)
+
+    @staticmethod
+    def _key_clause(keys) -> str:
+        return "" if keys is None else f"AND key IN ({','.join('?' * len(keys))})"
+
+    async def totals(self, guild_id: int, scope: str, start: int, end: int, keys: list = None) -> dict:
+        """
+        Get total counts in [start, end) for every key (or only the given keys), skipping zeroes.
+        """
+        await self.flush()
+
+        return dict(await self._run(self._query, f"SELECT key, SUM(count) FROM activity "
+                                                 f"WHERE guild_id = ? AND scope = ? AND hour >= ? AND hour < ? "
+                                                 f"{self._key_clause(keys)} GROUP BY key",
+                                    (guild_id, scope, start, end, *(keys or []))))
+
+    async def weekly_heatmap(self, guild_id: int, scope: str, start: int, end: int,
+                             keys: list = None) -> array.array:
+        """
+        Fold counts in [start, end) into 168 hour-of-week buckets (Monday 00:00 UTC first), summed over keys.
+        """
+        await self.flush()
+
+        heatmap = array.array('Q', bytes(8 * HOURS_PER_WEEK))
+
+        for (hour, count) in await self._run(self._query, f"SELECT hour, SUM(count) FROM activity "
+                                                          f"WHERE guild_id = ? AND scope = ? AND hour >= ? "
+                                                          f"AND hour < ? {self._key_clause(keys)} GROUP BY hour",
+                                             (guild_id, scope, start, end, *(keys or []))):
+            heatmap[hour_of_week(hour)] += count
+
+        return heatmap
+
+    async def count_keys(self, guild_id: int) -> dict:
+        """
+        Get how many channels and users have activity data for a guild, keyed by scope.
+        """
+        await self.flush()
+
+        return dict(await self._run(self._query, "SELECT scope, COUNT(DISTINCT key) FROM activity "
+                                                 "WHERE guild_id = ? GROUP BY scope", (guild_id,)))
+
+    def _query(self, sql: str, params: tuple) -> list:
+        return self._db.execute(sql, params).fetchall()
+
+    def cleanup(self):
+        self._executor.shutdown(wait=True)
+
+        self._write(self._pending)
+        self._pending.clear()
+
+        self._db.close()
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+
+import discord
+
+from HuskyBot import HuskyBot
+from libhusky import HuskyEvents, HuskyUtils
+from libhusky.HuskyStatics import ModerationEvents
+
+LOG = logging.getLogger("HuskyBot.Managers.BanManager")
+
+
+class BanRecord:
+    """
+    A cached ban. `resolved` is False until the reason (and, where available, the responsible moderator) has been
+    confirmed from the ban list, the audit log, or a direct lookup.
+    """
+
+    def __init__(self, user: discord.User, reason: str = None, moderator: discord.User = None,
+                 resolved: bool = False):
+        self.user = user
+        self.reason = reason
+        self.moderator = moderator
+        self.resolved = resolved
+
+    def __repr__(self):
+        return f"<BanRecord user={self.user} reason={self.reason!r} moderator={self.moderator} " \
+               f"resolved={self.resolved}>"
+
+
+class BanManager(metaclass=HuskyUtils.Singleton):
+    """
+    The Ban Manager keeps an in-memory index of every guild's bans, so plugins don't need to page through
+    `guild.bans()` whenever they want to look one up.
+
+    The full ban list is fetched once per guild. After that the index is kept current from ban/unban events. Reasons
+    and responsible moderators for new bans come from the audit log, read incrementally from the last entry seen.
+
+    There is only ever one instance (constructing it again returns the existing one), and it lives for as long as the
+    bot does, so any plugin can share it.
+    """
+
+    def __init__(self, bot: HuskyBot):
+        self._bot = bot
+
+        # guild_id -> {user_id: BanRecord}
+        self.__cache__ = {}
+
+        # guild_id -> Task loading that guild's ban list. Shared by everyone waiting on the initial load.
+        self._load_tasks = {}
+
+        # guild_id -> {user_id: BanRecord, or None for an unban} for events that arrive while a load is running.
+        self._pending_events = {}
+
+        # guild_id -> ID of the newest audit log entry already applied. None if the audit log can't be read.
+        self._audit_cursors = {}
+        self._audit_locks = {}
+
+        self._bot.add_listener(self._on_member_ban, 'on_member_ban')
+        self._bot.add_listener(self._on_member_unban, 'on_member_unban')
+
+        self._bot.loop.create_task(self._preload())
+
+        LOG.info("Manager load complete.")
+
+    async def _preload(self):
+        await self._bot.wait_until_ready()
+
+        for guild in self._bot.guilds:
+            try:
+                await self.ensure_loaded(guild)
+            except discord.HTTPException as e:
+                LOG.warning(f"Could not load the ban list for {guild}: {e}")
+
+    async def ensure_loaded(self, guild: discord.Guild) -> dict:
+        """
+        Make sure a guild's ban list has been loaded, loading it if needed. Concurrent callers share one fetch.
+
+        :param guild: The guild to load bans for.
+        :return: The guild's ban index (user_id -> BanRecord).
+        """
+        if guild.id in self.__cache__:
+            return self.__cache__[guild.id]
+
+        task = self._load_tasks.get(guild.id)
+        if task is None:
+            task = self._load_tasks[guild.id] = self._bot.loop.create_task(self._load_guild(guild))
+
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._load_tasks.pop(guild.id, None)
+
+    async def _load_guild(self, guild: discord.Guild) -> dict:
+        # Start the audit cursor *before* fetching bans, so anything that happens mid-fetch is picked up by the next
+        # poll rather than missed.
+        cursor = None
+        try:
+            async for entry in guild.audit_logs(limit=1):
+                cursor = entry.id
+        except discord.Forbidden:
+            LOG.warning(f"Missing permission to read the audit log in {guild}. Ban reasons for new bans will be "
+                        f"fetched individually.")
+            self._audit_cursors[guild.id] = None
+        else:
+            self._audit_cursors[guild.id] = cursor or 0
+
+        self._pending_events[guild.id] = {}
+
+        try:
+            bans = {}
+            for entry in await guild.bans():
+                bans[entry.user.id] = BanRecord(entry.user, entry.reason, resolved=True)
+        finally:
+            pending = self._pending_events.pop(guild.id)
+
+        # Fold in anything that happened while the list was being fetched.
+        for user_id, record in pending.items():
+            if record is None:
+                bans.pop(user_id, None)
+            else:
+                bans.setdefault(user_id, record)
+
+        self.__cache__[guild.id] = bans
+
+        LOG.info(f"Loaded {len(bans)} bans for guild {guild}.")
+
+        return bans
+
+    async def _on_member_ban(self, guild: discord.Guild, user: discord.User):
+        HuskyEvents.publish(ModerationEvents.BAN, guild.id, user_id=user.id, user=str(user))
+
+        pending = self._pending_events.get(guild.id)
+        if pending is not None:
+            pending[user.id] = BanRecord(user)
+            return
+
+        index = self.__cache__.get(guild.id)
+
+        # Not loaded yet; the load will see this ban anyway.
+        if index is None:
+            return
+
+        # Don't clobber a record that was already filled in by whoever issued the ban.
+        if index.get(user.id) is None:
+            index[user.id] = BanRecord(user)
+
+    async def _on_member_unban(self, guild: discord.Guild, user: discord.User):
+        HuskyEvents.publish(ModerationEvents.UNBAN, guild.id, user_id=user.id, user=str(user))
+
+        pending = self._pending_events.get(guild.id)
+        if pending is not None:
+            # Leave a tombstone so the list being fetched doesn't resurrect this ban.
+            pending[user.id] = None
+            return
+
+        self.__cache__.get(guild.id, {}).pop(user.id, None)
+
+    def record_ban(self, guild: discord.Guild, user: discord.User, reason: str, moderator: discord.User = None):
+        """
+        Record a ban issued by the bot, so its reason is known without asking Discord.
+        """
+        index = self.__cache__.get(guild.id)
+
+        if index is not None:
+            index[user.id] = BanRecord(user, reason, moderator, resolved=True)
+
+    async def is_banned(self, guild: discord.Guild, user: discord.abc.Snowflake) -> bool:
+        index = await self.ensure_loaded(guild)
+
+        return index.get(user.id) is not None
+
+    async def get_ban(self, guild: discord.Guild, user: discord.abc.Snowflake):
+        """
+        Get the ban record for a user, resolving its reason if we don't know it yet.
+
+        :param guild: The guild to check.
+        :param user: The user to look up.
+        :return: A BanRecord, or None if the user isn't banned.
+        """
+        index = await self.ensure_loaded(guild)
+        record = index.get(user.id)
+
+        if record is not None and not record.resolved:
+            await self.poll_audit_log(guild)
+
+        if record is None or not record.resolved:
+            # The audit log can lag behind the gateway (or be unreadable), so fall back to asking for this one ban.
+            try:
+                entry = await guild.fetch_ban(user)
+            except discord.NotFound:
+                index.pop(user.id, None)
+                return None
+
+            moderator = record.moderator if record is not None else None
+            record = index[user.id] = BanRecord(entry.user, entry.reason, moderator, resolved=True)
+
+        return record
+
+    async def poll_audit_log(self, guild: discord.Guild):
+        """
+        Apply any ban audit log entries newer than the last one we saw. Concurrent callers share one poll.
+        """
+        lock = self._audit_locks.setdefault(guild.id, asyncio.Lock())
+
+        if lock.locked():
+            # Someone else is already polling; their results are as fresh as ours would be.
+            async with lock:
+                return
+
+        async with lock:
+            cursor = self._audit_cursors.get(guild.id)
+
+            if cursor is None:
+                return
+
+            index = self.__cache__.get(guild.id, {})
+
+            try:
+                async for entry in guild.audit_logs(limit=None, after=discord.Object(id=cursor),
+                                                    action=discord.AuditLogAction.ban, oldest_first=True):
+                    cursor = max(cursor, entry.id)
+
+                    record = index.get(entry.target.id)
+                    if record is not None and not record.resolved:
+                        record.reason = entry.reason
+                        record.moderator = entry.user
+                        record.resolved = True
+            except discord.Forbidden:
+                LOG.warning(f"Lost permission to read the audit log in {guild}.")
+                cursor = None
+            finally:
+                self._audit_cursors[guild.id] = cursor
@@ -0,0 +1,167 @@
+import asyncio
+import datetime
+import logging
+import re
+import time
+
+import discord
+
+LOG = logging.getLogger("HuskyBot.Managers.CleanupManager")
+
+# Discord's bulk delete endpoint takes at most this many messages...
+BULK_DELETE_SIZE = 100
+
+# ...and rejects anything older than 14 days. Leave some slack for messages that age out while a job runs.
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=10)
+
+# Messages too old to bulk delete are removed one at a time, no faster than this.
+SINGLE_DELETE_INTERVAL = 1.0
+
+# Old messages waiting to be deleted one at a time. Streaming pauses while the queue is full.
+SINGLE_DELETE_QUEUE_SIZE = 500
+
+
+class CleanupFilter:
+    """
+    A compiled set of cleanup filters. Within a filter type any entry may match; every type in use must match.
+    """
+
+    def __init__(self, user_ids=None, patterns=None):
+        self.user_ids = frozenset(user_ids or ())
+        self.regexes = [re.compile(p) for p in (patterns or ())]
+
+    def __bool__(self):
+        return bool(self.user_ids or self.regexes)
+
+    def __call__(self, message: discord.Message) -> bool:
+        if self.user_ids and message.author.id not in self.user_ids:
+            return False
+
+        for regex in self.regexes:
+            if regex.search(message.content) is None:
+                return False
+
+        return True
+
+
+class CleanupJob:
+    """
+    Deletes matching messages from the last `lookback` messages of a channel.
+
+    History is streamed rather than collected up front. Matching messages young enough to be bulk deleted are sent in
+    batches of 100 as soon as each batch fills, with the next batch collected while the last one is being deleted.
+    Older messages go through a separate, rate-limited lane that deletes them one at a time.
+    """
+
+    def __init__(self, channel: discord.TextChannel, lookback: int, check: CleanupFilter = None):
+        self.channel = channel
+        self.lookback = lookback
+        self.check = check
+
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+        self.queued_old = 0
+
+        self._old_queue = asyncio.Queue(maxsize=SINGLE_DELETE_QUEUE_SIZE)
+
+    async def run(self, progress_callback=None, progress_interval: float = 5):
+        """
+        Run the cleanup to completion.
+
+        :param progress_callback: An optional coroutine function, called with this job at most every
+                                  `progress_interval` seconds.
+        :param progress_interval: The minimum number of seconds between progress callbacks.
+        """
+        cutoff = datetime.datetime.utcnow() - BULK_DELETE_MAX_AGE
+        old_worker = asyncio.ensure_future(self._delete_old_messages())
+
+        batch = []
+        bulk_task = None
+        last_progress = time.monotonic()
+
+        try:
+            async for message in self.channel.history(limit=self.lookback):
+                self.scanned += 1
+
+                if self.check is not None and not self.check(message):
+                    continue
+
+                if message.created_at < cutoff:
+                    # History is newest-first, so nothing after this can be bulk deleted. Send what's left of the
+                    # young messages now, before waiting on the old lane lets them age past the bulk delete limit.
+                    if batch:
+                        if bulk_task is not None:
+                            await bulk_task
+
+                        bulk_task = asyncio.ensure_future(self._bulk_delete(batch))
+                        batch = []
+
+                    self.queued_old += 1
+                    await self._old_queue.put(message)
+                else:
+                    batch.append(message)
+
+                if len(batch) >= BULK_DELETE_SIZE:
+                    if bulk_task is not None:
+                        await bulk_task
+
+                    bulk_task = asyncio.ensure_future(self._bulk_delete(batch))
+                    batch = []
+
+                if progress_callback is not None and time.monotonic() - last_progress >= progress_interval:
+                    last_progress = time.monotonic()
+                    await progress_callback(self)
+
+            if bulk_task is not None:
+                await bulk_task
+
+            if batch:
+                await self._bulk_delete(batch)
+
+            await self._old_queue.put(None)
+            await old_worker
+        finally:
+            old_worker.cancel()
+
+            if bulk_task is not None:
+                bulk_task.cancel()
+
+    async def _bulk_delete(self, messages: list):
+        try:
+            await self.channel.delete_messages(messages)
+            self.deleted += len(messages)
+        except discord.NotFound:
+            # Something in the batch was already gone, so Discord rejected the whole batch. Retry individually.
+            for message in messages:
+                await self._delete_one(message)
+        except discord.HTTPException as e:
+            # Most likely some of the batch aged past the bulk delete limit. Fall back to the old lane.
+            LOG.warning(f"Bulk delete of {len(messages)} messages in #{self.channel} failed, deleting them one at a "
+                        f"time instead: {e}")
+
+            for message in messages:
+                self.queued_old += 1
+                await self._old_queue.put(message)
+
+    async def _delete_old_messages(self):
+        while True:
+            message = await self._old_queue.get()
+
+            if message is None:
+                return
+
+            started = time.monotonic()
+            await self._delete_one(message)
+
+            await asyncio.sleep(max(0.0, SINGLE_DELETE_INTERVAL - (time.monotonic() - started)))
+
+    async def _delete_one(self, message: discord.Message):
+        try:
+            await message.delete()
+            self.deleted += 1
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            LOG.warning(f"Could not delete message {message.id} in #{self.channel}: {e}")
+            self.failed += 1
@@ -9,8 +9,19 @@ from discord.ext import commands
 from HuskyBot import HuskyBot
 from libhusky import HuskyConfig, HuskyData, HuskyUtils
 from libhusky.HuskyStatics import *
+from libhusky.managers.MessageFetchManager import MessageFetchManager
 
 GIVEAWAY_CONFIG_KEY = 'giveaways'
+ENTRANTS_CONFIG_KEY = 'entrants'
+
+# Entrant changes are written to disk at most this often (in seconds), so busy giveaways don't rewrite the file on
+# every reaction.
+ENTRANTS_FLUSH_DELAY = 15
+
+# Longest the scheduler will sleep in one go, and how long to back off after a giveaway fails to finish.
+MAX_SLEEP_SECONDS = 3600
+RETRY_DELAY_SECONDS = 30
+
 LOG = logging.getLogger("HuskyBot.Managers.GiveawayManager")
 
 
@@ -29,8 +40,10 @@ class GiveawayManager:
         """
 
         self.bot = bot
+        self._message_fetcher = MessageFetchManager(bot)
         self._config = bot.config
         self._giveaway_config = HuskyConfig.get_config('giveaways', create_if_nonexistent=True)
+        self._entrant_config = HuskyConfig.get_config('giveawayEntrants', create_if_nonexistent=True)
 
         # Random number generator
         self._rng = random.SystemRandom()
@@ -39,6 +52,19 @@ class GiveawayManager:
         # *generally* a bad idea.
         self.__cache__ = []
 
+        # Entrant user IDs for each giveaway, keyed by registration message ID. These are kept up to date from
+        # reaction events, so ending a giveaway doesn't need to page through every reaction.
+        self._entrants = {}
+
+        # Giveaways whose entrant sets may have missed reactions (e.g. while the bot was offline), along with any
+        # reaction changes seen while a reconciliation is in progress. Entrants only matter once a giveaway ends, so
+        # flagged giveaways are reconciled then, and only once, no matter how often the bot reconnects.
+        self._needs_reconcile = set()
+        self._reconcile_changes = {}
+
+        self._flush_handle = None
+        self._rearm_event = asyncio.Event()
+
         self.load_giveaways_from_file()
 
         self.__task__ = self.bot.loop.create_task(self.process_giveaways())
@@ -52,35 +78,168 @@ class GiveawayManager:
         """
         giveaway_list = self._giveaway_config.get(GIVEAWAY_CONFIG_KEY, [])
 
+        saved_entrants = self._entrant_config.get(ENTRANTS_CONFIG_KEY, {})
+
         for giveaway_raw in giveaway_list:
             giveaway = HuskyData.GiveawayObject(data=giveaway_raw)
 
             self.__cache__.append(giveaway)
 
+            message_id = giveaway.register_message_id
+            self._entrants[message_id] = set(saved_entrants.get(str(message_id), []))
+
+            # We can't know what happened while we were offline, so every loaded giveaway gets checked when it ends.
+            self._needs_reconcile.add(message_id)
+
+        self.__cache__.sort(key=lambda g: g.end_time if g.end_time else float('inf'))
+
+    def _save_entrants(self) -> None:
+        """
+        Write all entrant sets to disk immediately.
+        :return: Doesn't return.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        self._entrant_config.set(ENTRANTS_CONFIG_KEY, {str(k): sorted(v) for k, v in self._entrants.items()})
+
+    def _schedule_entrant_save(self) -> None:
+        """
+        Write entrant sets to disk soon, coalescing any other changes made in the meantime.
+        :return: Doesn't return.
+        """
+        if self._flush_handle is None:
+            self._flush_handle = self.bot.loop.call_later(ENTRANTS_FLUSH_DELAY, self._save_entrants)
+
+    def _forget_giveaway(self, giveaway: HuskyData.GiveawayObject) -> None:
+        """
+        Drop a giveaway from the cache and entrant tracking, and save both.
+        :param giveaway: The giveaway to drop.
+        :return: Doesn't return.
+        """
+        if giveaway in self.__cache__:
+            self.__cache__.remove(giveaway)
+
+        self._entrants.pop(giveaway.register_message_id, None)
+        self._needs_reconcile.discard(giveaway.register_message_id)
+
+        self._giveaway_config.set(GIVEAWAY_CONFIG_KEY, self.__cache__)
+        self._save_entrants()
+
+    def update_entrant(self, payload: discord.RawReactionActionEvent, entered: bool) -> None:
+        """
+        Apply a raw reaction add/remove event to the matching giveaway's entrant set.
+
+        :param payload: The raw reaction event from Discord.
+        :param entered: True if the reaction was added, False if it was removed.
+        :return: Doesn't return.
+        """
+        entrants = self._entrants.get(payload.message_id)
+
+        if entrants is None or str(payload.emoji) != Emojis.GIVEAWAY:
+            return
+
+        if self.bot.user is not None and payload.user_id == self.bot.user.id:
+            return
+
+        if entered:
+            entrants.add(payload.user_id)
+        else:
+            entrants.discard(payload.user_id)
+
+        # Remember changes that land mid-reconciliation, so the API snapshot doesn't overwrite them.
+        changes = self._reconcile_changes.get(payload.message_id)
+        if changes is not None:
+            changes[payload.user_id] = entered
+
+        self._schedule_entrant_save()
+
+    def mark_all_for_reconcile(self) -> None:
+        """
+        Flag every running giveaway as possibly having missed reactions (for example, after the gateway session was
+        re-established). Flagged giveaways are checked against Discord once, when they finish.
+        :return: Doesn't return.
+        """
+        self._needs_reconcile.update(g.register_message_id for g in self.__cache__)
+
+    async def reconcile_entrants(self, giveaway: HuskyData.GiveawayObject, message: discord.Message) -> None:
+        """
+        Rebuild a giveaway's entrant set from the API.
+
+        This pages through every giveaway reaction, so it should only be used when events may have been missed.
+
+        :param giveaway: The giveaway to reconcile.
+        :param message: The giveaway's registration message.
+        :return: Doesn't return.
+        """
+        message_id = giveaway.register_message_id
+        self._needs_reconcile.discard(message_id)
+        self._reconcile_changes[message_id] = changes = {}
+
+        fetched = set()
+
+        try:
+            for reaction in message.reactions:
+                if str(reaction.emoji) != Emojis.GIVEAWAY:
+                    continue
+
+                async for user in reaction.users():
+                    fetched.add(user.id)
+        except Exception:
+            self._needs_reconcile.add(message_id)
+            raise
+        finally:
+            self._reconcile_changes.pop(message_id, None)
+
+        if self.bot.user is not None:
+            fetched.discard(self.bot.user.id)
+
+        for user_id, entered in changes.items():
+            if entered:
+                fetched.add(user_id)
+            else:
+                fetched.discard(user_id)
+
+        if message_id in self._entrants:
+            LOG.info(f"Reconciled giveaway {giveaway.name}: {len(self._entrants[message_id])} tracked entrants, "
+                     f"{len(fetched)} on Discord.")
+            self._entrants[message_id] = fetched
+            self._schedule_entrant_save()
+
     async def process_giveaways(self) -> None:
         """
         Process all pending giveaways.
 
-        Iterate through the cache looking for any expired giveaway. This method will run about once every 0.5 seconds
-        as part of the bot's event loop. As a result, care must be taken to make sure this code exits quickly if nothing
-        needs to be done.
+        Sleep until the earliest giveaway in the (time-ordered) cache is due, end it, and repeat. Starting a giveaway
+        that ends sooner than the current one wakes this loop early.
         :return: Doesn't return.
         """
 
         while not self.bot.is_closed():
-            # This is what peak performance looks like, kids.
-            for giveaway in self.__cache__:
+            timeout = None
+
+            if self.__cache__:
+                giveaway = self.__cache__[0]
+
                 if giveaway.is_over():
                     LOG.info(f"Found a scheduled giveaway for {giveaway.name} ending. Triggering...")
-                    await self.finish_giveaway(giveaway)
 
-                # Because giveaways are sorted by finish date, if we encounter a giveaway that *isn't* over, we can
-                # assume there's nothing more to do, so we can exit the for loop entirely.
+                    try:
+                        await self.finish_giveaway(giveaway)
+                        continue
+                    except Exception as e:
+                        LOG.exception(f"Failed to finish giveaway {giveaway.name}, retrying shortly: {e}")
+                        timeout = RETRY_DELAY_SECONDS
                 else:
-                    break
+                    timeout = min(giveaway.end_time - datetime.datetime.utcnow().timestamp(), MAX_SLEEP_SECONDS)
 
-            # Check again every half second
-            await asyncio.sleep(0.5)
+            self._rearm_event.clear()
+
+            try:
+                await asyncio.wait_for(self._rearm_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
 
     async def finish_giveaway(self, giveaway: HuskyData.GiveawayObject) -> None:
         """
@@ -97,43 +256,35 @@ class GiveawayManager:
 
         try:
             channel: discord.TextChannel = self.bot.get_channel(giveaway.register_channel_id)
-            message: discord.Message = await channel.fetch_message(giveaway.register_message_id)
+            message: discord.Message = await self._message_fetcher.fetch_message(channel, giveaway.register_message_id)
         except discord.NotFound:
             LOG.error("An expected giveaway channel or message was deleted. The giveaway can not continue, as the "
                       "associated records are gone or no longer accessible to the bot. The giveaway will be deleted "
                       "from the cache.")
 
-            if giveaway in self.__cache__:
-                self.__cache__.remove(giveaway)
-            self._giveaway_config.set(GIVEAWAY_CONFIG_KEY, self.__cache__)
+            self._forget_giveaway(giveaway)
             return
 
-        contending_users = []
-
-        for reaction in message.reactions:
-            if reaction.emoji != Emojis.GIVEAWAY:
-                continue
+        # Only go to the API for entrants if we might have missed reactions.
+        if giveaway.register_message_id in self._needs_reconcile \
+                or giveaway.register_message_id not in self._entrants:
+            self._entrants.setdefault(giveaway.register_message_id, set())
+            await self.reconcile_entrants(giveaway, message)
 
-            contending_users += await reaction.users().flatten()
+        contending_users = list(self._entrants[giveaway.register_message_id])
 
         LOG.info(f"{len(contending_users)} users joined the giveaway {giveaway.name}")
 
-        # Remove the bot
-        try:
-            contending_users.remove(self.bot.user)
-        except ValueError as _:
-            pass
-
         winning_users = self._rng.sample(contending_users, min(giveaway.winner_count, len(contending_users)))
         LOG.info(f"Winners for \"{giveaway.name}\": {winning_users}")
 
         if len(winning_users) == 1:
-            win_text = f"{f'Congratulations to our winner, {winning_users[0].mention}!'}{wcl}"
+            win_text = f"{f'Congratulations to our winner, <@{winning_users[0]}>!'}{wcl}"
         elif len(winning_users) == 2:
-            mc = f'Congratulations to our winners, {winning_users[0].mention} and {winning_users[1].mention}!'
+            mc = f'Congratulations to our winners, <@{winning_users[0]}> and <@{winning_users[1]}>!'
             win_text = f"{mc}{wcl}"
         elif len(winning_users) > 2:
-            win_csb = [u.mention for u in winning_users]
+            win_csb = [f"<@{u}>" for u in winning_users]
 
             win_text = f"Congratulations to our winners: {', '.join(win_csb[:-1])}, and {win_csb[-1:][0]}! {wcl}"
         else:
@@ -148,10 +299,7 @@ class GiveawayManager:
         await message.delete()
         await channel.send(embed=embed)
 
-        if giveaway in self.__cache__:
-            self.__cache__.remove(giveaway)
-
-        self._giveaway_config.set(GIVEAWAY_CONFIG_KEY, self.__cache__)
+        self._forget_giveaway(giveaway)
 
     async def start_giveaway(self, ctx: commands.Context, title: str, end_time: datetime.datetime,
                              winners: int) -> HuskyData.GiveawayObject:
@@ -184,7 +332,17 @@ class GiveawayManager:
         )
 
         message = await ctx.send(embed=giveaway_embed)
-        await message.add_reaction(Emojis.GIVEAWAY)
+
+        # Start tracking entrants before anything else is awaited, so reactions that land immediately aren't dropped.
+        self._entrants[message.id] = set()
+        self._save_entrants()
+
+        try:
+            await message.add_reaction(Emojis.GIVEAWAY)
+        except discord.DiscordException:
+            self._entrants.pop(message.id, None)
+            self._save_entrants()
+            raise
 
         giveaway = HuskyData.GiveawayObject()
         giveaway.name = title
@@ -198,9 +356,13 @@ class GiveawayManager:
         # note, we insert the giveaway, and sort. this is a rare operation, so a sort is "acceptable"
         # Null-ending giveaways (usually impossible) will be placed at the very end.
         self.__cache__.insert(pos, giveaway)
-        self.__cache__.sort(key=lambda g: g.end_time if g.end_time else 10 * 100)
+        self.__cache__.sort(key=lambda g: g.end_time if g.end_time else float('inf'))
         self._giveaway_config.set(GIVEAWAY_CONFIG_KEY, self.__cache__)
 
+        # Wake the scheduler if this is now the next giveaway to end.
+        if self.__cache__[0] is giveaway:
+            self._rearm_event.set()
+
         return giveaway
 
     def get_giveaways(self):
@@ -229,9 +391,11 @@ class GiveawayManager:
         :param giveaway: The GiveawayObject to terminate.
         """
 
-        self.__cache__.remove(giveaway)
-        self._giveaway_config.set(GIVEAWAY_CONFIG_KEY, self.__cache__)
+        self._forget_giveaway(giveaway)
 
     def cleanup(self):
         if self.__task__ is not None:
             self.__task__.cancel()
+
+        if self._flush_handle is not None:
+            self._save_entrants()
@@ -0,0 +1,171 @@
+import logging
+
+import discord
+
+from HuskyBot import HuskyBot
+from libhusky import HuskyUtils
+from libhusky.managers.MemberUpdateManager import MemberChange, MemberDiff, MemberUpdateManager
+
+LOG = logging.getLogger("HuskyBot.Managers.MemberStatsManager")
+
+
+def _bump(counts: dict, key, amount: int):
+    value = counts.get(key, 0) + amount
+
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+class MemberCounters:
+    """
+    Running member counts for a single guild.
+    """
+
+    __slots__ = ('total', 'bots', 'statuses', 'roles')
+
+    def __init__(self):
+        self.total = 0
+        self.bots = 0
+
+        # status name -> member count. Missing statuses have no members.
+        self.statuses = {}
+
+        # role_id -> member count. The default (@everyone) role isn't tracked; that's `total`.
+        self.roles = {}
+
+    @property
+    def humans(self) -> int:
+        return self.total - self.bots
+
+    def get_status(self, status) -> int:
+        return self.statuses.get(str(status), 0)
+
+    def get_role(self, role: discord.abc.Snowflake) -> int:
+        return self.roles.get(role.id, 0)
+
+    def add(self, member: discord.Member, amount: int = 1):
+        self.total += amount
+
+        if member.bot:
+            self.bots += amount
+
+        _bump(self.statuses, str(member.status), amount)
+
+        for role in member.roles:
+            if not role.is_default():
+                _bump(self.roles, role.id, amount)
+
+    def to_data(self) -> dict:
+        return {
+            "total": self.total,
+            "humans": self.humans,
+            "bots": self.bots,
+            "statuses": dict(self.statuses),
+            "roles": {str(k): v for k, v in self.roles.items()}
+        }
+
+
+class MemberStatsManager(metaclass=HuskyUtils.Singleton):
+    """
+    The Member Stats Manager keeps per-guild member counts (by status, bot/human and role) current from gateway
+    events, so nothing needs to walk `guild.members` to report them.
+
+    Counters are built once per guild when the bot becomes ready (or joins a guild) and are then adjusted
+    incrementally from join, leave and update events.
+
+    There is only ever one instance (constructing it again returns the existing one), and it lives for as long as the
+    bot does, so any plugin can share it.
+    """
+
+    def __init__(self, bot: HuskyBot):
+        self._bot = bot
+
+        # guild_id -> MemberCounters
+        self.__cache__ = {}
+
+        self._bot.add_listener(self._on_ready, 'on_ready')
+        self._bot.add_listener(self._on_guild_join, 'on_guild_join')
+        self._bot.add_listener(self._on_guild_remove, 'on_guild_remove')
+        self._bot.add_listener(self._on_member_join, 'on_member_join')
+        self._bot.add_listener(self._on_member_remove, 'on_member_remove')
+        MemberUpdateManager(bot).subscribe(MemberChange.STATUS | MemberChange.ROLES, self._on_member_update)
+        self._bot.add_listener(self._on_guild_role_delete, 'on_guild_role_delete')
+
+        if self._bot.is_ready():
+            self.rebuild()
+
+        LOG.info("Manager load complete.")
+
+    def rebuild(self, guild: discord.Guild = None):
+        """
+        Recount members from the member cache, for one guild or (by default) every guild.
+        """
+        for g in ([guild] if guild is not None else self._bot.guilds):
+            counters = MemberCounters()
+
+            for member in g.members:
+                counters.add(member)
+
+            self.__cache__[g.id] = counters
+
+        LOG.debug(f"Rebuilt member counters for {len(self.__cache__)} guilds.")
+
+    def get_counters(self, guild: discord.Guild) -> MemberCounters:
+        counters = self.__cache__.get(guild.id)
+
+        if counters is None:
+            self.rebuild(guild)
+            counters = self.__cache__[guild.id]
+
+        return counters
+
+    async def _on_ready(self):
+        # Reconnects can replace the member cache wholesale, so start over.
+        self.__cache__.clear()
+        self.rebuild()
+
+    async def _on_guild_join(self, guild: discord.Guild):
+        self.rebuild(guild)
+
+    async def _on_guild_remove(self, guild: discord.Guild):
+        self.__cache__.pop(guild.id, None)
+
+    async def _on_member_join(self, member: discord.Member):
+        counters = self.__cache__.get(member.guild.id)
+
+        if counters is not None:
+            counters.add(member)
+
+    async def _on_member_remove(self, member: discord.Member):
+        counters = self.__cache__.get(member.guild.id)
+
+        if counters is not None:
+            counters.add(member, -1)
+
+    async def _on_member_update(self, diff: MemberDiff):
+        counters = self.__cache__.get(diff.after.guild.id)
+
+        if counters is None:
+            return
+
+        if diff.changes & MemberChange.STATUS:
+            _bump(counters.statuses, str(diff.before.status), -1)
+            _bump(counters.statuses, str(diff.after.status), 1)
+
+        # The default role never changes hands, so it's never in either set.
+        for role in diff.roles_removed:
+            _bump(counters.roles, role.id, -1)
+
+        for role in diff.roles_added:
+            _bump(counters.roles, role.id, 1)
+
+    async def _on_guild_role_delete(self, role: discord.Role):
+        counters = self.__cache__.get(role.guild.id)
+
+        if counters is not None:
+            counters.roles.pop(role.id, None)
+
+    def get_stats(self) -> dict:
+        return {str(guild_id): counters.to_data() for guild_id, counters in self.__cache__.items()}
@@ -0,0 +1,138 @@
+import enum
+import logging
+
+import discord
+
+from HuskyBot import HuskyBot
+from libhusky import HuskyUtils
+
+LOG = logging.getLogger("HuskyBot.Managers.MemberUpdateManager")
+
+
+class MemberChange(enum.IntFlag):
+    """
+    The kinds of change a member update can carry. Subscribers ask for any combination of these.
+    """
+    STATUS = enum.auto()
+    ACTIVITY = enum.auto()
+    ROLES = enum.auto()
+    NICK = enum.auto()
+    NAME = enum.auto()
+
+
+class MemberDiff:
+    """
+    The differences between two versions of a member, computed once per update and shared by every subscriber.
+    """
+
+    __slots__ = ('before', 'after', 'changes', 'roles_added', 'roles_removed')
+
+    def __init__(self, before: discord.Member, after: discord.Member):
+        self.before = before
+        self.after = after
+
+        changes = MemberChange(0)
+
+        if before.status != after.status:
+            changes |= MemberChange.STATUS
+
+        if before.activities != after.activities:
+            changes |= MemberChange.ACTIVITY
+
+        if before.nick != after.nick:
+            changes |= MemberChange.NICK
+
+        if before.name != after.name or before.discriminator != after.discriminator:
+            changes |= MemberChange.NAME
+
+        before_roles = before.roles
+        after_roles = after.roles
+
+        if before_roles != after_roles:
+            changes |= MemberChange.ROLES
+
+            self.roles_added = frozenset(after_roles).difference(before_roles)
+            self.roles_removed = frozenset(before_roles).difference(after_roles)
+        else:
+            self.roles_added = self.roles_removed = frozenset()
+
+        self.changes = changes
+
+    def __repr__(self):
+        return f"<MemberDiff member={self.after} changes={self.changes!r}>"
+
+
+class MemberUpdateManager(metaclass=HuskyUtils.Singleton):
+    """
+    The Member Update Manager turns discord.py's `on_member_update` into a single diff per update, and only calls the
+    subscribers that care about what changed.
+
+    Most member updates are presence changes (status and activity), which nearly nothing needs. Handlers that only
+    care about roles or names subscribe to those, and are never scheduled for presence updates at all.
+
+    There is only ever one instance (constructing it again returns the existing one), and it lives for as long as the
+    bot does, so any plugin can share it. Plugins must call unload_plugin() when they're unloaded.
+    """
+
+    def __init__(self, bot: HuskyBot):
+        self._bot = bot
+
+        # [(MemberChange, coroutine function taking a MemberDiff)]
+        self._subscribers = []
+        self._wanted = MemberChange(0)
+
+        self._stats = {"updates": 0, "dispatched": 0, "skipped": 0}
+
+        self._bot.add_listener(self._on_member_update, 'on_member_update')
+
+        LOG.info("Manager load complete.")
+
+    def subscribe(self, changes: MemberChange, callback):
+        """
+        Call `callback(diff)` for every member update that includes any of `changes`.
+        """
+        self._subscribers.append((changes, callback))
+        self._wanted |= changes
+
+    def unsubscribe(self, callback):
+        self._subscribers = [s for s in self._subscribers if s[1] != callback]
+        self._rebuild_wanted()
+
+    def unload_plugin(self, instance):
+        """
+        Remove every subscription whose callback is a method of `instance`.
+        """
+        self._subscribers = [s for s in self._subscribers if getattr(s[1], '__self__', None) is not instance]
+        self._rebuild_wanted()
+
+    def _rebuild_wanted(self):
+        wanted = MemberChange(0)
+
+        for changes, _ in self._subscribers:
+            wanted |= changes
+
+        self._wanted = wanted
+
+    async def _on_member_update(self, before: discord.Member, after: discord.Member):
+        self._stats['updates'] += 1
+
+        diff = MemberDiff(before, after)
+
+        # Most updates are presence changes that nobody subscribed to.
+        if not diff.changes & self._wanted:
+            self._stats['skipped'] += 1
+            return
+
+        for changes, callback in self._subscribers:
+            if changes & diff.changes:
+                self._stats['dispatched'] += 1
+                self._bot.loop.create_task(self._run_callback(callback, diff))
+
+    async def _run_callback(self, callback, diff: MemberDiff):
+        try:
+            await callback(diff)
+        except Exception:
+            LOG.exception(f"Member update handler {callback.__qualname__} failed for {diff}")
+
+    def get_stats(self) -> dict:
+        return dict(self._stats)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+from HuskyBot import HuskyBot
+from libhusky import HuskyUtils
+
+LOG = logging.getLogger("HuskyBot.Managers.MessageFetchManager")
+
+# How long (in seconds) a fetched message is reused for.
+MESSAGE_CACHE_TTL = 5
+
+# Expired entries are swept out once the cache grows past this many messages.
+MESSAGE_CACHE_SWEEP_SIZE = 500
+
+
+class MessageFetchManager(metaclass=HuskyUtils.Singleton):
+    """
+    The Message Fetch Manager is a shared front for `channel.fetch_message`. Concurrent requests for the same message
+    share one API call, and a fetched message is reused for a few seconds.
+
+    Cached copies are dropped whenever the message is edited, deleted, or has its reactions changed, so callers never
+    see a copy older than the event they're handling. Several plugins reacting to the same event still share a single
+    fetch.
+
+    There is only ever one instance (constructing it again returns the existing one), and it lives for as long as the
+    bot does, so any plugin can share it.
+    """
+
+    def __init__(self, bot: HuskyBot):
+        self._bot = bot
+
+        # message_id -> (fetched_at, Future resolving to the message). fetched_at is None while the fetch is running.
+        self.__cache__ = {}
+
+        self._stats = {"requests": 0, "hits": 0, "joined": 0, "fetches": 0}
+
+        for event in ['on_raw_message_edit', 'on_raw_message_delete', 'on_raw_reaction_add', 'on_raw_reaction_remove',
+                      'on_raw_reaction_clear', 'on_raw_reaction_clear_emoji']:
+            self._bot.add_listener(self._on_message_changed, event)
+
+        self._bot.add_listener(self._on_bulk_message_delete, 'on_raw_bulk_message_delete')
+
+        LOG.info("Manager load complete.")
+
+    async def fetch_message(self, channel: discord.abc.Messageable, message_id: int) -> discord.Message:
+        """
+        Fetch a message, reusing a recent or in-flight fetch of the same message where possible.
+
+        This raises the same exceptions as `channel.fetch_message`.
+        """
+        self._stats['requests'] += 1
+
+        entry = self.__cache__.get(message_id)
+
+        if entry is not None:
+            fetched_at, future = entry
+
+            if fetched_at is None:
+                self._stats['joined'] += 1
+                return await asyncio.shield(future)
+
+            if time.monotonic() - fetched_at < MESSAGE_CACHE_TTL:
+                self._stats['hits'] += 1
+                return future.result()
+
+        if len(self.__cache__) >= MESSAGE_CACHE_SWEEP_SIZE:
+            self._sweep()
+
+        self._stats['fetches'] += 1
+
+        future = self._bot.loop.create_future()
+        self.__cache__[message_id] = (None, future)
+
+        try:
+            message = await channel.fetch_message(message_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            self._forget(message_id, future)
+            raise
+        except Exception as e:
+            # Failures aren't cached, but anyone already waiting on this fetch gets the same error.
+            future.set_exception(e)
+            future.exception()
+            self._forget(message_id, future)
+            raise
+
+        future.set_result(message)
+
+        # Only cache the result if nothing invalidated it while the fetch was running.
+        if self.__cache__.get(message_id, (None, None))[1] is future:
+            self.__cache__[message_id] = (time.monotonic(), future)
+
+        return message
+
+    def _forget(self, message_id: int, future: asyncio.Future):
+        if self.__cache__.get(message_id, (None, None))[1] is future:
+            del self.__cache__[message_id]
+
+    def invalidate(self, message_id: int):
+        self.__cache__.pop(message_id, None)
+
+    def _sweep(self):
+        now = time.monotonic()
+
+        for message_id, (fetched_at, _) in list(self.__cache__.items()):
+            if fetched_at is not None and now - fetched_at >= MESSAGE_CACHE_TTL:
+                del self.__cache__[message_id]
+
+    async def _on_message_changed(self, payload):
+        self.invalidate(payload.message_id)
+
+    async def _on_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            self.invalidate(message_id)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+
+        saved = stats['hits'] + stats['joined']
+        stats['cached'] = len(self.__cache__)
+        stats['hit_ratio'] = saved / stats['requests'] if stats['requests'] else 0.0
+
+        return stats
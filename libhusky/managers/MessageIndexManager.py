@@ -0,0 +1,399 @@
+import asyncio
+import concurrent.futures
+import datetime
+import logging
+import sqlite3
+import time
+
+import discord
+
+from libhusky.HuskyStatics import *
+
+LOG = logging.getLogger("HuskyBot.Managers.MessageIndexManager")
+
+# Buffered writes are committed once this many are pending, or when a query needs them.
+WRITE_BATCH_SIZE = 500
+
+# Messages per history page (Discord's maximum), and how many messages a scan reads before saving its position.
+HISTORY_PAGE_SIZE = 100
+CHECKPOINT_INTERVAL = 2000
+
+
+def snowflake_for(dt: datetime.datetime) -> int:
+    """
+    Get the lowest possible snowflake for a (naive, UTC) datetime.
+    """
+    return discord.utils.time_snowflake(dt, high=False)
+
+
+def now_snowflake() -> int:
+    return snowflake_for(datetime.datetime.utcnow())
+
+
+def subtract_ranges(start: int, end: int, covered: list) -> list:
+    """
+    Return the parts of [start, end) not covered by any of the given (start, end) ranges.
+    """
+    gaps = []
+    cursor = start
+
+    for (c_start, c_end) in sorted(covered):
+        if c_end <= cursor:
+            continue
+
+        if c_start >= end:
+            break
+
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+
+        cursor = max(cursor, c_end)
+
+        if cursor >= end:
+            break
+
+    if cursor < end:
+        gaps.append((cursor, end))
+
+    return gaps
+
+
+class MessageIndexManager:
+    """
+    The Message Index keeps a small local record of every message the bot sees - ID, channel, author, and whether the
+    author is a bot - so message statistics can be answered without paging through channel history.
+
+    Message timestamps are derived from their snowflake IDs, so everything is stored and queried by ID range.
+
+    To know when the index can be trusted, it also tracks coverage. Live sessions cover every channel from the moment
+    the bot started listening. Backfilled ranges cover single channels, filled from history. Anything outside those is
+    a gap, and callers fill gaps from history before answering.
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path)
+
+        # Lets reports read on the worker thread without holding up writes from the loop.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                author_id INTEGER NOT NULL,
+                is_bot INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_by_channel ON messages (channel_id, id);
+
+            CREATE TABLE IF NOT EXISTS live_sessions (
+                session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                start_id INTEGER NOT NULL,
+                end_id INTEGER NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS backfills (
+                channel_id INTEGER NOT NULL,
+                start_id INTEGER NOT NULL,
+                end_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS backfills_by_channel ON backfills (channel_id);
+
+            CREATE TABLE IF NOT EXISTS pending_scans (
+                guild_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                channel_ids TEXT NOT NULL,
+                start_id INTEGER NOT NULL,
+                end_id INTEGER NOT NULL
+            );
+        """)
+        self._db.commit()
+
+        self._pending_inserts = []
+        self._pending_deletes = []
+        self._session_id = None
+
+        # Whole-index reports are slow on a big index, so they run on one worker thread with their own connection.
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+
+        LOG.info("Manager load complete.")
+
+    def start_session(self):
+        """
+        Begin a new live session. Call this whenever the bot (re)starts receiving messages from the gateway.
+        """
+        self.end_session()
+
+        start = now_snowflake()
+        cursor = self._db.execute("INSERT INTO live_sessions (start_id, end_id) VALUES (?, ?)", (start, start))
+        self._session_id = cursor.lastrowid
+        self._db.commit()
+
+    def end_session(self):
+        """
+        Close the live session, if there is one. Call this as soon as the bot stops receiving messages from the
+        gateway, so the time it spends disconnected is left as a gap (and backfilled) rather than counted as covered.
+        """
+        self.flush()
+        self._session_id = None
+
+    def add(self, message: discord.Message):
+        self._pending_inserts.append((message.id, message.channel.id, message.author.id, int(message.author.bot)))
+
+        if len(self._pending_inserts) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def mark_backfilled(self, channel_id: int, start_id: int, end_id: int):
+        """
+        Mark [start_id, end_id) of a channel as covered, once every message in that range has been added from history.
+        """
+        self._db.execute("INSERT INTO backfills (channel_id, start_id, end_id) VALUES (?, ?, ?)",
+                         (channel_id, start_id, end_id))
+        self.flush()
+
+    def remove(self, message_id: int):
+        self._pending_deletes.append((message_id,))
+
+        if len(self._pending_deletes) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending_inserts:
+            self._db.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)", self._pending_inserts)
+            self._pending_inserts.clear()
+
+        if self._pending_deletes:
+            self._db.executemany("DELETE FROM messages WHERE id = ?", self._pending_deletes)
+            self._pending_deletes.clear()
+
+        # A session is only open while the gateway is connected, so coverage never extends over an outage.
+        if self._session_id is not None:
+            self._db.execute("UPDATE live_sessions SET end_id = ? WHERE session_id = ?",
+                             (now_snowflake(), self._session_id))
+
+        self._db.commit()
+
+    def get_gaps(self, channel_id: int, start_id: int, end_id: int) -> list:
+        """
+        Get the (start_id, end_id) ranges of a channel that the index can't vouch for.
+        """
+        self.flush()
+
+        covered = self._db.execute("SELECT start_id, end_id FROM live_sessions WHERE end_id > ? AND start_id < ?",
+                                   (start_id, end_id)).fetchall()
+        covered += self._db.execute("SELECT start_id, end_id FROM backfills "
+                                    "WHERE channel_id = ? AND end_id > ? AND start_id < ?",
+                                    (channel_id, start_id, end_id)).fetchall()
+
+        return subtract_ranges(start_id, end_id, covered)
+
+    def _channel_clause(self, channel_ids: list):
+        return f"channel_id IN ({','.join('?' * len(channel_ids))})"
+
+    def count_messages(self, channel_ids: list, start_id: int, end_id: int) -> int:
+        if not channel_ids:
+            return 0
+
+        self.flush()
+
+        return self._db.execute(f"SELECT COUNT(*) FROM messages WHERE {self._channel_clause(channel_ids)} "
+                                f"AND id >= ? AND id < ?", (*channel_ids, start_id, end_id)).fetchone()[0]
+
+    def count_by_author(self, channel_ids: list, start_id: int, end_id: int, include_bots: bool = False) -> dict:
+        if not channel_ids:
+            return {}
+
+        self.flush()
+
+        bot_clause = "" if include_bots else "AND is_bot = 0"
+
+        return dict(self._db.execute(f"SELECT author_id, COUNT(*) FROM messages "
+                                     f"WHERE {self._channel_clause(channel_ids)} AND id >= ? AND id < ? {bot_clause} "
+                                     f"GROUP BY author_id", (*channel_ids, start_id, end_id)).fetchall())
+
+    async def hourly_counts(self, group_by: str, channel_ids: list, include_bots: bool = False) -> list:
+        """
+        Get (key, hour, count) for every indexed message in the given channels, grouped by channel_id or author_id
+        and by the hour (since the Unix epoch, UTC) derived from the message snowflake.
+
+        This reads the whole index, so it runs on the index's worker thread.
+        """
+        if group_by not in ("channel_id", "author_id"):
+            raise ValueError(f"Can't group messages by {group_by}")
+
+        if not channel_ids:
+            return []
+
+        self.flush()
+
+        bot_clause = "" if include_bots else "AND is_bot = 0"
+
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, self._query,
+            f"SELECT {group_by}, ((id >> 22) / 1000 + ?) / 3600 AS hour, COUNT(*) "
+            f"FROM messages WHERE {self._channel_clause(channel_ids)} {bot_clause} "
+            f"GROUP BY {group_by}, hour", (DISCORD_EPOCH, *channel_ids)
+        )
+
+    def _query(self, sql: str, params: tuple) -> list:
+        return self._reader.execute(sql, params).fetchall()
+
+    def save_pending_scan(self, guild_id: int, name: str, channel_ids: list, start_id: int, end_id: int):
+        """
+        Remember an unfinished scan so it can be resumed. Progress itself lives in the backfill ranges, so resuming
+        only reads what's still missing.
+        """
+        self._db.execute("INSERT OR REPLACE INTO pending_scans VALUES (?, ?, ?, ?, ?)",
+                         (guild_id, name, ",".join(str(c) for c in channel_ids), start_id, end_id))
+        self._db.commit()
+
+    def get_pending_scan(self, guild_id: int):
+        row = self._db.execute("SELECT name, channel_ids, start_id, end_id FROM pending_scans WHERE guild_id = ?",
+                               (guild_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "name": row[0],
+            "channel_ids": [int(c) for c in row[1].split(",") if c],
+            "start_id": row[2],
+            "end_id": row[3]
+        }
+
+    def clear_pending_scan(self, guild_id: int):
+        self._db.execute("DELETE FROM pending_scans WHERE guild_id = ?", (guild_id,))
+        self._db.commit()
+
+    def get_stats(self) -> dict:
+        self.flush()
+
+        return {
+            "messages": self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0],
+            "sessions": self._db.execute("SELECT COUNT(*) FROM live_sessions").fetchone()[0],
+            "backfills": self._db.execute("SELECT COUNT(*) FROM backfills").fetchone()[0]
+        }
+
+    def cleanup(self):
+        self._executor.shutdown(wait=True)
+        self._reader.close()
+
+        self.flush()
+        self._db.close()
+
+
+class RateBudget:
+    """
+    A simple token bucket. Each history page costs one token.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self._rate = rate
+        self._capacity = burst or max(1, int(rate))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class HistoryScanner:
+    """
+    Fills gaps in a MessageIndexManager from channel history, scanning many channels at once.
+
+    Every gap is scanned oldest-first between snowflake bounds. At most `concurrency` gaps are read at a time, and
+    page fetches across all of them share one RateBudget. Progress is checkpointed into the index as backfilled
+    ranges, so a cancelled or timed-out scan loses at most CHECKPOINT_INTERVAL messages of work, and running it again
+    picks up where it stopped.
+    """
+
+    def __init__(self, index: MessageIndexManager, concurrency: int = 4, requests_per_second: float = 5.0):
+        self._index = index
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._budget = RateBudget(requests_per_second)
+
+        self.ranges_total = 0
+        self.ranges_done = 0
+        self.messages_scanned = 0
+        self.skipped_channels = []
+
+    def plan(self, channels: list, start_id: int, end_id: int) -> list:
+        """
+        Work out which (channel, gap_start, gap_end) ranges need scanning. Unreadable channels are recorded in
+        `skipped_channels` instead.
+        """
+        work = []
+
+        for channel in channels:
+            if not channel.permissions_for(channel.guild.me).read_message_history:
+                LOG.info("I don't have permission to get information for channel %s", channel)
+                self.skipped_channels.append(channel)
+                continue
+
+            for (gap_start, gap_end) in self._index.get_gaps(channel.id, start_id, end_id):
+                work.append((channel, gap_start, gap_end))
+
+        self.ranges_total = len(work)
+
+        return work
+
+    async def run(self, work: list) -> bool:
+        """
+        Scan every planned range. Ranges that fail are logged and left as gaps.
+
+        :return: True if every range was scanned.
+        """
+        results = await asyncio.gather(*[self._scan_range(channel, gap_start, gap_end)
+                                         for (channel, gap_start, gap_end) in work], return_exceptions=True)
+
+        for (channel, _, _), result in zip(work, results):
+            if isinstance(result, Exception):
+                LOG.warning(f"History scan of {channel} failed: {result}")
+
+        return self.ranges_done == self.ranges_total
+
+    async def _scan_range(self, channel, gap_start: int, gap_end: int):
+        async with self._semaphore:
+            LOG.info(f"Backfilling index for {channel} between {gap_start} and {gap_end}")
+
+            checkpoint_start = gap_start
+            since_checkpoint = 0
+            cursor = gap_start
+
+            # Pages are fetched one request at a time, oldest-first, so each one is charged to the budget exactly
+            # once, and if this is cancelled, everything below checkpoint_start is already indexed and marked as
+            # covered.
+            while True:
+                await self._budget.acquire()
+
+                page = await channel.history(limit=HISTORY_PAGE_SIZE, after=discord.Object(id=cursor - 1),
+                                             before=discord.Object(id=gap_end), oldest_first=True).flatten()
+
+                for m in page:
+                    self._index.add(m)
+                    self.messages_scanned += 1
+                    since_checkpoint += 1
+
+                    if since_checkpoint >= CHECKPOINT_INTERVAL:
+                        self._index.mark_backfilled(channel.id, checkpoint_start, m.id + 1)
+                        checkpoint_start = m.id + 1
+                        since_checkpoint = 0
+
+                # A short page means the range is exhausted.
+                if len(page) < HISTORY_PAGE_SIZE:
+                    break
+
+                cursor = page[-1].id + 1
+
+            self._index.mark_backfilled(channel.id, checkpoint_start, gap_end)
+            self.ranges_done += 1
@@ -0,0 +1,285 @@
+import asyncio
+import collections
+import datetime
+import logging
+import re
+import sqlite3
+
+import discord
+
+LOG = logging.getLogger("HuskyBot.Managers.MessageStoreManager")
+
+# Rough per-record overhead (object, slots, small ints) used when estimating memory use.
+RECORD_OVERHEAD_BYTES = 240
+
+# Evicted records are written to the spill file in batches of this size.
+SPILL_BATCH_SIZE = 100
+
+# The spill file is trimmed once it's this far (as a fraction) over its limit, a chunk of rows at a time.
+SPILL_TRIM_SLACK = 0.1
+SPILL_TRIM_CHUNK = 5000
+
+MENTION_REGEX = re.compile(r'<(@!?|@&|#)([0-9]{15,21})>')
+
+
+def clean_raw_content(guild: discord.Guild, data: dict) -> str:
+    """
+    Clean the content of a raw message payload the way discord.Message.clean_content does, so messages from raw
+    events are stored (and compared) just like cached ones.
+    """
+    names = {}
+    for user in data.get('mentions', []):
+        member = guild.get_member(int(user['id']))
+        names[int(user['id'])] = member.display_name if member is not None \
+            else (user.get('member') or {}).get('nick') or user['username']
+
+    def replace(match):
+        kind, target_id = match.group(1), int(match.group(2))
+
+        if kind == '#':
+            target = guild.get_channel(target_id)
+            name = '#' + target.name if target is not None else None
+        elif kind == '@&':
+            target = guild.get_role(target_id)
+            name = '@' + target.name if target is not None else None
+        else:
+            name = '@' + names[target_id] if target_id in names else None
+
+        return name if name is not None else match.group(0)
+
+    return discord.utils.escape_mentions(MENTION_REGEX.sub(replace, data['content']))
+
+
+class StoredMessage:
+    """
+    The parts of a message needed to log it after Discord (and discord.py's cache) have forgotten about it.
+    """
+
+    __slots__ = ('id', 'channel_id', 'author_id', 'author', 'avatar_url', 'created_at', 'content', 'attachments',
+                 'embed_count')
+
+    def __init__(self, message_id: int, channel_id: int, author_id: int, author: str, avatar_url: str,
+                 created_at: float, content: str, attachments: tuple, embed_count: int):
+        self.id = message_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.author = author
+        self.avatar_url = avatar_url
+        self.created_at = created_at
+        self.content = content
+        self.attachments = attachments
+        self.embed_count = embed_count
+
+    @classmethod
+    def from_message(cls, message: discord.Message):
+        return cls(message.id, message.channel.id, message.author.id, str(message.author), str(message.author.avatar_url),
+                   message.created_at.timestamp(), message.clean_content,
+                   tuple(a.url for a in message.attachments), len(message.embeds))
+
+    def to_row(self):
+        return (self.id, self.channel_id, self.author_id, self.author, self.avatar_url, self.created_at, self.content,
+                "\n".join(self.attachments), self.embed_count)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], row[6],
+                   tuple(row[7].split("\n")) if row[7] else (), row[8])
+
+    def get_created_datetime(self) -> datetime.datetime:
+        return datetime.datetime.utcfromtimestamp(self.created_at)
+
+    def estimate_size(self) -> int:
+        return RECORD_OVERHEAD_BYTES + len(self.content) + len(self.author) + len(self.avatar_url) \
+               + sum(len(a) for a in self.attachments)
+
+
+class MessageStoreManager:
+    """
+    A compact, bounded store of recent guild messages, so deleted and edited messages can be logged after they've
+    fallen out of discord.py's message cache.
+
+    Records live in an in-memory LRU bounded by both count and (estimated) size. If a spill path is configured, records
+    evicted from memory are moved to a SQLite file, which is itself trimmed (in the background) to a maximum number of
+    messages.
+    """
+
+    def __init__(self, max_messages: int = 50000, max_bytes: int = 32 * 1024 * 1024, spill_path: str = None,
+                 spill_max_messages: int = 1000000):
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._spill_max_messages = spill_max_messages
+
+        self.__cache__ = collections.OrderedDict()
+        self._size = 0
+
+        self._spill_path = spill_path
+        self._spill_db = None
+        self._spill_queue = []
+        self._spill_rows = 0
+        self._spill_trim = None
+
+        if spill_path is not None:
+            self._spill_db = sqlite3.connect(spill_path)
+
+            # Lets lookups carry on while a trim is deleting rows from another connection.
+            self._spill_db.execute("PRAGMA journal_mode=WAL")
+            self._spill_db.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, channel_id INTEGER, "
+                                   "author_id INTEGER, author TEXT, avatar_url TEXT, created_at REAL, content TEXT, "
+                                   "attachments TEXT, embed_count INTEGER)")
+            self._spill_db.commit()
+
+            self._spill_rows = self._spill_db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+        LOG.info("Manager load complete.")
+
+    def __len__(self):
+        return len(self.__cache__)
+
+    def add(self, message: discord.Message) -> StoredMessage:
+        record = StoredMessage.from_message(message)
+        self.put(record)
+
+        return record
+
+    def put(self, record: StoredMessage):
+        old = self.__cache__.pop(record.id, None)
+        if old is not None:
+            self._size -= old.estimate_size()
+
+        self.__cache__[record.id] = record
+        self._size += record.estimate_size()
+
+        while self.__cache__ and (len(self.__cache__) > self._max_messages or self._size > self._max_bytes):
+            _, evicted = self.__cache__.popitem(last=False)
+            self._size -= evicted.estimate_size()
+
+            if self._spill_db is not None:
+                self._spill_queue.append(evicted)
+
+        if len(self._spill_queue) >= SPILL_BATCH_SIZE:
+            self._flush_spill()
+
+    def get(self, message_id: int):
+        record = self.__cache__.get(message_id)
+
+        if record is not None:
+            self.__cache__.move_to_end(message_id)
+            return record
+
+        if self._spill_db is None:
+            return None
+
+        self._flush_spill()
+        row = self._spill_db.execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+
+        return StoredMessage.from_row(row) if row is not None else None
+
+    def get_many(self, message_ids) -> dict:
+        result = {}
+        missing = []
+
+        for message_id in message_ids:
+            record = self.__cache__.get(message_id)
+
+            if record is not None:
+                result[message_id] = record
+            else:
+                missing.append(message_id)
+
+        if missing and self._spill_db is not None:
+            self._flush_spill()
+
+            # Stay well under SQLite's bound parameter limit.
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                rows = self._spill_db.execute(f"SELECT * FROM messages WHERE id IN ({','.join('?' * len(chunk))})",
+                                              chunk).fetchall()
+
+                for row in rows:
+                    result[row[0]] = StoredMessage.from_row(row)
+
+        return result
+
+    def update_content(self, message_id: int, content: str):
+        record = self.get(message_id)
+
+        if record is None:
+            return
+
+        record.content = content
+        self.put(record)
+
+    def remove(self, message_id: int):
+        record = self.__cache__.pop(message_id, None)
+
+        if record is not None:
+            self._size -= record.estimate_size()
+        elif self._spill_db is not None:
+            self._flush_spill()
+            self._spill_db.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+            self._spill_db.commit()
+
+    def _flush_spill(self):
+        if not self._spill_queue:
+            return
+
+        self._spill_db.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [r.to_row() for r in self._spill_queue])
+        self._spill_db.commit()
+
+        self._spill_rows += len(self._spill_queue)
+        self._spill_queue.clear()
+
+        if self._spill_trim is None and self._spill_rows > self._spill_max_messages * (1 + SPILL_TRIM_SLACK):
+            self._spill_trim = asyncio.get_event_loop().run_in_executor(None, self._trim_spill)
+            self._spill_trim.add_done_callback(self._on_spill_trimmed)
+
+    def _trim_spill(self) -> int:
+        db = sqlite3.connect(self._spill_path)
+        total_deleted = 0
+
+        try:
+            # Message IDs are snowflakes, so the smallest IDs are the oldest messages.
+            watermark = db.execute("SELECT id FROM messages ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                   (self._spill_max_messages,)).fetchone()
+
+            if watermark is not None:
+                # Small transactions, so spills from the bot never wait long on this one.
+                while True:
+                    deleted = db.execute("DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE id <= ? "
+                                         "ORDER BY id LIMIT ?)", (watermark[0], SPILL_TRIM_CHUNK)).rowcount
+                    db.commit()
+                    total_deleted += deleted
+
+                    if deleted < SPILL_TRIM_CHUNK:
+                        break
+
+            # Report what was removed rather than a fresh count; spills can land while this runs.
+            return total_deleted
+        finally:
+            db.close()
+
+    def _on_spill_trimmed(self, future: asyncio.Future):
+        self._spill_trim = None
+
+        if future.cancelled():
+            return
+
+        if future.exception() is not None:
+            LOG.warning(f"Could not trim the message spill file: {future.exception()}")
+            return
+
+        self._spill_rows = max(0, self._spill_rows - future.result())
+
+    def get_stats(self) -> dict:
+        return {
+            "messages": len(self.__cache__),
+            "estimated_bytes": self._size,
+            "spill_enabled": self._spill_db is not None
+        }
+
+    def cleanup(self):
+        if self._spill_db is not None:
+            self._flush_spill()
+            self._spill_db.close()
+            self._spill_db = None
@@ -1,27 +1,56 @@
 import asyncio
 import datetime
+import heapq
+import itertools
 import logging
 
 import discord
 from discord.ext import commands
 
 from HuskyBot import HuskyBot
-from libhusky import HuskyConfig, HuskyData, HuskyUtils
+from libhusky import HuskyConfig, HuskyData, HuskyEvents, HuskyUtils
 from libhusky.HuskyStatics import *
 
 LOG = logging.getLogger("HuskyBot.Managers.MuteManager")
 
+# Longest the scheduler will sleep in one go. Expiries are wall-clock, so this bounds how late an unmute can be if the
+# system clock jumps.
+MAX_SLEEP_SECONDS = 3600
+
+# How many role/overwrite edits mass actions and reconciliation keep in flight at once. discord.py queues requests per
+# rate limit bucket anyway; this just keeps a large batch from flooding that queue.
+MASS_ACTION_CONCURRENCY = 5
+
+# A failed scheduled unmute is retried after this many seconds, doubling with each failure up to the maximum.
+UNMUTE_RETRY_DELAY = 30
+UNMUTE_RETRY_MAX_DELAY = 3600
+
 
 class MuteManager:
     def __init__(self, bot: HuskyBot):
         self._bot = bot
         self._bot_config = HuskyConfig.get_config()
         self._mute_config = HuskyConfig.get_config('mutes', create_if_nonexistent=True)
-        self.__cache__ = []
+
+        # (user_id, channel_id) -> Mute. A channel of None is a guild mute.
+        self.__cache__ = {}
+
+        # user_id -> {channel_id: Mute}
+        self._user_index = {}
+
+        # Min-heap of (due, seq, Mute, expiry). `due` is the expiry, or a later time for a retry. Entries go stale
+        # when a mute is removed or its expiry changes, and are dropped lazily when they reach the top.
+        self._expiry_heap = []
+        self._heap_seq = itertools.count()
+        self._rearm_event = asyncio.Event()
+
+        # (user_id, channel_id) -> failed scheduled unmutes in a row
+        self._unmute_failures = {}
 
         self.read_mutes_from_file()
 
         self.__task__ = self._bot.loop.create_task(self.check_mutes())
+        self._reconcile_task = self._bot.loop.create_task(self.reconcile_mutes())
 
         LOG.info("Manager load complete.")
 
@@ -31,57 +60,205 @@ class MuteManager:
         for raw_mute in disk_mutes:
             mute = HuskyData.Mute(raw_mute)
 
-            self.__cache__.append(mute)
+            if (mute.user_id, mute.channel) in self.__cache__:
+                LOG.warning(f"Duplicate mute record for [user_id={mute.user_id}, channel_id={mute.channel}] on disk. "
+                            f"Keeping the last one.")
+
+            self._add_to_cache(mute)
+
+        self._save_mutes()
+
+    def _save_mutes(self):
+        self._mute_config.set("mutes", list(self.__cache__.values()))
+
+    def _add_to_cache(self, mute: HuskyData.Mute):
+        key = (mute.user_id, mute.channel)
+
+        old_mute = self.__cache__.get(key)
+        if old_mute is not None:
+            self._remove_from_cache(old_mute)
+
+        self.__cache__[key] = mute
+        self._user_index.setdefault(mute.user_id, {})[mute.channel] = mute
+        self._schedule(mute)
+
+    def _remove_from_cache(self, mute: HuskyData.Mute):
+        key = (mute.user_id, mute.channel)
+
+        if self.__cache__.get(key) is not mute:
+            return
+
+        del self.__cache__[key]
+        self._unmute_failures.pop(key, None)
+
+        user_mutes = self._user_index.get(mute.user_id, {})
+        user_mutes.pop(mute.channel, None)
 
-        self._mute_config.set("mutes", self.__cache__)
+        if not user_mutes:
+            self._user_index.pop(mute.user_id, None)
+
+        # The heap entry is left behind and discarded once it reaches the top.
+
+    def _schedule(self, mute: HuskyData.Mute, due: float = None):
+        if mute.expiry is None:
+            return
+
+        entry = (due or mute.expiry, next(self._heap_seq), mute, mute.expiry)
+        heapq.heappush(self._expiry_heap, entry)
+
+        # Only wake the scheduler if this mute is now the next one due.
+        if self._expiry_heap[0] is entry:
+            self._rearm_event.set()
+
+    def _is_live_entry(self, entry) -> bool:
+        _, _, mute, expiry = entry
+
+        return self.__cache__.get((mute.user_id, mute.channel)) is mute and mute.expiry == expiry
+
+    def get_mutes_for_user(self, user_id: int) -> list:
+        return list(self._user_index.get(user_id, {}).values())
 
     async def check_mutes(self):
         while not self._bot.is_closed():
-            for mute in self.__cache__:
-                if mute.is_expired():
+            while self._expiry_heap and not self._is_live_entry(self._expiry_heap[0]):
+                heapq.heappop(self._expiry_heap)
+
+            if not self._expiry_heap:
+                timeout = None
+            else:
+                due, _, mute, _ = self._expiry_heap[0]
+                now = datetime.datetime.utcnow().timestamp()
+
+                if due <= now:
+                    heapq.heappop(self._expiry_heap)
+
                     LOG.info(f"Found a scheduled unmute - [user_id={mute.user_id}, channel_id={mute.channel}]. "
                              f"Triggering...")
-                    await self.unmute_user(mute, "System - Scheduled")
 
-                # Because mutes are sorted by expiry, we can just exit the loop if we encounter a mute that's not yet
-                # over.
-                else:
-                    break
+                    try:
+                        await self.unmute_user(mute, "System - Scheduled")
+                    except Exception as e:
+                        self._reschedule_failed_unmute(mute, e)
 
-            await asyncio.sleep(0.5)
+                    continue
 
-    async def mute_user_by_object(self, mute: HuskyData.Mute, staff_member: str = "System"):
-        guild = self._bot.get_guild(mute.guild)
+                timeout = min(due - now, MAX_SLEEP_SECONDS)
 
-        member = guild.get_member(mute.user_id)
+            # Sleep until the next mute is due, or until a mute that's due sooner gets added.
+            self._rearm_event.clear()
+
+            try:
+                await asyncio.wait_for(self._rearm_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _reschedule_failed_unmute(self, mute: HuskyData.Mute, error: Exception):
+        key = (mute.user_id, mute.channel)
+
+        # Nothing to retry if the mute was lifted (or replaced) before the failure.
+        if self.__cache__.get(key) is not mute:
+            LOG.exception(f"Scheduled unmute for [user_id={mute.user_id}, channel_id={mute.channel}] failed after "
+                          f"the mute was removed: {error}")
+            return
 
+        failures = self._unmute_failures.get(key, 0) + 1
+        self._unmute_failures[key] = failures
+
+        delay = min(UNMUTE_RETRY_DELAY * 2 ** (failures - 1), UNMUTE_RETRY_MAX_DELAY)
+
+        LOG.exception(f"Scheduled unmute for [user_id={mute.user_id}, channel_id={mute.channel}] failed "
+                      f"({failures} time(s)): {error}. Retrying in {delay} seconds.")
+
+        self._schedule(mute, datetime.datetime.utcnow().timestamp() + delay)
+
+    def _get_mute_role(self, guild: discord.Guild) -> discord.Role:
+        mute_role = guild.get_role(self._bot_config.get("specialRoles", {}).get(SpecialRoleKeys.MUTED.value))
+
+        if mute_role is None:
+            raise ValueError("A muted role is not set!")
+
+        return mute_role
+
+    async def _apply_mute(self, guild: discord.Guild, member: discord.Member, mute: HuskyData.Mute,
+                          staff_member: str):
+        """
+        Apply a mute's role or channel overwrite on Discord, without touching the cache or logs.
+        """
         expiry_string = ""
         if mute.expiry is not None:
             expiry_string = f" (muted until {datetime.datetime.fromtimestamp(mute.expiry).strftime(DATETIME_FORMAT)})"
 
+        reason = f"Muted by {staff_member} for reason {mute.reason}{expiry_string}"
+
         if mute.channel is None:
-            mute_role = guild.get_role(self._bot_config.get("specialRoles", {}).get("muted"))
-            mute_context = "the guild"
-            channel = None
+            await member.add_roles(self._get_mute_role(guild), reason=reason)
+        else:
+            channel = guild.get_channel(mute.channel)
 
-            if mute_role is None:
-                raise ValueError("A muted role is not set!")
+            await channel.set_permissions(member, reason=reason, send_messages=False, add_reactions=False)
 
-            await member.add_roles(mute_role, reason=f"Muted by {staff_member} for reason {mute.reason}{expiry_string}")
+    async def _lift_mute(self, guild: discord.Guild, member: discord.Member, mute: HuskyData.Mute,
+                         unmute_reason: str):
+        """
+        Remove a mute's role or channel overwrite on Discord, without touching the cache or logs.
+        """
+        if mute.channel is not None:
+            channel = self._bot.get_channel(mute.channel)
+
+            await channel.set_permissions(member, overwrite=mute.get_cached_override(),
+                                          reason=f"User's channel mute has been lifted by {unmute_reason}")
+        else:
+            await member.remove_roles(self._get_mute_role(guild),
+                                      reason=f"User's guild mute has been lifted by {unmute_reason}")
+
+    def _is_mute_applied(self, guild: discord.Guild, member: discord.Member, mute: HuskyData.Mute) -> bool:
+        if mute.channel is None:
+            return self._get_mute_role(guild) in member.roles
+
+        channel = guild.get_channel(mute.channel)
+
+        # A deleted channel can't be muted from, so there's nothing to re-apply.
+        if channel is None:
+            return True
+
+        return channel.overwrites_for(member).send_messages is False
+
+    async def _run_bounded(self, jobs: list) -> list:
+        """
+        Await a list of coroutines with at most MASS_ACTION_CONCURRENCY running at once. Exceptions are returned in
+        place of results, in the same order as the jobs.
+        """
+        semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+
+        async def run(job):
+            async with semaphore:
+                return await job
+
+        return await asyncio.gather(*[run(job) for job in jobs], return_exceptions=True)
+
+    def _publish(self, event: ModerationEvents, mute: HuskyData.Mute, staff_member, member: discord.Member = None):
+        HuskyEvents.publish(event, mute.guild, user_id=mute.user_id, user=str(member) if member else None,
+                            channel_id=mute.channel, reason=mute.reason, expiry=mute.expiry,
+                            moderator=str(staff_member) if staff_member is not None else None)
+
+    async def mute_user_by_object(self, mute: HuskyData.Mute, staff_member: str = "System"):
+        guild = self._bot.get_guild(mute.guild)
+
+        member = guild.get_member(mute.user_id)
+
+        await self._apply_mute(guild, member, mute, staff_member)
+
+        if mute.channel is None:
+            mute_context = "the guild"
+            channel = None
         else:
             channel = guild.get_channel(mute.channel)
             mute_context = channel.mention
 
-            await channel.set_permissions(member,
-                                          reason=f"Muted by {staff_member} for reason {mute.reason}{expiry_string}",
-                                          send_messages=False,
-                                          add_reactions=False)
-
-        if mute not in self.__cache__:
-            pos = HuskyUtils.get_sort_index(self.__cache__, mute, 'expiry')
-            self.__cache__.insert(pos, mute)
-            self.__cache__.sort(key=lambda m: m.expiry if m.expiry else 10 * 100)
-            self._mute_config.set("mutes", self.__cache__)
+        if self.__cache__.get((mute.user_id, mute.channel)) is not mute:
+            self._add_to_cache(mute)
+            self._save_mutes()
+            self._publish(ModerationEvents.MUTE, mute, staff_member, member)
 
             # Inform the guild logs
             alert_channel = self._bot_config.get('specialChannels', {}).get(ChannelKeys.STAFF_LOG.value, None)
@@ -105,9 +282,8 @@ class MuteManager:
 
                 await alert_channel.send(embed=embed)
 
-    async def mute_user(self, ctx: commands.Context, member: discord.Member, channel,
-                        reason: str, expiry: int, staff_member: discord.Member):
-
+    def _build_mute(self, guild: discord.Guild, member: discord.Member, channel, reason: str,
+                    expiry: int) -> HuskyData.Mute:
         if channel is None:
             channel_id = None
             current_perms = None
@@ -116,15 +292,175 @@ class MuteManager:
             current_perms = channel.overwrites_for(member)
 
         mute_obj = HuskyData.Mute()
-        mute_obj.guild = ctx.guild.id
+        mute_obj.guild = guild.id
         mute_obj.user_id = member.id
         mute_obj.reason = reason
         mute_obj.channel = channel_id
         mute_obj.expiry = expiry
         mute_obj.set_cached_override(current_perms)
 
+        return mute_obj
+
+    async def mute_user(self, ctx: commands.Context, member: discord.Member, channel,
+                        reason: str, expiry: int, staff_member: discord.Member):
+
+        mute_obj = self._build_mute(ctx.guild, member, channel, reason, expiry)
+
         await self.mute_user_by_object(mute_obj, str(staff_member))
 
+    async def mass_mute(self, guild: discord.Guild, members: list, channel, reason: str, expiry: int,
+                        staff_member: discord.Member):
+        """
+        Mute many members at once, either from a channel or (if channel is None) from the guild.
+
+        Discord edits run concurrently (bounded by MASS_ACTION_CONCURRENCY), the mute file is written once, and a
+        single summary is sent to the staff log instead of one alert per member.
+
+        Returns a tuple of (muted members, list of "member - error" strings).
+        """
+        channel_id = channel.id if channel is not None else None
+
+        targets = []
+        failed = []
+
+        for member in members:
+            if (member.id, channel_id) in self.__cache__:
+                failed.append(f"{member} - ALREADY_MUTED")
+                continue
+
+            targets.append((member, self._build_mute(guild, member, channel, reason, expiry)))
+
+        results = await self._run_bounded([self._apply_mute(guild, member, mute, f"{staff_member} (mass mute)")
+                                           for (member, mute) in targets])
+
+        succeeded = []
+        for (member, mute), result in zip(targets, results):
+            if isinstance(result, Exception):
+                LOG.warning(f"Mass mute of {member} failed: {result}")
+                failed.append(f"{member} - {type(result).__name__}")
+                continue
+
+            self._add_to_cache(mute)
+            self._publish(ModerationEvents.MUTE, mute, staff_member, member)
+            succeeded.append(member)
+
+        if succeeded:
+            self._save_mutes()
+
+        await self._send_mass_action_log(guild, "muted", succeeded, failed, channel, staff_member, reason, expiry)
+
+        return succeeded, failed
+
+    async def mass_unmute(self, guild: discord.Guild, members: list, channel, staff_member: discord.Member):
+        """
+        Unmute many members at once. See mass_mute; the return value has the same shape.
+        """
+        channel_id = channel.id if channel is not None else None
+
+        targets = []
+        failed = []
+
+        for member in members:
+            mute = self.__cache__.get((member.id, channel_id))
+
+            if mute is None:
+                failed.append(f"{member} - NOT_MUTED")
+                continue
+
+            targets.append((member, mute))
+
+        results = await self._run_bounded([self._lift_mute(guild, member, mute, f"user {staff_member} (mass unmute)")
+                                           for (member, mute) in targets])
+
+        succeeded = []
+        for (member, mute), result in zip(targets, results):
+            if isinstance(result, Exception):
+                LOG.warning(f"Mass unmute of {member} failed: {result}")
+                failed.append(f"{member} - {type(result).__name__}")
+                continue
+
+            self._remove_from_cache(mute)
+            self._publish(ModerationEvents.UNMUTE, mute, staff_member, member)
+            succeeded.append(member)
+
+        if succeeded:
+            self._save_mutes()
+
+        await self._send_mass_action_log(guild, "unmuted", succeeded, failed, channel, staff_member)
+
+        return succeeded, failed
+
+    async def _send_mass_action_log(self, guild: discord.Guild, action: str, succeeded: list, failed: list, channel,
+                                    staff_member: discord.Member, reason: str = None, expiry: int = None):
+        alert_channel = self._bot_config.get('specialChannels', {}).get(ChannelKeys.STAFF_LOG.value, None)
+
+        if alert_channel is None or not succeeded:
+            return
+
+        alert_channel = guild.get_channel(alert_channel)
+        context = "the guild" if channel is None else channel.mention
+
+        embed = discord.Embed(
+            description=f"{len(succeeded)} users were mass {action} from {context}.\n\n"
+                        + HuskyUtils.trim_string(", ".join(f"{m} (`{m.id}`)" for m in succeeded), 1500),
+            color=Colors.WARNING if action == "muted" else Colors.INFO
+        )
+
+        embed.set_author(name=f"Mass {action} {len(succeeded)} users from {context}!")
+        embed.add_field(name="Responsible User", value=str(staff_member), inline=True)
+        embed.add_field(name="Timestamp", value=HuskyUtils.get_timestamp(), inline=True)
+
+        if action == "muted":
+            embed.add_field(name="Expires At", value=datetime.datetime.fromtimestamp(expiry)
+                            .strftime(DATETIME_FORMAT) if expiry is not None else "Never", inline=True)
+            embed.add_field(name="Reason", value=reason, inline=False)
+
+        if failed:
+            embed.add_field(name="Failed", value=str(len(failed)), inline=True)
+
+        await alert_channel.send(embed=embed)
+
+    async def reconcile_mutes(self):
+        """
+        Re-apply any recorded mute whose role or channel overwrite has gone missing (e.g. it was removed by hand or
+        while the bot was offline). Runs once the bot is ready.
+        """
+        await self._bot.wait_until_ready()
+
+        pending = []
+
+        for mute in list(self.__cache__.values()):
+            if mute.is_expired():
+                continue
+
+            guild = self._bot.get_guild(mute.guild)
+            member = guild.get_member(mute.user_id) if guild is not None else None
+
+            if member is None:
+                continue
+
+            try:
+                if not self._is_mute_applied(guild, member, mute):
+                    pending.append((guild, member, mute))
+            except ValueError as e:
+                LOG.warning(f"Can't reconcile guild mutes: {e}")
+
+        if not pending:
+            LOG.info("Mute reconciliation complete. All mutes are in place.")
+            return
+
+        results = await self._run_bounded([self._apply_mute(guild, member, mute, "System - Reconcile")
+                                           for (guild, member, mute) in pending])
+
+        failures = 0
+        for (_, member, mute), result in zip(pending, results):
+            if isinstance(result, Exception):
+                failures += 1
+                LOG.warning(f"Could not re-apply mute for [user_id={member.id}, channel_id={mute.channel}]: {result}")
+
+        LOG.info(f"Mute reconciliation complete. Re-applied {len(pending) - failures} of {len(pending)} missing "
+                 f"mutes.")
+
     async def unmute_user(self, mute: HuskyData.Mute, staff_member: str):
         if staff_member is not None:
             unmute_reason = f"user {staff_member}"
@@ -138,31 +474,22 @@ class MuteManager:
         # is up.
         if member is None:
             LOG.info(f"Left user ID {mute.user_id} has had their mute expire. Removing it.")
-            self.__cache__.remove(mute)
-            self._mute_config.set("mutes", self.__cache__)
+            self._remove_from_cache(mute)
+            self._save_mutes()
 
             return
 
-        if mute.channel is not None:
-            channel = self._bot.get_channel(mute.channel)
-            unmute_context = channel.mention
+        await self._lift_mute(guild, member, mute, unmute_reason)
 
-            await channel.set_permissions(member, overwrite=mute.get_cached_override(),
-                                          reason=f"User's channel mute has been lifted by {unmute_reason}")
+        if mute.channel is not None:
+            unmute_context = self._bot.get_channel(mute.channel).mention
         else:
             unmute_context = "the guild"
 
-            mute_role = guild.get_role(self._bot_config.get("specialRoles", {}).get(SpecialRoleKeys.MUTED.value))
-
-            if mute_role is None:
-                raise ValueError("A muted role is not set!")
-
-            await member.remove_roles(mute_role,
-                                      reason=f"User's guild mute has been lifted by {unmute_reason}")
-
         # Remove from the disk
-        self.__cache__.remove(mute)
-        self._mute_config.set("mutes", self.__cache__)
+        self._remove_from_cache(mute)
+        self._save_mutes()
+        self._publish(ModerationEvents.UNMUTE, mute, staff_member, member)
 
         # Inform the guild logs
         alert_channel = self._bot_config.get('specialChannels', {}).get(ChannelKeys.STAFF_LOG.value, None)
@@ -183,34 +510,23 @@ class MuteManager:
             await alert_channel.send(embed=embed)
 
     async def restore_user_mute(self, member: discord.Member):
-        for mute in self.__cache__:
-            if (mute.user_id == member.id) and not mute.is_expired():
+        for mute in self.get_mutes_for_user(member.id):
+            if not mute.is_expired():
                 LOG.info(f"Restoring mute state for left user {member} in channel")
                 await self.mute_user_by_object(mute, "System - ReJoin")
 
     async def find_user_mute_record(self, member: discord.Member, channel):
-        result = None
-
         channel_id = None
         if channel is not None:
             channel_id = channel.id
 
-        for mute in self.__cache__:
-            if member.id == mute.user_id and channel_id == mute.channel:
-                result = mute
-
-        if result is None:
-            return None
-
-        return result
+        return self.__cache__.get((member.id, channel_id))
 
     async def update_mute_record(self, mute: HuskyData.Mute, reason: str = None, expiry: int = None):
 
-        if mute not in self.__cache__:
+        if self.__cache__.get((mute.user_id, mute.channel)) is not mute:
             raise KeyError("This record doesn't exist in the cache!")
 
-        self.__cache__.remove(mute)
-
         old_reason = mute.reason
         old_expiry = mute.expiry
 
@@ -220,11 +536,11 @@ class MuteManager:
         if expiry is not None:
             mute.expiry = expiry
 
-        # Update cache and disk
-        pos = HuskyUtils.get_sort_index(self.__cache__, mute, 'expiry')
-        self.__cache__.insert(pos, mute)
-        self.__cache__.sort(key=lambda m: m.expiry if m.expiry else 10 * 100)
-        self._mute_config.set("mutes", self.__cache__)
+        # Update cache and disk. Any old heap entry no longer matches the expiry and goes stale.
+        if mute.expiry != old_expiry:
+            self._schedule(mute)
+
+        self._save_mutes()
 
         alert_channel = self._bot_config.get('specialChannels', {}).get(ChannelKeys.STAFF_LOG.value, None)
         if alert_channel is not None:
@@ -257,3 +573,6 @@ class MuteManager:
     def cleanup(self):
         if self.__task__ is not None:
             self.__task__.cancel()
+
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
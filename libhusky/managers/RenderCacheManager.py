@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import uuid
+
+LOG = logging.getLogger("HuskyBot.Managers.RenderCacheManager")
+
+
+def make_key(*parts) -> str:
+    """
+    Build a cache key from the parts that determine a render's output (its source, format, and so on).
+    """
+    digest = hashlib.sha256()
+
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") don't collide.
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+
+    return digest.hexdigest()
+
+
+class RenderCacheManager:
+    """
+    A content-addressed cache of rendered output (such as images), stored on disk.
+
+    Each entry is a file named after its key. An in-memory index tracks entry sizes in least-recently-used order, and
+    the oldest entries are deleted once the cache grows past its size budget. Use order is kept in file modification
+    times, so it survives restarts. Disk access runs in the default executor, so a slow disk never stalls the bot.
+
+    Concurrent requests for the same key share a single render. Renders larger than the whole size budget are
+    returned but not cached.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self._path = path
+        self._max_size = max_size
+
+        # key -> size in bytes, least recently used first
+        self.__cache__ = collections.OrderedDict()
+        self._total_size = 0
+
+        # key -> Task rendering (and caching) the bytes
+        self._inflight = {}
+
+        self._stats = {"hits": 0, "misses": 0, "joined": 0, "renders": 0, "evictions": 0, "oversized": 0}
+
+        os.makedirs(self._path, exist_ok=True)
+        self._load_index()
+
+        LOG.info("Manager load complete.")
+
+    def _load_index(self):
+        entries = []
+
+        for entry in os.scandir(self._path):
+            if not entry.is_file():
+                continue
+
+            # Left behind by a write that never finished.
+            if entry.name.endswith('.tmp'):
+                os.remove(entry.path)
+                continue
+
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self.__cache__[key] = size
+            self._total_size += size
+
+        self._evict()
+
+        LOG.info(f"Loaded {len(self.__cache__)} cached renders ({self._total_size} bytes) from {self._path}.")
+
+    def _get_file(self, key: str) -> str:
+        return os.path.join(self._path, key)
+
+    async def get(self, key: str):
+        """
+        Get a cached render.
+
+        :return: The cached bytes, or None if the key isn't cached.
+        """
+        if key not in self.__cache__:
+            return None
+
+        self.__cache__.move_to_end(key)
+
+        try:
+            return await asyncio.get_event_loop().run_in_executor(None, self._read_file, key)
+        except FileNotFoundError:
+            # Deleted out from under us. Forget about it.
+            self._forget(key)
+            return None
+
+    def _read_file(self, key: str) -> bytes:
+        filename = self._get_file(key)
+
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+        # Record the use, so the LRU order survives a restart.
+        os.utime(filename)
+
+        return data
+
+    async def put(self, key: str, data: bytes):
+        if len(data) > self._max_size:
+            # It would only evict everything else, and then itself.
+            self._stats['oversized'] += 1
+            return
+
+        await asyncio.get_event_loop().run_in_executor(None, self._write_file, key, data)
+
+        self._forget(key)
+        self.__cache__[key] = len(data)
+        self._total_size += len(data)
+
+        self._evict()
+
+    def _write_file(self, key: str, data: bytes):
+        temp_file = os.path.join(self._path, f"{key}.{uuid.uuid4().hex}.tmp")
+
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+
+        os.replace(temp_file, self._get_file(key))
+
+    def _forget(self, key: str):
+        size = self.__cache__.pop(key, None)
+
+        if size is not None:
+            self._total_size -= size
+
+    def _evict(self):
+        while self._total_size > self._max_size and self.__cache__:
+            key, size = self.__cache__.popitem(last=False)
+            self._total_size -= size
+            self._stats['evictions'] += 1
+
+            try:
+                os.remove(self._get_file(key))
+            except FileNotFoundError:
+                pass
+
+    async def get_or_render(self, key: str, render) -> bytes:
+        """
+        Get a cached render, or render and cache it.
+
+        :param key: The cache key. See make_key().
+        :param render: A coroutine function that renders the bytes to cache. It is only called on a cache miss, and
+                       only once for any number of concurrent requests for the same key. Failed renders aren't
+                       cached; everyone waiting on one gets its exception.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats['joined'] += 1
+            return await asyncio.shield(task)
+
+        data = await self.get(key)
+        if data is not None:
+            self._stats['hits'] += 1
+            return data
+
+        # Someone else may have started rendering while the cache was being checked.
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats['joined'] += 1
+            return await asyncio.shield(task)
+
+        self._stats['misses'] += 1
+        self._stats['renders'] += 1
+
+        # The render runs as its own task, so a caller that gives up (even the one that started it) doesn't cancel it
+        # for everyone else waiting on it.
+        task = asyncio.ensure_future(self._render(key, render))
+        task.add_done_callback(self._render_done)
+        self._inflight[key] = task
+
+        return await asyncio.shield(task)
+
+    async def _render(self, key: str, render) -> bytes:
+        try:
+            data = await render()
+
+            try:
+                await self.put(key, data)
+            except OSError as e:
+                LOG.warning(f"Could not cache render {key}: {e}")
+
+            return data
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _render_done(task: asyncio.Future):
+        # Everyone waiting may have given up. Retrieve the exception so it isn't reported as never retrieved.
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+
+        stats['entries'] = len(self.__cache__)
+        stats['bytes'] = self._total_size
+        stats['maxBytes'] = self._max_size
+
+        return stats
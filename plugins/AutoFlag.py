@@ -7,6 +7,7 @@ from discord.ext import commands
 
 from HuskyBot import HuskyBot
 from libhusky import HuskyChecks
+from libhusky import HuskyEvents
 from libhusky import HuskyUtils
 from libhusky.HuskyStatics import *
 
@@ -74,6 +75,10 @@ class AutoFlag(commands.Cog):
                 LOG.info("Got flagged message (context %s, key %s, from %s in %s): %s", context,
                          message.author, flag_term, message.channel, message.content)
 
+                HuskyEvents.publish(ModerationEvents.AUTOFLAG, message.guild.id, reason="regex", term=flag_term,
+                                    context=context, user_id=message.author.id, user=str(message.author),
+                                    channel_id=message.channel.id, message_id=message.id)
+
     async def user_filter(self, message: discord.Message):
         flag_users = self._config.get("flaggedUsers", [])
 
@@ -104,6 +109,10 @@ class AutoFlag(commands.Cog):
 
             LOG.info("Got user flagged message (from %s in %s): %s", message.author, message.channel, message.content)
 
+            HuskyEvents.publish(ModerationEvents.AUTOFLAG, message.guild.id if message.guild else None,
+                                reason="user", user_id=message.author.id, user=str(message.author),
+                                channel_id=message.channel.id, message_id=message.id)
+
     @commands.Cog.listener()
     async def on_message(self, message):
         asyncio.ensure_future(self.regex_message_filter(message))
@@ -1,4 +1,5 @@
 import ast
+import asyncio
 import datetime
 import inspect
 import io
@@ -20,7 +21,9 @@ from HuskyBot import HuskyBot
 from libhusky import HuskyChecks, HuskyConfig
 from libhusky import HuskyHTTP
 from libhusky import HuskyUtils
+from libhusky import HuskyWatchdog
 from libhusky.HuskyStatics import *
+from libhusky.managers.MessageFetchManager import MessageFetchManager
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
@@ -41,6 +44,8 @@ class Debug(commands.Cog):
         self.bot = bot
         self._config = bot.config
         self._session_store = bot.session_store
+        self._message_fetcher = MessageFetchManager(bot)
+        self._http = bot.http_client.for_plugin(self)
         LOG.info("Loaded plugin!")
 
     def cog_unload(self):
@@ -113,7 +118,7 @@ class Debug(commands.Cog):
         The reaction must be specified as an emote or valid emote-like string.
         """
 
-        target_message = await channel.fetch_message(message)
+        target_message = await self._message_fetcher.fetch_message(channel, message)
 
         await target_message.add_reaction(reaction)
 
@@ -152,9 +157,10 @@ class Debug(commands.Cog):
         """
         Check latency to the Discord servers.
 
-        This system will measure two separate systems:
+        This system will measure three separate systems:
         - The current websocket latency (measured in milliseconds), as determined by discord.py
         - The current message latency (time for the bot to send and receive confirmation of an event.
+        - The bot's event loop lag (how late the bot has been running its own work), over the last few minutes.
 
         Note that latency measurements may be affected by bot load, network congestion, Discord server issues, and
         other similar systems. This command should not be a direct measure of latency to Discord but rather a generic
@@ -197,8 +203,34 @@ class Debug(commands.Cog):
         embed.add_field(name="Websocket Latency", value=f"{websocket_lantency_ms} ms", inline=False)
         embed.add_field(name="Message Latency", value=f"{message_latency_ms} ms", inline=False)
 
+        loop_stats = HuskyWatchdog.get_watchdog().get_stats()
+        embed.add_field(name="Event Loop Lag",
+                        value=f"p50 {loop_stats['p50Ms']:.1f} ms / p90 {loop_stats['p90Ms']:.1f} ms / "
+                              f"p99 {loop_stats['p99Ms']:.1f} ms / max {loop_stats['maxMs']:.1f} ms\n"
+                              f"{loop_stats['stalls']} stalls over {loop_stats['thresholdMs']:.0f} ms",
+                        inline=False)
+
         await ctx.send(embed=embed)
 
+    @debug.command(name="fetchStats", brief="Get message fetch cache statistics")
+    async def fetch_stats(self, ctx: commands.Context):
+        """
+        Show how many message fetches have been served from the shared message fetch cache (or joined an identical
+        fetch already in progress) rather than calling the API.
+        """
+        stats = self._message_fetcher.get_stats()
+
+        await ctx.send(embed=discord.Embed(
+            title="Message Fetch Cache",
+            description=f"**Requests:** {stats['requests']}\n"
+                        f"**Cache Hits:** {stats['hits']}\n"
+                        f"**Joined In-Flight Fetches:** {stats['joined']}\n"
+                        f"**API Fetches:** {stats['fetches']}\n"
+                        f"**Hit Ratio:** {stats['hit_ratio']:.1%}\n"
+                        f"**Cached Messages:** {stats['cached']}",
+            color=Colors.INFO
+        ))
+
     @debug.command(name="repost", brief="Copy a specified message to the current channel")
     async def repost(self, ctx: commands.Context, channel: discord.TextChannel, message_id: int):
         """
@@ -207,7 +239,7 @@ class Debug(commands.Cog):
         This command may be used to copy logs or other important events from one channel to another.
         """
 
-        message = await channel.fetch_message(message_id)
+        message = await self._message_fetcher.fetch_message(channel, message_id)
 
         await ctx.channel.send(
             content=message.content,
@@ -417,7 +449,7 @@ class Debug(commands.Cog):
             return
 
         try:
-            async with aiohttp.client.request(method, url, data=data) as response:
+            async with self._http.request(method, url, data=data) as response:
                 if 100 <= response.status <= 199:
                     color = Colors.INFO
                 elif 200 <= response.status <= 299:
@@ -432,7 +464,7 @@ class Debug(commands.Cog):
                     description="```{}```".format(HuskyUtils.trim_string(await response.text(), 2000)),
                     color=color
                 ))
-        except aiohttp.client.ClientError as ex:
+        except (aiohttp.client.ClientError, asyncio.TimeoutError) as ex:
             await ctx.send(embed=discord.Embed(
                 title="Could Not Make Request",
                 description=f"Requestify failed to make a request due to error `{type(ex).__name__}`. "
@@ -505,6 +537,23 @@ class Debug(commands.Cog):
             target = data.get("name", "world")
         return web.Response(text=f"Hello {target} from {self.bot.user}!")
 
+    @HuskyHTTP.register("/debug/routes", ["GET"])
+    async def route_stats(self, request: web.BaseRequest):
+        return web.json_response(HuskyHTTP.get_router().get_stats())
+
+    @HuskyHTTP.register("/debug/metrics", ["GET"])
+    async def metrics(self, request: web.BaseRequest):
+        math_plugin = self.bot.get_cog("Math")
+
+        return web.json_response({
+            "websocketLatencyMs": self.bot.latency * 1000,
+            "eventLoop": HuskyWatchdog.get_watchdog().get_stats(),
+            "routes": HuskyHTTP.get_router().get_stats(),
+            "messageFetch": self._message_fetcher.get_stats(),
+            "httpClient": self.bot.http_client.get_stats(),
+            "texCache": math_plugin.get_tex_cache_stats() if math_plugin is not None else None
+        })
+
 
 def setup(bot: HuskyBot):
     bot.add_cog(Debug(bot))
@@ -5,7 +5,6 @@ import random
 import re
 import tempfile
 
-import aiohttp
 import discord
 from PIL import Image, ImageSequence
 from discord.ext import commands
@@ -29,13 +28,10 @@ class DirtyHacks(commands.Cog):
         self.bot = bot
         self._config = bot.config
 
-        self._http_session = aiohttp.ClientSession(loop=bot.loop)
+        self._http = bot.http_client.for_plugin(self)
 
         LOG.info("Loaded plugin!")
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self._http_session.close())
-
     @commands.Cog.listener(name="on_message")
     async def kill_abusive_gifs(self, message: discord.Message):
         def undersized_gif_check(file) -> bool:
@@ -86,7 +82,7 @@ class DirtyHacks(commands.Cog):
                 return
 
             with tempfile.NamedTemporaryFile(suffix=".gif") as f:
-                async with self._http_session.get(match) as r:  # type: aiohttp.ClientResponse
+                async with self._http.get(match) as r:
                     if r.status != 200:
                         LOG.warning("Failed to check GIF, because status code was not 200")
                         return
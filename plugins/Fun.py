@@ -4,7 +4,6 @@ import random
 import re
 from datetime import datetime
 
-import aiohttp
 import discord
 from discord.ext import commands
 
@@ -26,7 +25,7 @@ class Fun(commands.Cog):
         self.bot = bot
         self._config = bot.config
 
-        self._http_session = aiohttp.ClientSession(loop=bot.loop)
+        self._http = bot.http_client.for_plugin(self)
 
         # For those reading this code and wondering about the significance of 736580, it is a very important
         # number relating to someone I loved. </3
@@ -34,9 +33,6 @@ class Fun(commands.Cog):
 
         LOG.info("Loaded plugin!")
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self._http_session.close())
-
     @commands.command(name="slap", brief="Slap a user silly!")
     @commands.guild_only()
     async def slap(self, ctx: commands.Context, user: discord.Member = None):
@@ -220,7 +216,7 @@ class Fun(commands.Cog):
         """
         Dog.
         """
-        async with self._http_session.get("https://dog.ceo/api/breeds/image/random") as resp:
+        async with self._http.get("https://dog.ceo/api/breeds/image/random") as resp:
             dog = await resp.json()
 
         if dog.get('status') != "success":
@@ -502,7 +498,7 @@ class Fun(commands.Cog):
             # because of the extra delay, let's add a typing notifier
             await ctx.trigger_typing()
 
-            async with self._http_session.get('https://c.xkcd.com/random/comic', allow_redirects=False) as r_resp:
+            async with self._http.get('https://c.xkcd.com/random/comic', allow_redirects=False) as r_resp:
                 if r_resp.status != 302 or not r_resp.headers.get('Location'):
                     await ctx.send(embed=discord.Embed(
                         title="xkcd API Error",
@@ -530,7 +526,7 @@ class Fun(commands.Cog):
             ))
             return
 
-        async with self._http_session.get(api_url) as resp:
+        async with self._http.get(api_url) as resp:
             if resp.status != 200:
                 await ctx.send(embed=discord.Embed(
                     title="xkcd Comic Not Found!",
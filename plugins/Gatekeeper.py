@@ -1,7 +1,6 @@
 import logging
 import re
 
-import aiohttp
 import discord
 import jwt
 from aiohttp import web
@@ -35,13 +34,8 @@ class Gatekeeper(commands.Cog):
         self._config = bot.config
         self._session_store = bot.session_store
 
-        self._http_session = aiohttp.ClientSession(loop=bot.loop)
-
         LOG.info("Loaded plugin!")
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self._http_session.close())
-
     @commands.group(name="gatekeeper", brief="Base command for Gatekeeper")
     async def gatekeeper(self, ctx: commands.Context):
         pass
@@ -37,6 +37,20 @@ class Giveaway(commands.Cog):
         # super.__cleanup()
         self.giveaway_manager.cleanup()
 
+    @commands.Cog.listener(name="on_raw_reaction_add")
+    async def track_entry(self, payload: discord.RawReactionActionEvent):
+        self.giveaway_manager.update_entrant(payload, True)
+
+    @commands.Cog.listener(name="on_raw_reaction_remove")
+    async def track_withdrawal(self, payload: discord.RawReactionActionEvent):
+        self.giveaway_manager.update_entrant(payload, False)
+
+    @commands.Cog.listener(name="on_ready")
+    async def reconcile_after_reconnect(self):
+        # A fresh gateway session means reaction events may have been dropped, so check entrants against Discord
+        # when each giveaway ends.
+        self.giveaway_manager.mark_all_for_reconcile()
+
     @commands.group(name="giveaways", brief="Control the giveaway plugin", aliases=["giveaway", "ga"])
     @commands.has_permissions(manage_messages=True)
     async def ga(self, ctx: commands.Context):
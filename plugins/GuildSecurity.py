@@ -7,8 +7,10 @@ from discord.ext import commands
 from HuskyBot import HuskyBot
 from libhusky import HuskyConfig
 from libhusky import HuskyConverters
+from libhusky import HuskyEvents
 from libhusky import HuskyUtils
 from libhusky.HuskyStatics import *
+from libhusky.managers.MemberUpdateManager import MemberChange, MemberDiff, MemberUpdateManager
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
@@ -26,8 +28,16 @@ class GuildSecurity(commands.Cog):
         self.bot = bot
         self._config = bot.config
         self._guildsecurity_store = HuskyConfig.get_session_store("guildSecurity")
+
+        self._member_updates = MemberUpdateManager(bot)
+        self._member_updates.subscribe(MemberChange.ROLES, self.protect_roles)
+        self._member_updates.subscribe(MemberChange.ROLES, self.protect_bot_role)
+
         LOG.info("Loaded plugin!")
 
+    def cog_unload(self):
+        self._member_updates.unload_plugin(self)
+
     @commands.Cog.listener(name="on_member_join")
     async def prevent_bot_joins(self, member: discord.Member):
         if not member.bot:
@@ -37,30 +47,28 @@ class GuildSecurity(commands.Cog):
         permitted_bots = self._guildsecurity_store.get('permittedBotList', [])
 
         if member.id not in permitted_bots:
-            await member.kick(reason="[AUTOMATIC KICK - Guild Security] User is not an authorized bot.")
+            reason = "[AUTOMATIC KICK - Guild Security] User is not an authorized bot."
 
-    @commands.Cog.listener(name="on_member_update")
-    async def protect_roles(self, before: discord.Member, after: discord.Member):
-        if before.roles == after.roles:
-            return
+            await member.kick(reason=reason)
+            HuskyEvents.publish(ModerationEvents.KICK, member.guild.id, user_id=member.id, user=str(member),
+                                source=self.__class__.__name__, reason=reason)
+
+    async def protect_roles(self, diff: MemberDiff):
+        after = diff.after
 
         sec_config = self._config.get('guildSecurity', {})
         protected_roles = sec_config.get('protectedRoles', [])
         allowed_promotions = self._guildsecurity_store.get('allowedPromotions', {})
         allowed_promotions_for_user = allowed_promotions.get(after.id, [])
 
-        new_roles = list(set(after.roles).difference(before.roles))
-
-        for r in new_roles:
+        for r in diff.roles_added:
             if r.id in protected_roles and r.id not in allowed_promotions_for_user:
                 await after.remove_roles(r, reason="Unauthorized grant of protected role")
                 LOG.info(f"A protected role {r} was granted to {after} without prior authorization. "
                          f"Removed.")
 
-    @commands.Cog.listener(name="on_member_update")
-    async def protect_bot_role(self, before: discord.Member, after: discord.Member):
-        if before.roles == after.roles:
-            return
+    async def protect_bot_role(self, diff: MemberDiff):
+        after = diff.after
 
         special_roles = self._config.get("specialRoles", {})
 
@@ -69,8 +77,7 @@ class GuildSecurity(commands.Cog):
 
         bot_role = after.guild.get_role(int(special_roles.get('bots')))
 
-        if (bot_role is not None) and (bot_role in after.roles) and (bot_role not in before.roles) \
-                and (not before.bot):
+        if (bot_role is not None) and (bot_role in diff.roles_added) and (not diff.before.bot):
             await after.remove_roles(bot_role, reason="User is not an authorized bot.")
             LOG.info(f"User {after} was granted bot role, but was not a bot. Removing.")
 
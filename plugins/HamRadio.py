@@ -2,7 +2,6 @@ import datetime
 import logging
 import re
 
-import aiohttp
 import discord
 from discord.ext import commands
 
@@ -20,13 +19,10 @@ class HamRadio(commands.Cog):
         self.bot = bot
         self._config = bot.config
 
-        self._http_session = aiohttp.ClientSession(loop=bot.loop)
+        self._http = bot.http_client.for_plugin(self)
 
         LOG.info("Loaded plugin!")
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self._http_session.close())
-
     @commands.command(name="callsign", brief="Get information about a callsign")
     @commands.cooldown(1, 10, commands.BucketType.user)
     async def get_callsign_data(self, ctx: commands.Context, callsign: str):
@@ -58,7 +54,7 @@ class HamRadio(commands.Cog):
             ))
             return
 
-        async with self._http_session.get(self.CALLSIGN_LOOKUP_URL.format(callsign=callsign)) as r:
+        async with self._http.get(self.CALLSIGN_LOOKUP_URL.format(callsign=callsign)) as r:
             if r.status != 200:
                 await ctx.send(embed=discord.Embed(
                     title="Callsign Server Error",
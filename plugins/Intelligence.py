@@ -1,17 +1,34 @@
+import asyncio
 import datetime
 import logging
+import os
 
 import discord
+from aiohttp import web
 from discord.ext import commands
 from discord.http import Route
 
 from HuskyBot import HuskyBot
 from libhusky import HuskyConverters
+from libhusky import HuskyHTTP
 from libhusky import HuskyUtils
 from libhusky.HuskyStatics import *
+from libhusky.managers import ActivityRollupManager as ActivityRollup
+from libhusky.managers.MemberStatsManager import MemberStatsManager
+from libhusky.managers import MessageIndexManager as MessageIndex
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
+# History scans covering less than this many channel-hours run without a progress message.
+SCAN_PROGRESS_MIN_HOURS = 24
+
+HEATMAP_SHADES = " ░▒▓█"
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# (label, maximum membership age in days) for /activity cohorts. Checked in order.
+MEMBER_COHORTS = [("< 1 week", 7), ("1-4 weeks", 28), ("1-6 months", 182), ("6-12 months", 365),
+                  ("1+ years", None)]
+
 
 class Intelligence(commands.Cog):
     """
@@ -21,13 +38,173 @@ class Intelligence(commands.Cog):
     all users, and only expose information provided by the Discord API, not information generated by the bot or bot
     commands.
 
-    All commands here query their information directly from the Discord API in near realtime.
+    All commands here query their information directly from the Discord API in near realtime, with the exception of
+    message statistics, which come from a local index of message metadata (backfilled from the API where needed).
     """
 
     def __init__(self, bot: HuskyBot):
         self.bot = bot
+        self._config = bot.config
+
+        index_path = self._config.get('messageIndex', {}).get('path')
+        if index_path is None:
+            config_prefix = os.environ.get('HUSKYBOT_CONFIG_PREFIX', '')
+            index_path = f"config/{config_prefix + '_' if config_prefix else ''}messageIndex.db"
+
+        self._message_index = MessageIndex.MessageIndexManager(index_path)
+
+        if self.bot.is_ready():
+            self._message_index.start_session()
+
+        activity_config = self._config.get('activity', {})
+        activity_path = activity_config.get('path')
+        if activity_path is None:
+            config_prefix = os.environ.get('HUSKYBOT_CONFIG_PREFIX', '')
+            activity_path = f"config/{config_prefix + '_' if config_prefix else ''}activityRollups.db"
+
+        self._activity = ActivityRollup.ActivityRollupManager(
+            activity_path,
+            retention_days=activity_config.get('retentionDays', 180)
+        )
+
+        self._member_stats = MemberStatsManager(bot)
+
+        self._flush_task = self.bot.loop.create_task(self._flush_local_stores())
+        self._scan_locks = {}
+
         LOG.info("Loaded plugin!")
 
+    def cog_unload(self):
+        HuskyHTTP.get_router().unload_plugin(self)
+        self._flush_task.cancel()
+        self._message_index.cleanup()
+        self._activity.cleanup()
+
+    async def _flush_local_stores(self):
+        while not self.bot.is_closed():
+            await asyncio.sleep(30)
+            self._message_index.flush()
+            await self._activity.flush()
+
+    @commands.Cog.listener(name="on_ready")
+    async def start_index_session(self):
+        self._message_index.start_session()
+
+    @commands.Cog.listener(name="on_resumed")
+    async def resume_index_session(self):
+        self._message_index.start_session()
+
+    @commands.Cog.listener(name="on_disconnect")
+    async def end_index_session(self):
+        self._message_index.end_session()
+
+    @commands.Cog.listener(name="on_message")
+    async def index_message(self, message: discord.Message):
+        if message.guild is None:
+            return
+
+        self._message_index.add(message)
+
+        if not message.author.bot:
+            self._activity.record(message)
+
+    @commands.Cog.listener(name="on_raw_message_delete")
+    async def unindex_message(self, payload: discord.RawMessageDeleteEvent):
+        self._message_index.remove(payload.message_id)
+
+    @commands.Cog.listener(name="on_raw_bulk_message_delete")
+    async def unindex_messages(self, payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            self._message_index.remove(message_id)
+
+    async def _fill_index_gaps(self, ctx: commands.Context, search_context: dict, start_id: int, end_id: int,
+                               always_report: bool = False):
+        """
+        Make sure the message index covers [start_id, end_id) for every channel in a search context, scanning history
+        for any gaps. Long scans (or any scan, with always_report) post a progress message, and scans that run out of
+        time are saved so that /msgindex resume can finish them.
+
+        :return: A tuple of (channels that couldn't be read, whether the scan finished).
+        """
+        index_config = self._config.get('messageIndex', {})
+        scanner = MessageIndex.HistoryScanner(self._message_index,
+                                              concurrency=index_config.get('scanConcurrency', 4),
+                                              requests_per_second=index_config.get('scanRequestsPerSecond', 5))
+
+        lock = self._scan_locks.setdefault(ctx.guild.id, asyncio.Lock())
+
+        async with lock:
+            work = scanner.plan(search_context['channels'], start_id, end_id)
+
+            if not work:
+                return scanner.skipped_channels, True
+
+            def build_progress_embed(title: str, color, footer: str = None):
+                embed = discord.Embed(
+                    title=title,
+                    description=f"Reading message history for `{search_context['name']}` into the message index.\n\n"
+                                f"**Ranges:** {scanner.ranges_done}/{scanner.ranges_total}\n"
+                                f"**Messages read:** {scanner.messages_scanned}",
+                    color=color
+                )
+
+                if footer:
+                    embed.set_footer(text=footer)
+
+                return embed
+
+            # Small gaps (such as a reconnect) are filled in moments. Only post progress for big ones.
+            gap_hours = sum(((gap_end - gap_start) >> 22) / 1000 / 3600 for (_, gap_start, gap_end) in work)
+            progress_message = None
+            progress_task = None
+
+            async def update_progress():
+                while True:
+                    await asyncio.sleep(5)
+
+                    try:
+                        await progress_message.edit(embed=build_progress_embed("Scanning History...", Colors.INFO))
+                    except discord.NotFound:
+                        return
+                    except discord.HTTPException as e:
+                        LOG.warning(f"Could not update history scan progress: {e}")
+
+            try:
+                if always_report or gap_hours >= SCAN_PROGRESS_MIN_HOURS:
+                    progress_message = await ctx.send(embed=build_progress_embed("Scanning History...", Colors.INFO))
+                    progress_task = self.bot.loop.create_task(update_progress())
+
+                complete = await asyncio.wait_for(scanner.run(work), timeout=index_config.get('scanTimeout', 600))
+            except asyncio.TimeoutError:
+                complete = False
+            finally:
+                if progress_task is not None:
+                    progress_task.cancel()
+
+            if not complete:
+                self._message_index.save_pending_scan(ctx.guild.id, search_context['name'],
+                                                      [c.id for c in search_context['channels']], start_id, end_id)
+
+                paused_embed = build_progress_embed(
+                    "History Scan Paused", Colors.WARNING,
+                    "The scan ran out of time or hit errors. Progress has been saved; run /msgindex resume to "
+                    "continue."
+                )
+
+                if progress_message is not None:
+                    await progress_message.edit(embed=paused_embed)
+                else:
+                    await ctx.send(embed=paused_embed)
+
+                return scanner.skipped_channels, False
+
+            self._message_index.clear_pending_scan(ctx.guild.id)
+
+            if progress_message is not None:
+                await progress_message.edit(embed=build_progress_embed("History Scan Complete", Colors.SUCCESS))
+
+            return scanner.skipped_channels, True
+
     @commands.command(name="guildinfo", aliases=["sinfo", "ginfo"], brief="Get information about the current guild")
     @commands.guild_only()
     async def guild_info(self, ctx: commands.Context):
@@ -94,7 +271,8 @@ class Intelligence(commands.Cog):
         role_details.add_field(name="Managed Role", value=role.managed, inline=True)
         role_details.add_field(name="Mentionable", value=role.mentionable, inline=True)
         role_details.add_field(name="Position", value=role.position, inline=True)
-        role_details.add_field(name="Member Count", value=str(len(role.members)), inline=True)
+        role_details.add_field(name="Member Count", value=str(self._member_stats.get_counters(ctx.guild).get_role(role)),
+                               inline=True)
 
         await ctx.send(embed=role_details)
 
@@ -201,7 +379,7 @@ class Intelligence(commands.Cog):
 
     @commands.command(name="msgcount", brief="Get a count of messages in a given context")
     @commands.has_permissions(manage_messages=True)
-    @commands.cooldown(1, 60, commands.BucketType.user)
+    @commands.cooldown(1, 5, commands.BucketType.user)
     async def message_count(self, ctx: commands.Context,
                             search_context: HuskyConverters.ChannelContextConverter = "public",
                             timedelta: HuskyConverters.DateDiffConverter = "24h"):
@@ -214,10 +392,9 @@ class Intelligence(commands.Cog):
 
         Caveats
         -------
-          * It is important to know that this is a *slow* command, because it needs to iterate over every message
-            in the search channels in order to successfully operate. Because of this, the "Typing" indicator will
-            display. Also note that this command may not return accurate results due to the nature of the search system.
-            It should be used for approximation only.
+          * Counts come from the bot's local message index. If the index doesn't cover the whole time range (for
+            example, the bot was offline), the missing part is read from message history first, which can be slow.
+            The "Typing" indicator will display while this happens. Results should be used for approximation only.
 
         Parameters
         ----------
@@ -243,33 +420,29 @@ class Intelligence(commands.Cog):
         if timedelta == "24h":
             timedelta = datetime.timedelta(hours=24)
 
-        message_count = 0
-
         now = datetime.datetime.utcnow()
         search_start = now - timedelta
 
-        async with ctx.typing():
-            for channel in search_context['channels']:
-                if not channel.permissions_for(ctx.me).read_message_history:
-                    LOG.info("I don't have permission to get information for channel %s", channel)
-                    continue
+        start_id = MessageIndex.snowflake_for(search_start)
+        end_id = MessageIndex.snowflake_for(now)
 
-                LOG.info("Getting history for %s", channel)
-                hist = channel.history(limit=None, after=search_start)
+        async with ctx.typing():
+            skipped, complete = await self._fill_index_gaps(ctx, search_context, start_id, end_id)
+            channel_ids = [c.id for c in search_context['channels'] if c not in skipped]
 
-                async for _ in hist:
-                    message_count += 1
+            message_count = self._message_index.count_messages(channel_ids, start_id, end_id)
 
             await ctx.send(embed=discord.Embed(
                 title="Message Count Report",
                 description=f"Since `{search_start.strftime(DATETIME_FORMAT)}`, the channel context "
-                            f"`{search_context['name']}` has seen about **{message_count} messages**.",
+                            f"`{search_context['name']}` has seen {'about' if complete else 'at least'} "
+                            f"**{message_count} messages**.",
                 color=Colors.INFO
             ))
 
     @commands.command(name="activeusercount", brief="Get a count of active users on the guild", aliases=["auc"])
     @commands.has_permissions(view_audit_log=True)
-    @commands.cooldown(1, 60, commands.BucketType.user)
+    @commands.cooldown(1, 5, commands.BucketType.user)
     async def active_user_count(self, ctx: commands.Context,
                                 search_context: HuskyConverters.ChannelContextConverter = "all",
                                 delta: HuskyConverters.DateDiffConverter = "24h",
@@ -286,10 +459,8 @@ class Intelligence(commands.Cog):
 
         Caveats
         -------
-          * It is important to know that this is a *slow* command, because it needs to iterate over every message
-            in the search channels in order to successfully operate. Because of this, the "Typing" indicator will
-            display. Also note that this command may not return accurate results due to the nature of the search system.
-            It should be used for approximation only.
+          * Like /msgcount, this reads from the bot's local message index and only falls back to message history for
+            time ranges the index doesn't cover. Results should be used for approximation only.
 
         Parameters
         ----------
@@ -311,38 +482,314 @@ class Intelligence(commands.Cog):
         if delta == "24h":
             delta = datetime.timedelta(hours=24)
 
-        message_counts = {}
-        active_user_count = 0
-
         now = datetime.datetime.utcnow()
         search_start = now - delta
 
-        async with ctx.typing():
-            for channel in search_context['channels']:
-                if not channel.permissions_for(ctx.me).read_message_history:
-                    LOG.info("I don't have permission to get information for channel %s", channel)
-                    continue
-
-                LOG.info("Getting history for %s", channel)
-                hist = channel.history(limit=None, after=search_start)
-
-                async for m in hist:  # type: discord.Message
-                    if m.author.bot:
-                        continue
+        start_id = MessageIndex.snowflake_for(search_start)
+        end_id = MessageIndex.snowflake_for(now)
 
-                    message_counts[m.author.id] = message_counts.get(m.author.id, 0) + 1
+        async with ctx.typing():
+            skipped, complete = await self._fill_index_gaps(ctx, search_context, start_id, end_id)
+            channel_ids = [c.id for c in search_context['channels'] if c not in skipped]
 
-            for user in message_counts:
-                if message_counts[user] >= threshold:
-                    active_user_count += 1
+            message_counts = self._message_index.count_by_author(channel_ids, start_id, end_id)
+            active_user_count = sum(1 for count in message_counts.values() if count >= threshold)
 
         await ctx.send(embed=discord.Embed(
             title="Active User Count Report",
             description=f"Since `{search_start.strftime(DATETIME_FORMAT)}`, the channel context "
                         f"`{search_context['name']}` has seen about **{active_user_count} active "
                         f"{'users' if threshold > 1 else 'user'}** (sending at least {threshold} "
-                        f"{'messages' if threshold > 1 else 'message'}).",
+                        f"{'messages' if threshold > 1 else 'message'})."
+                        + ("" if complete else "\n\nThe history scan did not finish, so this may be an undercount."),
+            color=Colors.INFO
+        ))
+
+    @commands.group(name="msgindex", brief="Manage the local message index")
+    @commands.has_permissions(manage_guild=True)
+    async def message_index(self, ctx: commands.Context):
+        """
+        The message index is a local record of message IDs, channels, and authors used to answer /msgcount and
+        /activeusercount without reading through channel history.
+
+        Please see the below commands for managing the index.
+        """
+
+        pass
+
+    @message_index.command(name="status", brief="Get statistics about the message index")
+    async def message_index_status(self, ctx: commands.Context):
+        """
+        Show how many messages, live sessions, and backfilled ranges are in the local message index.
+        """
+        stats = self._message_index.get_stats()
+
+        await ctx.send(embed=discord.Embed(
+            title="Message Index Status",
+            description=f"The message index currently holds **{stats['messages']} messages**, collected over "
+                        f"{stats['sessions']} live sessions and {stats['backfills']} backfilled ranges.",
+            color=Colors.INFO
+        ))
+
+    @message_index.command(name="backfill", brief="Fill the message index from history")
+    async def message_index_backfill(self, ctx: commands.Context,
+                                     search_context: HuskyConverters.ChannelContextConverter = "all",
+                                     delta: HuskyConverters.DateDiffConverter = "30d"):
+        """
+        Read message history into the index for a channel context (see /help msgcount), so later queries over that
+        time range are answered immediately. Only ranges the index doesn't already cover are read.
+
+        This only needs to be run once (for example, when the bot is first set up), and may take a while on busy
+        guilds.
+
+        Parameters
+        ----------
+            ctx             :: Discord context <!nodoc>
+            search_context  :: A search context, as in /msgcount. Default "all".
+            delta           :: How far back to backfill, in ##d##h##m##s format. Default 30d.
+
+        Examples
+        --------
+            /msgindex backfill all 90d  :: Index the last 90 days of every channel.
+        """
+        if search_context == "all":
+            converter = HuskyConverters.ChannelContextConverter()
+            search_context = await converter.convert(ctx, "all")
+
+        if delta == "30d":
+            delta = datetime.timedelta(days=30)
+
+        now = datetime.datetime.utcnow()
+        start_id = MessageIndex.snowflake_for(now - delta)
+        end_id = MessageIndex.snowflake_for(now)
+
+        async with ctx.typing():
+            skipped, complete = await self._fill_index_gaps(ctx, search_context, start_id, end_id)
+
+        if not complete:
+            return
+
+        await ctx.send(embed=discord.Embed(
+            title="Message Index Backfilled",
+            description=f"The message index now covers `{search_context['name']}` since "
+                        f"`{(now - delta).strftime(DATETIME_FORMAT)}`."
+                        + (f"\n\n{len(skipped)} channels could not be read." if skipped else ""),
+            color=Colors.SUCCESS
+        ))
+
+    @message_index.command(name="resume", brief="Resume an unfinished history scan")
+    async def message_index_resume(self, ctx: commands.Context):
+        """
+        History scans that run out of time save their progress. This command picks the last unfinished scan for this
+        guild back up, reading only what's still missing.
+        """
+        pending = self._message_index.get_pending_scan(ctx.guild.id)
+
+        if pending is None:
+            await ctx.send(embed=discord.Embed(
+                title="Nothing to resume",
+                description="There is no unfinished history scan for this guild.",
+                color=Colors.WARNING
+            ))
+            return
+
+        channels = [c for c in (ctx.guild.get_channel(i) for i in pending['channel_ids']) if c is not None]
+        search_context = {"name": pending['name'], "channels": channels}
+
+        # The progress message reports the outcome.
+        async with ctx.typing():
+            await self._fill_index_gaps(ctx, search_context, pending['start_id'], pending['end_id'],
+                                        always_report=True)
+
+    @commands.group(name="activity", brief="Analyze guild activity over time")
+    @commands.has_permissions(manage_messages=True)
+    async def activity(self, ctx: commands.Context):
+        """
+        Activity commands summarize message counts collected by the bot as messages arrive (bots excluded). They don't
+        read message history, so they return instantly, even over months of data.
+
+        Please see the below commands for the available reports.
+        """
+
+        pass
+
+    @activity.command(name="heatmap", brief="Show activity by hour of the week")
+    async def activity_heatmap(self, ctx: commands.Context,
+                               search_context: HuskyConverters.ChannelContextConverter = "public", weeks: int = 4):
+        """
+        Show a heatmap of messages by day of week and hour (in UTC) for a channel context, summed over the last few
+        weeks. Darker blocks mean more messages.
+
+        Parameters
+        ----------
+            ctx             :: Discord context <!nodoc>
+            search_context  :: A search context, as in /msgcount. Default "public".
+            weeks           :: How many weeks back to include. Default 4.
+
+        Examples
+        --------
+            /activity heatmap public 12   :: Show a heatmap of public channels over the last 12 weeks.
+            /activity heatmap #general 1  :: Show a heatmap of #general over the last week.
+        """
+        if search_context == "public":
+            converter = HuskyConverters.ChannelContextConverter()
+            search_context = await converter.convert(ctx, "public")
+
+        if not 1 <= weeks <= 52:
+            raise commands.BadArgument("The `weeks` argument must be between 1 and 52.")
+
+        end = ActivityRollup.current_hour() + 1
+        start = end - weeks * ActivityRollup.HOURS_PER_WEEK
+
+        heatmap = await self._activity.weekly_heatmap(ctx.guild.id, ActivityRollup.SCOPE_CHANNEL, start, end,
+                                                      [c.id for c in search_context['channels']])
+        peak = max(heatmap)
+
+        header = [" "] * 24
+        for hour in range(0, 24, 6):
+            header[hour:hour + 2] = f"{hour:02}"
+
+        lines = ["    " + "".join(header)]
+        for day in range(7):
+            row = heatmap[day * 24:(day + 1) * 24]
+            shades = [HEATMAP_SHADES[0] if not v else HEATMAP_SHADES[1 + min(3, 4 * v // (peak + 1))] for v in row]
+            lines.append(f"{WEEKDAY_NAMES[day]} " + "".join(shades))
+
+        busiest = max(range(ActivityRollup.HOURS_PER_WEEK), key=lambda h: heatmap[h])
+
+        embed = discord.Embed(
+            title="Activity Heatmap",
+            description=f"Messages in `{search_context['name']}` over the last {weeks} week(s), by hour (UTC).\n"
+                        "```\n" + "\n".join(lines) + "\n```",
+            color=Colors.INFO
+        )
+
+        embed.add_field(name="Total Messages", value=str(sum(heatmap)), inline=True)
+
+        if peak:
+            embed.add_field(name="Busiest Hour",
+                            value=f"{WEEKDAY_NAMES[busiest // 24]} {busiest % 24:02}:00 ({peak} messages)",
+                            inline=True)
+
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def _format_trend(current: int, previous: int) -> str:
+        if previous == 0:
+            return "new" if current else "-"
+
+        return f"{(current - previous) / previous * 100:+.0f}%"
+
+    @activity.command(name="channels", brief="Show the most active channels")
+    async def activity_channels(self, ctx: commands.Context, days: int = 7, count: int = 10):
+        """
+        List the busiest channels over the last few days, with the change from the period before it.
+
+        Parameters
+        ----------
+            ctx    :: Discord context <!nodoc>
+            days   :: The length of the period to look at. Default 7.
+            count  :: How many channels to list. Default 10.
+        """
+        if not 1 <= days <= 90:
+            raise commands.BadArgument("The `days` argument must be between 1 and 90.")
+
+        end = ActivityRollup.current_hour() + 1
+        start = end - days * 24
+
+        channel_ids = [c.id for c in ctx.guild.text_channels]
+        current = await self._activity.totals(ctx.guild.id, ActivityRollup.SCOPE_CHANNEL, start, end, channel_ids)
+        previous = await self._activity.totals(ctx.guild.id, ActivityRollup.SCOPE_CHANNEL, start - days * 24, start,
+                                               channel_ids)
+
+        top = sorted(current.items(), key=lambda kv: kv[1], reverse=True)[:max(1, min(count, 25))]
+
+        lines = [f"{i + 1}. <#{cid}> - **{total}** messages ({self._format_trend(total, previous.get(cid, 0))})"
+                 for i, (cid, total) in enumerate(top)]
+
+        await ctx.send(embed=discord.Embed(
+            title="Most Active Channels",
+            description=f"Over the last {days} day(s), compared to the {days} day(s) before:\n\n"
+                        + ("\n".join(lines) if lines else "No activity has been recorded yet."),
+            color=Colors.INFO
+        ))
+
+    @activity.command(name="cohorts", brief="Show activity by member age")
+    async def activity_cohorts(self, ctx: commands.Context, days: int = 7):
+        """
+        Break recent activity down by how long members have been on the guild, showing active members and messages
+        for each group, with the change from the period before.
+
+        Parameters
+        ----------
+            ctx   :: Discord context <!nodoc>
+            days  :: The length of the period to look at. Default 7.
+        """
+        if not 1 <= days <= 90:
+            raise commands.BadArgument("The `days` argument must be between 1 and 90.")
+
+        end = ActivityRollup.current_hour() + 1
+        start = end - days * 24
+
+        current = await self._activity.totals(ctx.guild.id, ActivityRollup.SCOPE_USER, start, end)
+        previous = await self._activity.totals(ctx.guild.id, ActivityRollup.SCOPE_USER, start - days * 24, start)
+
+        now = datetime.datetime.utcnow()
+        labels = [label for (label, _) in MEMBER_COHORTS] + ["Left the guild"]
+        stats = {label: {"users": 0, "messages": 0, "previous": 0} for label in labels}
+
+        for user_id in set(current.keys()) | set(previous.keys()):
+            member = ctx.guild.get_member(user_id)
+
+            if member is None or member.joined_at is None:
+                label = labels[-1]
+            else:
+                age = (now - member.joined_at).days
+                label = next(lbl for (lbl, limit) in MEMBER_COHORTS if limit is None or age < limit)
+
+            if user_id in current:
+                stats[label]["users"] += 1
+                stats[label]["messages"] += current[user_id]
+
+            stats[label]["previous"] += previous.get(user_id, 0)
+
+        embed = discord.Embed(
+            title="Activity by Member Age",
+            description=f"Active members and messages over the last {days} day(s), compared to the {days} day(s) "
+                        f"before.",
             color=Colors.INFO
+        )
+
+        for label in labels:
+            cohort = stats[label]
+            embed.add_field(name=label,
+                            value=f"{cohort['users']} members\n{cohort['messages']} messages "
+                                  f"({self._format_trend(cohort['messages'], cohort['previous'])})",
+                            inline=True)
+
+        await ctx.send(embed=embed)
+
+    @activity.command(name="rebuild", brief="Rebuild activity data from the message index")
+    @commands.has_permissions(manage_guild=True)
+    async def activity_rebuild(self, ctx: commands.Context):
+        """
+        Replace all activity data with counts computed from the local message index (see /msgindex). This is useful
+        after a large /msgindex backfill, and doesn't read any message history itself.
+        """
+        channel_ids = [c.id for c in ctx.guild.channels]
+
+        channel_counts = await self._message_index.hourly_counts("channel_id", channel_ids)
+        user_counts = await self._message_index.hourly_counts("author_id", channel_ids)
+
+        await self._activity.rebuild(ctx.guild.id, channel_counts, user_counts)
+
+        counts = await self._activity.count_keys(ctx.guild.id)
+
+        await ctx.send(embed=discord.Embed(
+            title="Activity Data Rebuilt",
+            description=f"Activity data now covers {counts.get(ActivityRollup.SCOPE_CHANNEL, 0)} channels and "
+                        f"{counts.get(ActivityRollup.SCOPE_USER, 0)} users.",
+            color=Colors.SUCCESS
         ))
 
     @commands.command(name="prunesim", brief="Get a number of users scheduled for pruning")
@@ -395,23 +842,27 @@ class Intelligence(commands.Cog):
             /help activeusercount  :: Get a count of active users on the guild.
         """
 
-        breakdown = {}
-
-        for u in ctx.guild.members:  # type: discord.Member
-            breakdown[u.status] = breakdown.get(u.status, 0) + 1
+        counters = self._member_stats.get_counters(ctx.guild)
 
         embed = discord.Embed(
             title=Emojis.WAVE + " User Count Report",
-            description=f"{ctx.guild.name} currently has **{sum(breakdown.values())} total users**.\n\n"
-                        f"**Online Users:** {breakdown[discord.Status.online]}\n"
-                        f"**Idle Users:** {breakdown[discord.Status.idle]}\n"
-                        f"**DND Users:** {breakdown[discord.Status.dnd]}\n"
-                        f"**Offline Users:** {breakdown[discord.Status.offline]}",
+            description=f"{ctx.guild.name} currently has **{counters.total} total users** "
+                        f"({counters.humans} humans, {counters.bots} bots).\n\n"
+                        f"**Online Users:** {counters.get_status(discord.Status.online)}\n"
+                        f"**Idle Users:** {counters.get_status(discord.Status.idle)}\n"
+                        f"**DND Users:** {counters.get_status(discord.Status.dnd)}\n"
+                        f"**Offline Users:** {counters.get_status(discord.Status.offline)}",
             color=Colors.INFO
         )
 
         await ctx.send(embed=embed)
 
+    @HuskyHTTP.register("/intelligence/members", ["GET"])
+    async def member_metrics(self, request: web.BaseRequest):
+        HuskyHTTP.check_token(request, self._config.get('httpConfig', {}).get('apiToken'))
+
+        return web.json_response(self._member_stats.get_stats())
+
     @commands.command(name="invitespy", brief="Find information about Guild invite", aliases=["invspy"])
     @commands.has_permissions(view_audit_log=True)
     async def invitespy(self, ctx: commands.Context, fragment: HuskyConverters.InviteLinkConverter):
@@ -43,7 +43,7 @@ class LaMetric(commands.Cog):
         self.bot = bot
         self._config = bot.config
 
-        self._api = LaMetricApi.LaMetricApi(loop=bot.loop)
+        self._api = LaMetricApi.LaMetricApi(bot.http_client.for_plugin(self))
 
         self._pending_registrations = {}
         '''
@@ -53,9 +53,6 @@ class LaMetric(commands.Cog):
 
         LOG.info("Loaded plugin!")
 
-    def __cleanup(self):
-        self._api.cleanup()
-
     async def update_lametric_counts(self, guild: discord.Guild):
         lametric_conf = self._config.get('lametric', {})
         devices = lametric_conf.setdefault('devices', {})
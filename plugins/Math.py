@@ -1,5 +1,9 @@
+import asyncio
+import io
 import json
 import logging
+import os
+import re
 
 import aiohttp
 import discord
@@ -7,9 +11,29 @@ from discord.ext import commands
 
 from HuskyBot import HuskyBot
 from libhusky.HuskyStatics import *
+from libhusky.managers.RenderCacheManager import RenderCacheManager, make_key
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
+RTEX_API_URL = "http://rtex.probablyaweb.site/api/v2"
+
+# Default size budget (in bytes) for the on-disk cache of rendered TeX.
+TEX_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
+
+class TexRenderError(Exception):
+    pass
+
+
+def normalize_tex(latex: str) -> str:
+    """
+    Normalize whitespace that TeX ignores anyway, so trivially different copies of a formula share a cache entry.
+    """
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in latex.strip().splitlines()]
+
+    # Any run of blank lines is a single paragraph break.
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
 
 # noinspection PyMethodMayBeStatic
 class Math(commands.Cog):
@@ -17,12 +41,37 @@ class Math(commands.Cog):
         self.bot = bot
         self._config = bot.config
 
-        self._http_session = aiohttp.ClientSession(loop=bot.loop)
+        self._http = bot.http_client.for_plugin(self)
+
+        cache_config = self._config.get('texCache', {})
+        cache_path = cache_config.get('path')
+        if cache_path is None:
+            config_prefix = os.environ.get('HUSKYBOT_CONFIG_PREFIX', '')
+            cache_path = f"config/{config_prefix + '_' if config_prefix else ''}texCache"
+
+        self._tex_cache = RenderCacheManager(cache_path, cache_config.get('maxSize', TEX_CACHE_MAX_SIZE))
 
         LOG.info("Loaded plugin!")
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self._http_session.close())
+    def get_tex_cache_stats(self) -> dict:
+        return self._tex_cache.get_stats()
+
+    async def _render_tex(self, latex_wrapped: str) -> bytes:
+        try:
+            async with self._http.post(RTEX_API_URL, data={"code": latex_wrapped, "format": "png"}) as response:
+                response_data = json.loads(await response.text())
+
+                if response.status != 200 or response_data.get('status') != 'success':
+                    raise TexRenderError(f"Render failed (HTTP {response.status}, "
+                                         f"status {response_data.get('status')})")
+
+            async with self._http.get(RTEX_API_URL + "/" + response_data['filename']) as response:
+                if response.status != 200:
+                    raise TexRenderError(f"Could not download rendered image (HTTP {response.status})")
+
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            raise TexRenderError(f"Rendering service request failed: {type(e).__name__}") from e
 
     @commands.command(name="latex", brief="Generate and render some LaTeX code [EXPERIMENTAL]")
     @commands.cooldown(1, 10, commands.BucketType.user)
@@ -46,8 +95,6 @@ class Math(commands.Cog):
         TeX rendering is handled by DXSmiley's rtex (https://github.com/DXsmiley/rtex) - http://rtex.probablyaweb.site/
         """
 
-        api_url = "http://rtex.probablyaweb.site/api/v2"
-
         if latex.startswith('```') and latex.endswith("```"):
             latex = latex[3:-3]
 
@@ -57,37 +104,37 @@ class Math(commands.Cog):
         latex_wrapped = f"\\documentclass{{article}}\n\n" \
                         f"\\usepackage{{color}} \\color{{white}}\n" \
                         f"\\begin{{document}}\n\n" \
-                        f"{latex}\n\n" \
+                        f"{normalize_tex(latex)}\n\n" \
                         f"\\pagenumbering{{gobble}}\n" \
                         f" \\end{{document}}"
 
-        response = await self._http_session.post(api_url, data={
-            "code": latex_wrapped,
-            "format": "png"
-        })
-
-        response_data = json.loads(await response.text())
-        was_successful = response.status == 200 and response_data.get('status') == 'success'
-
-        response.close()
+        try:
+            image = await self._tex_cache.get_or_render(make_key(latex_wrapped, "png"),
+                                                        lambda: self._render_tex(latex_wrapped))
+        except TexRenderError as e:
+            LOG.info(f"TeX render failed: {e}")
+            image = None
 
         embed = discord.Embed(
             title="Rendered LaTeX",
-            color=Colors.INFO if was_successful else Colors.DANGER
+            color=Colors.INFO if image is not None else Colors.DANGER
         )
 
-        if was_successful:
-            embed.set_footer(text="Rendered by rTEX API",
-                             icon_url="http://rtex.probablyaweb.site/static/favicon.png")
-            embed.set_image(url=api_url + "/" + response_data['filename'])
-        else:
+        if image is None:
             embed.add_field(
                 name="Rendering Error",
                 value="There was an issue rendering your TeX. Please check your code to ensure that it is error-free. "
                       "You may use [the online implementation](http://rtex.probablyaweb.site/) to try out your TeX "
                       "code.\n\nThe rendering service may also be offline or experiencing difficulties.")
 
-        await ctx.send(embed=embed)
+            await ctx.send(embed=embed)
+            return
+
+        embed.set_footer(text="Rendered by rTEX API",
+                         icon_url="http://rtex.probablyaweb.site/static/favicon.png")
+        embed.set_image(url="attachment://latex.png")
+
+        await ctx.send(embed=embed, file=discord.File(io.BytesIO(image), filename="latex.png"))
 
 
 def setup(bot: HuskyBot):
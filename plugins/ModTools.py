@@ -1,18 +1,42 @@
+import asyncio
 import datetime
+import io
+import json
 import logging
 import re
+import time
+import typing
 
 import discord
+from aiohttp import web
 from discord.ext import commands
 
 from HuskyBot import HuskyBot
 from libhusky import HuskyConverters
+from libhusky import HuskyEvents
+from libhusky import HuskyHTTP
 from libhusky import HuskyUtils
 from libhusky.HuskyStatics import *
+from libhusky.managers.BanManager import BanManager
+from libhusky.managers.CleanupManager import CleanupFilter, CleanupJob
+from libhusky.managers.MemberUpdateManager import MemberChange, MemberDiff, MemberUpdateManager
 from libhusky.managers.MuteManager import MuteManager
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
+# Bans are all on one per-guild rate limit bucket, which discord.py already waits on. This just keeps a handful of
+# requests queued against it, rather than one (slow) or thousands (a burst of 429s).
+MASS_BAN_CONCURRENCY = 5
+
+# Largest ID list file /massban will read.
+MASS_BAN_MAX_FILE_SIZE = 1024 * 1024
+
+# Idle moderation feeds get a heartbeat this often (in seconds), so proxies and clients can tell the feed is alive.
+EVENT_FEED_HEARTBEAT = 30
+
+# Default limit on how many moderation feeds may be open at once.
+EVENT_FEED_MAX_SUBSCRIPTIONS = 8
+
 
 # noinspection PyMethodMayBeStatic
 class ModTools(commands.Cog):
@@ -31,16 +55,27 @@ class ModTools(commands.Cog):
         self._session_store = self.bot.session_store
 
         self._mute_manager = MuteManager(self.bot)
+        self._ban_manager = BanManager(self.bot)
+
+        self._member_updates = MemberUpdateManager(self.bot)
+        self._member_updates.subscribe(MemberChange.NICK, self.nicklock_check)
+
+        # Moderation event feed subscriptions held open by HTTP clients.
+        self._feed_subscriptions = set()
 
         LOG.info("Loaded plugin!")
 
     def cog_unload(self):
+        self._member_updates.unload_plugin(self)
         self._mute_manager.cleanup()
 
-    @commands.Cog.listener(name="on_member_update")
-    async def nicklock_check(self, before: discord.Member, after: discord.Member):
-        if before.nick == after.nick:
-            return
+        for subscription in list(self._feed_subscriptions):
+            HuskyEvents.get_bus().unsubscribe(subscription)
+
+        HuskyHTTP.get_router().unload_plugin(self)
+
+    async def nicklock_check(self, diff: MemberDiff):
+        before, after = diff.before, diff.after
 
         locked_users = self._config.get("nicknameLocks", {})
 
@@ -167,9 +202,7 @@ class ModTools(commands.Cog):
             ))
             return
 
-        ban_entry = discord.utils.get(await ctx.guild.bans(), user=user)
-
-        if ban_entry is not None:
+        if await self._ban_manager.is_banned(ctx.guild, user):
             await ctx.send(embed=discord.Embed(
                 title="Moderator Toolkit",
                 description=f"How can one kill which is already dead? User `{user}` was already banned from the guild.",
@@ -177,8 +210,9 @@ class ModTools(commands.Cog):
             ))
             return
 
-        await ctx.guild.ban(user, reason=f"[{'HACKBAN | ' if not in_guild else ''}By {ctx.author}] {reason}",
-                            delete_message_days=1)
+        ban_reason = f"[{'HACKBAN | ' if not in_guild else ''}By {ctx.author}] {reason}"
+        await ctx.guild.ban(user, reason=ban_reason, delete_message_days=1)
+        self._ban_manager.record_ban(ctx.guild, user, ban_reason, ctx.author)
 
         await ctx.send(embed=discord.Embed(
             title=Emojis.BAN + " User banned!",
@@ -405,6 +439,113 @@ class ModTools(commands.Cog):
             color=Colors.SUCCESS
         ))
 
+    async def _resolve_mass_mute_targets(self, ctx: commands.Context, users: tuple):
+        converter = commands.MemberConverter()
+        members = []
+        failed = []
+
+        for user_selector in users:
+            try:
+                member = await converter.convert(ctx, user_selector)
+
+                if member == ctx.author:
+                    raise commands.BadArgument("IS_SELF")
+
+                if member == ctx.bot.user:
+                    raise commands.BadArgument("IS_BOT")
+
+                if member.top_role.position >= ctx.author.top_role.position:
+                    raise commands.BadArgument("IS_ABOVE_USER")
+
+                if member not in members:
+                    members.append(member)
+            except commands.BadArgument as e:
+                failed.append(f"{user_selector} - {''.join(e.args) if e.args else 'NOT_FOUND'}")
+
+        return members, failed
+
+    def _build_mass_mute_report(self, title: str, action: str, succeeded: list, failed: list, context: str):
+        embed = discord.Embed(
+            title=title,
+            description=f"{len(succeeded)} users {action} from {context}.\n"
+                        f"{len(failed)} could not be {action}. Nonexistent user or other error.",
+            color=Colors.INFO
+        )
+
+        if 0 < len(failed) < 5:
+            embed.add_field(name="Failed", value="\n".join(failed))
+
+        return embed
+
+    @commands.command(name="massmute", brief="Mute a large number of users at once", aliases=["mmute"])
+    @commands.has_permissions(ban_members=True)
+    async def mass_mute(self, ctx: commands.Context, channel: typing.Optional[discord.TextChannel],
+                        time: HuskyConverters.DateDiffConverter, reason: str, *users):
+        """
+        Mute a list of users at once, either from the entire guild or (if a channel is given first) from a single
+        channel. Mutes are applied concurrently, and a single report is posted when the batch is done.
+
+        Users who are already muted in the same place are skipped. Use /mute or /globalmute to update those.
+
+        Parameters
+        ----------
+            ctx      :: Discord context <!nodoc>
+            channel  :: Optional. A channel to mute from. If omitted, the users are muted from the guild.
+            time     :: A ##d##h##m##s string to represent mute time, or 0/perm/- for permanent.
+            reason   :: The reason to store for mutes, must be "in quotes" if containing spaces.
+            users    :: A list of users (space separated) to mute.
+
+        Examples
+        --------
+            /massmute 1h "raid participants" 123 345 SomeUser     :: Mute three users from the guild for an hour
+            /massmute #general perm "off-topic spam" 123 456      :: Mute two users from #general permanently
+
+        See Also
+        --------
+            /massunmute  :: Reverse a mass mute
+        """
+        mute_until = None
+        if time is not None:
+            mute_until = int((datetime.datetime.utcnow() + time).timestamp())
+
+        members, failed = await self._resolve_mass_mute_targets(ctx, users)
+
+        async with ctx.typing():
+            succeeded, mute_failed = await self._mute_manager.mass_mute(ctx.guild, members, channel, reason,
+                                                                        mute_until, ctx.author)
+
+        await ctx.send(embed=self._build_mass_mute_report(
+            Emojis.MUTE + " Mass Mute Report", "muted", succeeded, failed + mute_failed,
+            "the guild" if channel is None else channel.mention
+        ))
+
+    @commands.command(name="massunmute", brief="Unmute a large number of users at once", aliases=["munmute"])
+    @commands.has_permissions(ban_members=True)
+    async def mass_unmute(self, ctx: commands.Context, channel: typing.Optional[discord.TextChannel], *users):
+        """
+        Unmute a list of users at once, either from the entire guild or (if a channel is given first) from a single
+        channel. This is the reverse of /massmute, but works on any existing mute.
+
+        Parameters
+        ----------
+            ctx      :: Discord context <!nodoc>
+            channel  :: Optional. A channel to unmute from. If omitted, guild mutes are lifted.
+            users    :: A list of users (space separated) to unmute.
+
+        Examples
+        --------
+            /massunmute 123 345 SomeUser  :: Lift guild mutes for three users
+        """
+        members, failed = await self._resolve_mass_mute_targets(ctx, users)
+
+        async with ctx.typing():
+            succeeded, unmute_failed = await self._mute_manager.mass_unmute(ctx.guild, members, channel, ctx.author)
+
+        await ctx.send(embed=self._build_mass_mute_report(
+            Emojis.UNMUTE + " Mass Unmute Report", "unmuted", succeeded, failed + unmute_failed,
+            "the guild" if channel is None else channel.mention
+        ))
+
     @commands.command(name="roleping", brief="Ping all users with a certain role")
     @commands.has_permissions(manage_roles=True)
     async def roleping(self, ctx: commands.Context, target: discord.Role, *, message: str):
@@ -467,6 +608,10 @@ class ModTools(commands.Cog):
 
         The "lookback" value is the number of messages to search for messages that match the defined filters. If no
         filters are defined, then *all* messages match, and lookback will be the total number of messages to delete.
+
+        Messages are deleted in batches of 100 while history is still being read. Messages older than 14 days can't be
+        deleted in bulk, so they're removed one at a time (roughly one per second). Long cleanups post a progress
+        message, which is removed shortly after the cleanup finishes.
         """
 
         # BE VERY CAREFUL TOUCHING THIS METHOD!
@@ -495,19 +640,44 @@ class ModTools(commands.Cog):
                 else:
                     raise KeyError(f"Filter {filter_candidate[0]} is not valid!")
 
-            def dynamic_check(message: discord.Message):
-                if len(user_list) > 0 and message.author.id not in user_list:
-                    return False
+            # Compiled once here, rather than for every message checked.
+            return CleanupFilter(user_list, regex_list)
+
+        progress_message = None
+
+        def build_progress_embed(job: CleanupJob, title: str, color):
+            embed = discord.Embed(
+                title=title,
+                description=f"Checked **{job.scanned}** of {lookback} messages, and deleted **{job.deleted}**.",
+                color=color
+            )
 
-                for regex in regex_list:
-                    if len(regex_list) > 0 and re.search(regex, message.content) is None:
-                        return False
+            if job.queued_old:
+                embed.add_field(name="Older Messages",
+                                value=f"{job.queued_old} matching messages are more than 14 days old, and have to be "
+                                      f"deleted one at a time.",
+                                inline=False)
 
-                return True
+            if job.failed:
+                embed.add_field(name="Failed", value=f"{job.failed} messages could not be deleted.", inline=False)
 
-            return dynamic_check
+            return embed
 
-        await ctx.channel.purge(limit=lookback + 1, check=generate_cleanup_filter(), bulk=True)
+        async def report_progress(job: CleanupJob):
+            nonlocal progress_message
+
+            if progress_message is None:
+                progress_message = await ctx.send(embed=build_progress_embed(job, "Cleaning Up...", Colors.INFO))
+            else:
+                await progress_message.edit(embed=build_progress_embed(job, "Cleaning Up...", Colors.INFO))
+
+        # The extra message is the command itself.
+        cleanup_job = CleanupJob(ctx.channel, lookback + 1, generate_cleanup_filter())
+        await cleanup_job.run(progress_callback=report_progress)
+
+        if progress_message is not None:
+            await progress_message.edit(embed=build_progress_embed(cleanup_job, "Cleanup Complete", Colors.SUCCESS),
+                                        delete_after=30)
 
     @commands.command(name="editban", brief="Edit a banned user's reason")
     @commands.has_permissions(ban_members=True)
@@ -534,7 +704,7 @@ class ModTools(commands.Cog):
         # noinspection PyTypeChecker
         user: discord.User = user
 
-        ban_entry = discord.utils.get(await ctx.guild.bans(), user=user)
+        ban_entry = await self._ban_manager.get_ban(ctx.guild, user)
 
         if ban_entry is None:
             await ctx.send(embed=discord.Embed(
@@ -562,6 +732,7 @@ class ModTools(commands.Cog):
 
         await ctx.guild.unban(user, reason=f"Ban reason edit by {ctx.author}")
         await ctx.guild.ban(user, reason=reason, delete_message_days=0)
+        self._ban_manager.record_ban(ctx.guild, user, reason, ctx.author)
 
         embed = discord.Embed(
             description=f"A ban reason change was requested by {ctx.author}.",
@@ -782,12 +953,76 @@ class ModTools(commands.Cog):
 
         await HuskyUtils.send_to_keyed_channel(ctx.bot, ChannelKeys.STAFF_LOG, log_entry)
 
+    async def _read_mass_ban_files(self, message: discord.Message) -> list:
+        selectors = []
+
+        for attachment in message.attachments:  # type: discord.Attachment
+            if attachment.size > MASS_BAN_MAX_FILE_SIZE:
+                raise commands.BadArgument(f"The file `{attachment.filename}` is too large to be a list of users.")
+
+            data = await attachment.read()
+            selectors.extend(s for s in re.split(r'[\s,]+', data.decode('utf-8', errors='ignore')) if s)
+
+        return selectors
+
+    def _resolve_mass_ban_targets(self, ctx: commands.Context, selectors: list):
+        """
+        Resolve selectors to ban targets without any API calls. IDs and mentions that aren't members are hackbanned
+        as bare objects (Discord rejects IDs that don't exist), and names are looked up in a name index built once.
+        """
+        targets = {}
+        failed = []
+        name_index = None
+
+        for user_selector in selectors:
+            match = re.match(r'^(?:<@!?)?([0-9]{15,21})>?$', user_selector)
+
+            if match is not None:
+                user_id = int(match.group(1))
+                user = ctx.guild.get_member(user_id) or discord.Object(id=user_id)
+            else:
+                if name_index is None:
+                    name_index = {}
+                    for member in ctx.guild.members:
+                        name_index.setdefault(member.display_name, member)
+                        name_index.setdefault(member.name, member)
+                        name_index[str(member)] = member
+
+                user = name_index.get(user_selector)
+
+                if user is None:
+                    failed.append(f"{user_selector} - NOT_FOUND")
+                    continue
+
+            if user.id in targets:
+                continue
+
+            if user.id == ctx.author.id:
+                failed.append(f"{user_selector} - IS_SELF")
+                continue
+
+            if user.id == ctx.bot.user.id:
+                failed.append(f"{user_selector} - IS_BOT")
+                continue
+
+            if isinstance(user, discord.Member) and user.top_role.position >= ctx.author.top_role.position:
+                failed.append(f"{user_selector} - IS_ABOVE_USER")
+                continue
+
+            targets[user.id] = (user_selector, user)
+
+        return targets, failed
+
     @commands.command(name="massban", brief="Ban a large number of users at once", aliases=["mban"])
     @commands.has_permissions(ban_members=True)
     async def mass_ban(self, ctx: commands.Context, reason: str, *users):
         """
         Massively ban a list of users programatically. This will delete the past day of message history for all users.
 
+        Users may be given as arguments, in text files attached to the command message (IDs or mentions separated by
+        spaces, commas, or new lines), or both. Users that are already banned are skipped. Bans are sent several at a
+        time, and a progress report is kept up to date until the batch is done.
+
         Parameters
         ----------
             ctx     :: Discord context <!nodoc>
@@ -797,44 +1032,211 @@ class ModTools(commands.Cog):
         Examples
         --------
             /mban "bot accounts" 123 345 SomeUser
+            /mban "raid accounts"                  :: (with a file of user IDs attached)
 
         """
-        report = {"succeeded": [], "failed": []}
-        converter = HuskyConverters.OfflineMemberConverter()
+        selectors = list(users) + await self._read_mass_ban_files(ctx.message)
+        targets, failed = self._resolve_mass_ban_targets(ctx, selectors)
 
-        for user_selector in users:
+        ban_index = await self._ban_manager.ensure_loaded(ctx.guild)
+        already_banned = [i for i in targets.keys() if ban_index.get(i) is not None]
+
+        for user_id in already_banned:
+            del targets[user_id]
+
+        succeeded = []
+
+        def build_report_embed(title: str, color):
+            embed = discord.Embed(
+                title=title,
+                description=f"{len(succeeded)} of {len(targets)} users banned.\n"
+                            f"{len(failed)} failed to ban. Nonexistent user or other error.\n"
+                            f"{len(already_banned)} were already banned.",
+                color=color
+            )
+
+            if 0 < len(failed) < 5:
+                embed.add_field(name="Failed Bans", value="\n".join(failed))
+
+            return embed
+
+        progress_message = await ctx.send(embed=build_report_embed("Mass Ban In Progress...", Colors.INFO))
+
+        async def update_progress():
+            while True:
+                await asyncio.sleep(5)
+
+                try:
+                    await progress_message.edit(embed=build_report_embed("Mass Ban In Progress...", Colors.INFO))
+                except discord.NotFound:
+                    return
+                except discord.HTTPException as e:
+                    LOG.warning(f"Could not update mass ban progress: {e}")
+
+        semaphore = asyncio.Semaphore(MASS_BAN_CONCURRENCY)
+
+        async def ban_one(user_selector: str, user):
+            is_trueban = isinstance(user, discord.Member)
+            ban_prefix = f"[{'HACKBAN | ' if not is_trueban else ''}MASSBAN | By {ctx.author}] "
+
+            async with semaphore:
+                try:
+                    await ctx.guild.ban(user, reason=ban_prefix + reason, delete_message_days=1)
+                except discord.DiscordException as e:
+                    LOG.error(f"Massban Error for {user_selector}: {e}")
+                    failed.append(f"{user_selector} - {type(e).__name__.upper()}")
+                    return
+                except Exception as e:
+                    # Anything unexpected is still just one failed ban; the rest of the batch (and the report) go on.
+                    LOG.exception(f"Unexpected massban error for {user_selector}: {e}")
+                    failed.append(f"{user_selector} - {type(e).__name__.upper()}")
+                    return
+
+            if is_trueban:
+                self._ban_manager.record_ban(ctx.guild, user, ban_prefix + reason, ctx.author)
+
+            succeeded.append(user_selector)
+
+        progress_task = self.bot.loop.create_task(update_progress())
+
+        try:
+            await asyncio.gather(*[ban_one(selector, user) for selector, user in targets.values()],
+                                 return_exceptions=True)
+        finally:
+            progress_task.cancel()
+
+        report_file = None
+        if len(failed) >= 5:
+            report_file = discord.File(io.BytesIO("\n".join(failed).encode('utf-8')), "massban-failures.txt")
+
+        try:
+            await progress_message.delete()
+        except discord.HTTPException:
+            pass
+
+        await ctx.send(embed=build_report_embed("Mass Ban Report", Colors.INFO), file=report_file)
+
+    def _check_event_feed_token(self, request: web.BaseRequest):
+        """
+        Clients must send `moderationFeed.token` as a bearer token or a `token` query parameter. With no token
+        configured, the feed is off.
+        """
+        HuskyHTTP.check_token(request, self._config.get('moderationFeed', {}).get('token'))
+
+    def _open_event_feed(self, request: web.BaseRequest) -> HuskyEvents.Subscription:
+        """
+        Check a feed request's token and filters, and subscribe it to the event bus. Clients may filter with `types`
+        (a comma-separated list of event types) and `guild` (a guild ID).
+        """
+        self._check_event_feed_token(request)
+
+        feed_config = self._config.get('moderationFeed', {})
+
+        if len(self._feed_subscriptions) >= feed_config.get('maxSubscriptions', EVENT_FEED_MAX_SUBSCRIPTIONS):
+            raise web.HTTPTooManyRequests(text="Too many moderation feeds are already open.")
+
+        types = [t for t in request.query.get('types', '').split(',') if t] or None
+        unknown_types = set(types or ()) - {e.value for e in ModerationEvents}
+        if unknown_types:
+            raise web.HTTPBadRequest(text=f"Unknown event types: {', '.join(sorted(unknown_types))}")
+
+        guild_id = request.query.get('guild')
+        if guild_id is not None:
             try:
-                user = await converter.convert(ctx, user_selector)
+                guild_id = int(guild_id)
+            except ValueError:
+                raise web.HTTPBadRequest(text="The guild filter must be a guild ID.")
 
-                if user == ctx.author:
-                    raise discord.DiscordException("IS_SELF")
+        buffer_size = feed_config.get('bufferSize', HuskyEvents.DEFAULT_BUFFER_SIZE)
 
-                if user == ctx.bot.user:
-                    raise discord.DiscordException("IS_BOT")
+        subscription = HuskyEvents.get_bus().subscribe(types, guild_id, buffer_size)
+        self._feed_subscriptions.add(subscription)
 
-                is_trueban = isinstance(user, discord.Member)
-                if is_trueban and (user.top_role.position >= ctx.message.author.top_role.position):
-                    raise discord.DiscordException("IS_ABOVE_USER")
+        return subscription
 
-                ban_prefix = f"[{'HACKBAN | ' if not is_trueban else ''}MASSBAN | By {ctx.author}] "
-                await ctx.guild.ban(user, reason=ban_prefix + reason, delete_message_days=1)
-                report['succeeded'].append(user_selector)
-            except discord.DiscordException as e:
-                report['failed'].append(f"{user_selector} - {''.join(e.args) if e.args else 'OTHER_ERR'}")
-                LOG.error("Massban Error", e)
-                continue
+    def _close_event_feed(self, subscription: HuskyEvents.Subscription):
+        HuskyEvents.get_bus().unsubscribe(subscription)
+        self._feed_subscriptions.discard(subscription)
 
-        embed = discord.Embed(
-            title="Mass Ban Report",
-            description=f"{len(report['succeeded'])} users banned.\n"
-            f"{len(report['failed'])} failed to ban. Nonexistent user or other error.",
-            color=Colors.INFO
-        )
+    @HuskyHTTP.register("/moderation/events", ["GET"])
+    async def moderation_event_stream(self, request: web.BaseRequest):
+        """
+        Stream moderation events as newline-delimited JSON, one event per line, for as long as the client stays
+        connected.
+        """
+        subscription = self._open_event_feed(request)
 
-        if 0 < len(report['failed']) < 5:
-            embed.add_field(name="Failed Bans", value="\n".join(report['failed']))
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson", "Cache-Control": "no-cache"})
+        response.enable_chunked_encoding()
 
-        await ctx.send(embed=embed)
+        try:
+            await response.prepare(request)
+
+            while True:
+                event = await subscription.get(timeout=EVENT_FEED_HEARTBEAT)
+
+                if subscription.closed:
+                    break
+
+                if event is None:
+                    event = {"type": "heartbeat", "timestamp": time.time()}
+
+                await response.write(json.dumps(event).encode('utf-8') + b"\n")
+        except ConnectionResetError:
+            # The client went away.
+            pass
+        finally:
+            self._close_event_feed(subscription)
+
+        return response
+
+    @HuskyHTTP.register("/moderation/events/ws", ["GET"])
+    async def moderation_event_socket(self, request: web.BaseRequest):
+        """
+        Stream moderation events over a WebSocket, one JSON event per text message. Anything the client sends is
+        ignored.
+        """
+        subscription = self._open_event_feed(request)
+
+        ws = web.WebSocketResponse(heartbeat=EVENT_FEED_HEARTBEAT)
+        reader = None
+
+        try:
+            await ws.prepare(request)
+
+            async def read_until_closed():
+                # Reading is what processes pongs and close frames. Once the socket closes, stop the feed too.
+                async for _ in ws:
+                    pass
+
+                self._close_event_feed(subscription)
+
+            reader = self.bot.loop.create_task(read_until_closed())
+
+            while not ws.closed:
+                event = await subscription.get()
+
+                if subscription.closed:
+                    break
+
+                await ws.send_json(event)
+        except ConnectionResetError:
+            pass
+        finally:
+            self._close_event_feed(subscription)
+
+            if reader is not None:
+                reader.cancel()
+
+            await ws.close()
+
+        return ws
+
+    @HuskyHTTP.register("/moderation/events/stats", ["GET"])
+    async def moderation_event_stats(self, request: web.BaseRequest):
+        self._check_event_feed_token(request)
+
+        return web.json_response(HuskyEvents.get_bus().get_stats())
 
 
 def setup(bot: HuskyBot):
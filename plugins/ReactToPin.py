@@ -6,6 +6,7 @@ from discord.ext import commands
 from HuskyBot import HuskyBot
 from libhusky import HuskyUtils, HuskyConverters
 from libhusky.HuskyStatics import *
+from libhusky.managers.MessageFetchManager import MessageFetchManager
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
@@ -43,75 +44,103 @@ class ReactToPin(commands.Cog):
         """
         self.bot = bot
         self._config = bot.config
+        self._message_fetcher = MessageFetchManager(bot)
+
+        # channel_id -> list of pinned message IDs (newest first). Dropped whenever Discord says a channel's pins
+        # changed, and fetched again when next needed.
+        self._pin_cache = {}
 
         LOG.info("Loaded plugin!")
 
-    async def count_reactions(self, message: discord.Message, emoji: discord.PartialEmoji):
-        count = 0
+    async def get_pins(self, channel: discord.TextChannel) -> list:
+        pins = self._pin_cache.get(channel.id)
 
-        for reaction in message.reactions:
-            if str(reaction.emoji) != str(emoji):
-                continue
+        if pins is None:
+            pins = self._pin_cache[channel.id] = [m.id for m in await channel.pins()]
+
+        return pins
+
+    @commands.Cog.listener(name="on_guild_channel_pins_update")
+    async def invalidate_pin_cache(self, channel: discord.abc.GuildChannel, _):
+        self._pin_cache.pop(channel.id, None)
+
+    async def has_enough_reactions(self, message: discord.Message, emoji: discord.PartialEmoji, required: int) -> bool:
+        """
+        Check if a message has at least `required` reactions of an emoji, not counting the bot or the message author.
+
+        The reaction's own count is used wherever possible. Only when the result depends on whether the author
+        reacted is the reaction's user list checked, and then only for that one user.
+        """
+        reaction = discord.utils.find(lambda r: str(r.emoji) == str(emoji), message.reactions)
+
+        if reaction is None:
+            return False
+
+        count = reaction.count - (1 if reaction.me else 0)
 
-            async for user in reaction.users():
-                if user == self.bot.user or user == message.author:
-                    continue
+        if count < required:
+            return False
 
-                count += 1
+        if count - 1 >= required or message.author == self.bot.user:
+            return True
 
-            break  # optimization to not loop after we find the response we need
+        author_reacted = False
+        async for user in reaction.users(limit=1, after=discord.Object(id=message.author.id - 1)):
+            author_reacted = user.id == message.author.id
 
-        LOG.debug(f"Message {message.id} has {count} reactions of type {emoji} on it.")
-        return count
+        LOG.debug(f"Message {message.id} has {count - author_reacted} reactions of type {emoji} on it.")
+        return count - author_reacted >= required
 
     async def smart_unpin_oldest(self, channel: discord.TextChannel):
         persistent_pinned_messages = self._config.get('reactToPin', {}).get(str(channel.id), {}).get('permanent', [])
 
-        pin_list = reversed(await channel.pins())
+        pin_list = reversed(await self.get_pins(channel))
 
-        for item in pin_list:  # type: discord.Message
-            if item.id in persistent_pinned_messages:
+        for item in pin_list:
+            if item in persistent_pinned_messages:
                 continue
 
             # we have something we can unpin, go ahead and do it, and then break
-            LOG.info(f"Unpinned message ID {item.id} from channel {channel} using SmartUnpin")
-            await item.unpin()
+            LOG.info(f"Unpinned message ID {item} from channel {channel} using SmartUnpin")
+            await self.bot.http.unpin_message(channel.id, item)
             return
 
         raise EOFError("No messages are eligible to be unpinned!")
 
+    @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         channel = self.bot.get_channel(payload.channel_id)  # type: discord.TextChannel
-        message = await channel.fetch_message(payload.message_id)  # type: discord.Message
 
-        channel_config = self._config.get('reactToPin', {}).get(str(channel.id))  # type: dict
+        channel_config = self._config.get('reactToPin', {}).get(str(payload.channel_id))  # type: dict
 
         LOG.debug("Got react event, processing.")
 
-        if not HuskyUtils.should_process_message(message):
-            return
-
+        # Everything that can be checked without asking Discord is checked first.
         if channel_config is None or not channel_config.get('enabled', False):
             LOG.debug(f"A pin configuration was not found for channel {channel}. Ignoring message.")
             return
 
+        if str(payload.emoji) != channel_config.get('emoji'):
+            LOG.debug(f"Got an invalid emoji for message {payload.message_id} in channel {channel}, ignoring.")
+            return
+
         # Check if the message is pinned
-        if message in await channel.pins():
+        pins = await self.get_pins(channel)
+        if payload.message_id in pins:
             LOG.debug("Can't repin an already-pinned message.")
             return
 
-        if str(payload.emoji) != channel_config.get('emoji'):
-            LOG.debug(f"Got an invalid emoji for message {message.id} in channel {channel}, ignoring.")
+        message = await self._message_fetcher.fetch_message(channel, payload.message_id)  # type: discord.Message
+
+        if not HuskyUtils.should_process_message(message):
             return
 
         # we are in a valid channel now, with a valid emote.
-        current_reactions = await self.count_reactions(message, payload.emoji)
-
-        if current_reactions < channel_config.get('requiredToPin', 6):
+        if not await self.has_enough_reactions(message, payload.emoji, channel_config.get('requiredToPin', 6)):
             LOG.debug("Got a valid emote reaction, but still below pin threshold. Ignoring (for now).")
             return
 
-        if len(await channel.pins()) >= 50:
+        if len(pins) >= 50:
             LOG.debug("Too many pins in the current channel, removing oldest one using smart unpin.")
             try:
                 await self.smart_unpin_oldest(channel)
@@ -132,36 +161,36 @@ class ReactToPin(commands.Cog):
         await message.pin()
         LOG.info(f"Pinned message {message.id} in {channel}, as it got enough reactions.")
 
+    @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
         channel = self.bot.get_channel(payload.channel_id)  # type: discord.TextChannel
-        message = await channel.fetch_message(payload.message_id)  # type: discord.Message
 
-        channel_config = self._config.get('reactToPin', {}).get(str(channel.id))  # type: dict
-
-        if not HuskyUtils.should_process_message(message):
-            return
+        channel_config = self._config.get('reactToPin', {}).get(str(payload.channel_id))  # type: dict
 
         if channel_config is None or not channel_config.get('enabled', False):
             LOG.debug(f"A pin configuration was not found for channel {channel}. Ignoring message.")
             return
 
+        if str(payload.emoji) != channel_config.get('emoji'):
+            LOG.debug(f"Got an invalid emoji for message {payload.message_id} in channel {channel}, ignoring.")
+            return
+
+        if payload.message_id in channel_config.get('permanent', []):
+            LOG.info("Reactions dropped below threshold on permanently pinned message, ignoring but logging.")
+            return
+
         # Check if the message is pinned
-        if message not in await channel.pins():
+        if payload.message_id not in await self.get_pins(channel):
             LOG.debug("Can't unpin a message that isn't currently pinned.")
             return
 
-        if str(payload.emoji) != channel_config.get('emoji'):
-            LOG.debug(f"Got an invalid emoji for message {message.id} in channel {channel}, ignoring.")
-            return
+        message = await self._message_fetcher.fetch_message(channel, payload.message_id)  # type: discord.Message
 
-        if message.id in channel_config.get('permanent', []):
-            LOG.info("Reactions dropped below threshold on permanently pinned message, ignoring but logging.")
+        if not HuskyUtils.should_process_message(message):
             return
 
         # we are in a valid channel now, with a valid emote.
-        current_reactions = await self.count_reactions(message, payload.emoji)
-
-        if current_reactions >= channel_config.get('requiredToPin', 6):
+        if await self.has_enough_reactions(message, payload.emoji, channel_config.get('requiredToPin', 6)):
             LOG.debug("Got a valid removal event for the emote, but there are too many reactions to unpin.")
             return
 
@@ -169,26 +198,32 @@ class ReactToPin(commands.Cog):
         LOG.info(f"Unpinned previously pinned message {message.id} in {channel}, as it is no longer at the required "
                  f"reaction count.")
 
+    @commands.Cog.listener()
     async def on_raw_reaction_clear(self, event: discord.RawReactionClearEvent):
         channel = self.bot.get_channel(event.channel_id)  # type: discord.TextChannel
-        message = await channel.fetch_message(event.message_id)  # type: discord.Message
 
-        channel_config = self._config.get('reactToPin', {}).get(str(channel.id))  # type: dict
+        channel_config = self._config.get('reactToPin', {}).get(str(event.channel_id))  # type: dict
 
-        if not HuskyUtils.should_process_message(message):
+        if channel_config is None or not channel_config.get('enabled', False):
             return
 
-        if message.id in channel_config.get('permanent', []):
+        if event.message_id in channel_config.get('permanent', []):
             LOG.info("Reactions were cleared on a permanently pinned message, ignoring.")
             return
 
         # Check if the message is pinned
-        if message not in await channel.pins():
+        if event.message_id not in await self.get_pins(channel):
             LOG.debug("Can't unpin a message that isn't currently pinned.")
             return
 
+        message = await self._message_fetcher.fetch_message(channel, event.message_id)  # type: discord.Message
+
+        if not HuskyUtils.should_process_message(message):
+            return
+
         await message.unpin()
 
+    @commands.Cog.listener()
     async def on_raw_message_edit(self, event: discord.RawMessageUpdateEvent):
         message_id = event.message_id
         channel_id = event.data.get('channel_id', None)
@@ -211,6 +246,7 @@ class ReactToPin(commands.Cog):
 
         self._config.set('reactToPin', plugin_config)
 
+    @commands.Cog.listener()
     async def on_raw_message_delete(self, event: discord.RawMessageDeleteEvent):
         message_id = event.message_id
         channel_id = event.channel_id
@@ -228,6 +264,7 @@ class ReactToPin(commands.Cog):
 
         self._config.set('reactToPin', plugin_config)
 
+    @commands.Cog.listener()
     async def on_raw_bulk_message_delete(self, event: discord.RawBulkMessageDeleteEvent):
         channel_id = event.channel_id
 
@@ -350,7 +387,7 @@ class ReactToPin(commands.Cog):
         plugin_config = self._config.get('reactToPin', {})  # type: dict
         channel_config = plugin_config.get(str(ctx.channel.id), {})  # type: dict
 
-        message = await ctx.channel.fetch_message(message)
+        message = await self._message_fetcher.fetch_message(ctx.channel, message)
         perm_pins = channel_config.setdefault('permanent', [])
 
         if message is None:
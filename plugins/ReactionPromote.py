@@ -1,3 +1,4 @@
+import collections
 import logging
 
 import discord
@@ -5,9 +6,13 @@ from discord.ext import commands
 
 from libhusky import HuskyConverters
 from libhusky.HuskyStatics import *
+from libhusky.managers.MessageFetchManager import MessageFetchManager
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
+# Seconds to wait for more reactions from the same user before editing their roles.
+ROLE_UPDATE_DELAY = 1.5
+
 
 # noinspection PyMethodMayBeStatic
 class ReactionPromote(commands.Cog):
@@ -19,77 +24,162 @@ class ReactionPromote(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self._config = bot.config
-        self.roleRemovalBlacklist = []
+        self._message_fetcher = MessageFetchManager(bot)
+
+        # (user_id, message_id) -> number of upcoming reaction removals that were caused by the bot, and so shouldn't
+        # remove roles.
+        self.roleRemovalBlacklist = collections.Counter()
+
+        # Flat views of the promotions config, rebuilt whenever it changes:
+        #   (channel_id, message_id, emoji) -> role_id
+        self._promotion_table = {}
+        #   (channel_id, message_id) for every message with a promotion on it
+        self._promotion_messages = set()
+        #   channel_id -> strictReacts for every channel with a promotion in it
+        self._promotion_channels = {}
+
+        # (guild_id, user_id) -> {role_id: True to add, False to remove}, applied after ROLE_UPDATE_DELAY so that a
+        # burst of reactions becomes one role edit.
+        self._pending_role_updates = {}
+
+        self._build_promotion_table()
+
         LOG.info("Loaded plugin!")
 
+    def _build_promotion_table(self):
+        table = {}
+        messages = set()
+        channels = {}
+
+        for channel_id, channel_config in self._config.get('promotions', {}).items():
+            channel_id = int(channel_id)
+            channels[channel_id] = channel_config.get('strictReacts', False)
+
+            for message_id, message_config in channel_config.items():
+                if not message_id.isdigit():
+                    continue
+
+                messages.add((channel_id, int(message_id)))
+
+                for emoji, role_id in message_config.items():
+                    table[(channel_id, int(message_id), emoji)] = role_id
+
+        self._promotion_table = table
+        self._promotion_messages = messages
+        self._promotion_channels = channels
+
+    def _queue_role_update(self, member: discord.Member, role_id: int, add: bool):
+        key = (member.guild.id, member.id)
+        pending = self._pending_role_updates.get(key)
+
+        if pending is None:
+            pending = self._pending_role_updates[key] = {}
+            self.bot.loop.call_later(ROLE_UPDATE_DELAY,
+                                     lambda: self.bot.loop.create_task(self._apply_role_updates(*key)))
+
+        # A later toggle of the same role replaces the earlier one.
+        pending[role_id] = add
+
+    async def _apply_role_updates(self, guild_id: int, user_id: int):
+        pending = self._pending_role_updates.pop((guild_id, user_id), {})
+
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(user_id) if guild is not None else None
+
+        if member is None:
+            return
+
+        # Only send the net change. Editing the whole role list would revert anything else that changed meanwhile
+        # (such as a mute).
+        held = {r.id for r in member.roles}
+        to_add = [guild.get_role(role_id) for role_id, add in pending.items() if add and role_id not in held]
+        to_remove = [guild.get_role(role_id) for role_id, add in pending.items() if not add and role_id in held]
+
+        to_add = [r for r in to_add if r is not None]
+        to_remove = [r for r in to_remove if r is not None]
+
+        if not to_add and not to_remove:
+            return
+
+        try:
+            if to_add:
+                await member.add_roles(*to_add, reason="Reaction promotion")
+
+            if to_remove:
+                await member.remove_roles(*to_remove, reason="Reaction promotion")
+        except discord.HTTPException:
+            # This runs in its own task, outside of any listener, so report it the way a listener error would be.
+            LOG.warning(f"Could not update reaction promotion roles for user {member.display_name} "
+                        f"(add {[r.id for r in to_add]}, remove {[r.id for r in to_remove]})")
+            await self.bot.on_error("ReactionPromote._apply_role_updates")
+            return
+
+        LOG.info(f"Updated reaction promotion roles for user {member.display_name} "
+                 f"(added {[r.id for r in to_add]}, removed {[r.id for r in to_remove]})")
+
     @commands.Cog.listener(name="on_raw_reaction_add")
     async def on_nominate_role(self, payload: discord.RawReactionActionEvent):
-        promotion_config = self._config.get('promotions', {})
+        if payload.user_id == self.bot.user.id:
+            return
+
+        # Unrelated reactions are skipped before anything else happens.
+        strict = self._promotion_channels.get(payload.channel_id)
+
+        if strict is None:
+            # LOG.warning("Not configured for this channel. Ignoring.")
+            return
+
+        role_id = self._promotion_table.get((payload.channel_id, payload.message_id, str(payload.emoji)))
+
+        if role_id is None and (payload.channel_id, payload.message_id) not in self._promotion_messages \
+                and not strict:
+            return
 
         channel = self.bot.get_channel(payload.channel_id)
 
         if not isinstance(channel, discord.TextChannel):
             return
 
-        if payload.user_id == self.bot.user.id:
-            return
+        user = channel.guild.get_member(payload.user_id)
 
-        message = await channel.fetch_message(payload.message_id)
-        guild = message.guild
-        user = guild.get_member(payload.user_id)
+        if user is None:
+            return
 
-        try:
-            role_id = promotion_config[str(payload.channel_id)][str(payload.message_id)][str(payload.emoji)]
-            group_to_add = guild.get_role(role_id)
-            await user.add_roles(group_to_add)
-            LOG.info(f"Added user {user.display_name} to role {str(group_to_add)}")
-        except KeyError:
-            if promotion_config.get(str(payload.channel_id)) is None:
-                # LOG.warning("Not configured for this channel. Ignoring.")
-                return
+        if role_id is not None:
+            self._queue_role_update(user, role_id, True)
+            return
 
-            if promotion_config.get(str(payload.channel_id)).get(str(payload.message_id)) is None \
-                    and not promotion_config.get(str(payload.channel_id)).get('strictReacts'):
-                LOG.warning("Not configured for this message. Ignoring.")
-                return
+        LOG.warning(f"Got bad emoji {str(payload.emoji)}")
+        self.roleRemovalBlacklist[(payload.user_id, payload.message_id)] += 1
 
-            LOG.warning(f"Got bad emoji {str(payload.emoji)}")
-            self.roleRemovalBlacklist.append(str(payload.user_id) + str(payload.message_id))
-            await message.remove_reaction(payload.emoji, user)
+        message = await self._message_fetcher.fetch_message(channel, payload.message_id)
+        await message.remove_reaction(payload.emoji, user)
 
     @commands.Cog.listener(name="on_raw_reaction_remove")
     async def on_unnominate_role(self, payload: discord.RawReactionActionEvent):
-        promotion_config = self._config.get('promotions', {})
+        blacklist_key = (payload.user_id, payload.message_id)
 
-        if (str(payload.user_id) + str(payload.message_id)) in self.roleRemovalBlacklist:
+        if self.roleRemovalBlacklist[blacklist_key] > 0:
             # LOG.warning("Removal throttled.")
-            self.roleRemovalBlacklist.remove(str(payload.user_id) + str(payload.message_id))
-            return
+            self.roleRemovalBlacklist[blacklist_key] -= 1
 
-        channel = self.bot.get_channel(payload.channel_id)
+            if not self.roleRemovalBlacklist[blacklist_key]:
+                del self.roleRemovalBlacklist[blacklist_key]
 
-        if not isinstance(channel, discord.TextChannel):
             return
 
-        message = await channel.fetch_message(payload.message_id)
-        guild = message.guild
-        user = guild.get_member(payload.user_id)
+        role_id = self._promotion_table.get((payload.channel_id, payload.message_id, str(payload.emoji)))
 
-        try:
-            role_id = promotion_config[str(payload.channel_id)][str(payload.message_id)][str(payload.emoji)]
-            group_to_remove = guild.get_role(role_id)
-            await user.remove_roles(group_to_remove)
-            LOG.info(f"Removed user {user.display_name} from role {str(group_to_remove)}")
-        except KeyError:
-            if promotion_config.get(str(payload.channel_id)) is None:
-                # LOG.warning("Not configured for this channel. Ignoring.")
-                return
+        if role_id is None:
+            return
+
+        guild = self.bot.get_guild(payload.guild_id) if payload.guild_id is not None else None
+        user = guild.get_member(payload.user_id) if guild is not None else None
 
-            if promotion_config.get(str(payload.channel_id)).get(str(payload.message_id)) is None:
-                LOG.warning("Not configured for this message. Ignoring.")
-                return
+        if user is None:
+            return
 
-            LOG.warning(f"Got bad emoji {str(payload.emoji)}")
+        self._queue_role_update(user, role_id, False)
 
     @commands.group(pass_context=True, brief="Control the promotions plugin")
     @commands.has_permissions(administrator=True)
@@ -148,7 +238,7 @@ class ReactionPromote(commands.Cog):
             return
 
         try:
-            message: discord.Message = await channel.fetch_message(message_id)
+            message: discord.Message = await self._message_fetcher.fetch_message(channel, message_id)
         except discord.NotFound:
             await ctx.send(embed=discord.Embed(
                 title=Emojis.WARNING + " Error Adding ReactionPromote",
@@ -182,6 +272,7 @@ class ReactionPromote(commands.Cog):
 
         message_config[str(emoji)] = role.id
         self._config.set('promotions', promotion_config)
+        self._build_promotion_table()
 
         await ctx.send(embed=discord.Embed(
             title="Reaction Promotes",
@@ -206,13 +297,14 @@ class ReactionPromote(commands.Cog):
             ))
             return
         self._config.set('promotions', promotion_config)
+        self._build_promotion_table()
 
         # Clean up the entry as well.
         try:
-            message: discord.Message = await channel.fetch_message(message_id)
+            message: discord.Message = await self._message_fetcher.fetch_message(channel, message_id)
             reaction: discord.Reaction = discord.utils.get(message.reactions, emoji=emoji)
             async for user in reaction.users():
-                self.roleRemovalBlacklist.append(str(user.id) + str(message_id))
+                self.roleRemovalBlacklist[(user.id, message_id)] += 1
                 await message.remove_reaction(emoji, user)
 
         except discord.NotFound as _:
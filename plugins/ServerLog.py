@@ -1,12 +1,17 @@
+import bisect
 import datetime
+import io
 import logging
 
 import discord
 from discord.ext import commands
 
 from HuskyBot import HuskyBot
-from libhusky import HuskyUtils
+from libhusky import HuskyEvents, HuskyUtils
 from libhusky.HuskyStatics import *
+from libhusky.managers.BanManager import BanManager
+from libhusky.managers.MemberUpdateManager import MemberChange, MemberDiff, MemberUpdateManager
+from libhusky.managers.MessageStoreManager import MessageStoreManager, clean_raw_content
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
@@ -20,6 +25,24 @@ class ServerLog(commands.Cog):
         self.bot = bot
         self._config = bot.config
         self._session_store = self.bot.session_store
+        self._ban_manager = BanManager(bot)
+
+        self._member_updates = MemberUpdateManager(bot)
+        self._member_updates.subscribe(MemberChange.NICK | MemberChange.NAME, self.user_rename_logger)
+
+        store_config = self._config.get('messageStore', {})
+        self._message_store = MessageStoreManager(
+            max_messages=store_config.get('maxMessages', 50000),
+            max_bytes=store_config.get('maxBytes', 32 * 1024 * 1024),
+            spill_path=store_config.get('spillPath'),
+            spill_max_messages=store_config.get('spillMaxMessages', 1000000)
+        )
+
+        # guild_id -> sorted list of (joined_at, member_id), used to number new members without sorting the guild.
+        self._join_index = {}
+
+        if self.bot.is_ready():
+            self._build_join_indexes()
 
         LOG.info("Loaded plugin!")
 
@@ -28,9 +51,66 @@ class ServerLog(commands.Cog):
                               "userLeave",
                               "userBan",
                               "userRename",
-                              "messageDelete", "messageDelete.logIntegrity",
+                              "messageDelete", "messageDelete.logIntegrity", "messageDelete.bulk",
                               "messageEdit"]
 
+    def cog_unload(self):
+        self._member_updates.unload_plugin(self)
+        self._message_store.cleanup()
+
+    @staticmethod
+    def _join_key(member: discord.Member):
+        return member.joined_at or datetime.datetime.min, member.id
+
+    def _build_join_indexes(self):
+        for guild in self.bot.guilds:
+            self._join_index[guild.id] = sorted(self._join_key(m) for m in guild.members)
+
+        LOG.debug(f"Built join order index for {len(self._join_index)} guilds.")
+
+    def _get_join_index(self, guild: discord.Guild) -> list:
+        index = self._join_index.get(guild.id)
+
+        if index is None:
+            index = self._join_index[guild.id] = sorted(self._join_key(m) for m in guild.members)
+
+        return index
+
+    def get_member_number(self, member: discord.Member) -> int:
+        """
+        Get a member's (one-indexed) position in the guild's join order, adding them to the index if needed.
+        """
+        index = self._get_join_index(member.guild)
+        key = self._join_key(member)
+        pos = bisect.bisect_left(index, key)
+
+        if pos == len(index) or index[pos] != key:
+            bisect.insort(index, key)
+
+        return pos + 1
+
+    @commands.Cog.listener(name="on_ready")
+    async def rebuild_join_indexes(self):
+        self._build_join_indexes()
+
+    @commands.Cog.listener(name="on_member_join")
+    async def track_join_order(self, member: discord.Member):
+        # Numbering a member also inserts them into the index, so the join logger doesn't depend on listener order.
+        self.get_member_number(member)
+
+    @commands.Cog.listener(name="on_member_remove")
+    async def untrack_join_order(self, member: discord.Member):
+        index = self._join_index.get(member.guild.id)
+
+        if index is None:
+            return
+
+        key = self._join_key(member)
+        pos = bisect.bisect_left(index, key)
+
+        if pos < len(index) and index[pos] == key:
+            del index[pos]
+
     @commands.Cog.listener(name="on_member_join")
     async def user_milestone_logger(self, member: discord.Member):
         if "userJoin.milestones" not in self._config.get("loggers", {}).keys():
@@ -76,7 +156,7 @@ class ServerLog(commands.Cog):
         embed.add_field(name="Joined Guild", value=member.joined_at.strftime(DATETIME_FORMAT), inline=True)
         embed.add_field(name="User ID", value=member.id, inline=True)
 
-        member_num = sorted(member.guild.members, key=lambda m: m.joined_at).index(member) + 1
+        member_num = self.get_member_number(member)
         embed.set_footer(text=f"Member #{member_num} on the guild")
 
         LOG.info(f"User {member} ({member.id}) has joined {member.guild.name}.")
@@ -145,7 +225,7 @@ class ServerLog(commands.Cog):
             color=Colors.DANGER
         )
 
-        ban_entry = discord.utils.get(await guild.bans(), user=user)
+        ban_entry = await self._ban_manager.get_ban(guild, user)
 
         if ban_entry is None:
             raise ValueError(f"A ban record for user {user.id} was expected, but no entry was found")
@@ -158,6 +238,10 @@ class ServerLog(commands.Cog):
         embed.set_thumbnail(url=user.avatar_url)
         embed.add_field(name="User ID", value=user.id, inline=True)
         embed.add_field(name="Ban Timestamp", value=timestamp, inline=True)
+
+        if ban_entry.moderator is not None:
+            embed.add_field(name="Responsible User", value=str(ban_entry.moderator), inline=True)
+
         embed.add_field(name="Ban Reason", value=ban_reason, inline=False)
 
         LOG.info(f"User {user} was banned from {guild.name} for '{ban_reason}'.")
@@ -195,8 +279,9 @@ class ServerLog(commands.Cog):
         LOG.info(f"User {user} was unbanned from {guild.name}.")
         await alert_channel.send(embed=embed)
 
-    @commands.Cog.listener(name="on_member_update")
-    async def user_rename_logger(self, before: discord.Member, after: discord.Member):
+    async def user_rename_logger(self, diff: MemberDiff):
+        before, after = diff.before, diff.after
+
         if "userRename" not in self._config.get("loggers", {}).keys():
             return
 
@@ -210,10 +295,7 @@ class ServerLog(commands.Cog):
 
         alert_channel = self.bot.get_channel(alert_channel)
 
-        if before.nick == after.nick and before.name == after.name:
-            return
-
-        if before.nick != after.nick:
+        if diff.changes & MemberChange.NICK:
             update_type = 'nickname'
             old_val = before.nick
             new_val = after.nick
@@ -221,7 +303,7 @@ class ServerLog(commands.Cog):
             if before.id in ignored_nicks:
                 return
 
-        elif before.name != after.name:
+        elif diff.changes & MemberChange.NAME:
             update_type = 'username'
             old_val = before.name
             new_val = after.name
@@ -355,6 +437,205 @@ class ServerLog(commands.Cog):
 
         await alert_channel.send(embed=embed)
 
+    def _get_message_log_channel(self, guild: discord.Guild, channel_id: int, logger: str):
+        """
+        Get the message log channel, or None if a message in channel_id shouldn't be logged by this logger.
+        """
+        logger_config = self._config.get("loggers", {})
+
+        if logger not in logger_config.keys():
+            return None
+
+        if channel_id in logger_config.get('__global__', {}).get("ignoredChannels", []):
+            return None
+
+        alert_channel = self._config.get('specialChannels', {}).get(ChannelKeys.MESSAGE_LOG.value, None)
+
+        if alert_channel is None:
+            return None
+
+        return guild.get_channel(alert_channel)
+
+    def _is_log_channel(self, channel_id: int) -> bool:
+        special_channels = self._config.get('specialChannels', {})
+
+        return channel_id in [special_channels.get(ChannelKeys.MESSAGE_LOG.value),
+                              special_channels.get(ChannelKeys.STAFF_LOG.value)]
+
+    @commands.Cog.listener(name="on_message")
+    async def message_store_recorder(self, message: discord.Message):
+        if message.guild is None:
+            return
+
+        # Don't bother remembering the bot's own log output.
+        if message.author.bot and self._is_log_channel(message.channel.id):
+            return
+
+        self._message_store.add(message)
+
+    @commands.Cog.listener(name="on_raw_message_edit")
+    async def raw_message_edit_logger(self, payload: discord.RawMessageUpdateEvent):
+        if payload.data.get('content') is None:
+            return
+
+        channel = self.bot.get_channel(payload.channel_id)
+        if channel is None or getattr(channel, 'guild', None) is None:
+            return
+
+        record = self._message_store.get(payload.message_id)
+
+        if record is None:
+            return
+
+        # The store holds clean content (as the client shows it), so clean the raw content the same way.
+        old_content = record.content
+        new_content = clean_raw_content(channel.guild, payload.data)
+        self._message_store.update_content(payload.message_id, new_content)
+
+        # Cached messages are handled by message_edit_logger.
+        if payload.cached_message is not None or old_content == new_content:
+            return
+
+        alert_channel = self._get_message_log_channel(channel.guild, channel.id, "messageEdit")
+
+        if alert_channel is None or (channel == alert_channel and payload.data.get('author', {}).get('bot')):
+            return
+
+        embed = discord.Embed(
+            color=Colors.PRIMARY
+        )
+
+        embed.set_author(name="Message edited", icon_url=record.avatar_url)
+        embed.add_field(name="Author", value=record.author, inline=True)
+        embed.add_field(name="Message ID", value=record.id, inline=True)
+        embed.add_field(name="Channel", value=channel.mention, inline=True)
+        embed.add_field(name="Send Timestamp", value=record.get_created_datetime().strftime(DATETIME_FORMAT),
+                        inline=True)
+        embed.add_field(name="Event Timestamp", value=HuskyUtils.get_timestamp(), inline=True)
+
+        embed.add_field(name="Message Before",
+                        value=HuskyUtils.trim_string(old_content, 1000, True) if old_content else "`<No Content>`",
+                        inline=False)
+        embed.add_field(name="Message After",
+                        value=HuskyUtils.trim_string(new_content, 1000, True) if new_content else "`<No Content>`",
+                        inline=False)
+        embed.set_footer(text="Recovered from the bot's message store")
+
+        await alert_channel.send(embed=embed)
+
+    @commands.Cog.listener(name="on_raw_message_delete")
+    async def raw_message_delete_logger(self, payload: discord.RawMessageDeleteEvent):
+        record = self._message_store.get(payload.message_id)
+        self._message_store.remove(payload.message_id)
+
+        if payload.guild_id is not None:
+            if payload.cached_message is not None:
+                author_id, author = payload.cached_message.author.id, str(payload.cached_message.author)
+            elif record is not None:
+                author_id, author = record.author_id, record.author
+            else:
+                author_id, author = None, None
+
+            HuskyEvents.publish(ModerationEvents.MESSAGE_DELETE, payload.guild_id, channel_id=payload.channel_id,
+                                message_ids=[payload.message_id], author_id=author_id, author=author)
+
+        # Cached messages are handled by message_delete_logger.
+        if payload.cached_message is not None or record is None or payload.guild_id is None:
+            return
+
+        guild = self.bot.get_guild(payload.guild_id)
+        channel = guild.get_channel(payload.channel_id) if guild is not None else None
+
+        if channel is None:
+            return
+
+        alert_channel = self._get_message_log_channel(guild, channel.id, "messageDelete")
+
+        if alert_channel is None:
+            return
+
+        embed = discord.Embed(
+            color=Colors.WARNING
+        )
+
+        embed.set_author(name=f"Deleted Message in #{channel.name}", icon_url=record.avatar_url)
+        embed.add_field(name="Author", value=record.author, inline=True)
+        embed.add_field(name="Message ID", value=record.id, inline=True)
+        embed.add_field(name="Channel", value=channel.mention, inline=True)
+        embed.add_field(name="Send Timestamp", value=record.get_created_datetime().strftime(DATETIME_FORMAT),
+                        inline=True)
+        embed.add_field(name="Delete Timestamp", value=HuskyUtils.get_timestamp(), inline=True)
+        if record.embed_count:
+            embed.add_field(name="Embed Count", value=f"{record.embed_count}", inline=True)
+
+        if record.content:
+            embed.add_field(name="Message", value=HuskyUtils.trim_string(record.content, 1000, True), inline=False)
+
+        if len(record.attachments) > 1:
+            embed.add_field(name="Attachments",
+                            value=HuskyUtils.trim_string("\n".join(f"- {a}" for a in record.attachments), 1000, True),
+                            inline=False)
+        elif len(record.attachments) == 1:
+            embed.add_field(name="Attachment URL", value=record.attachments[0], inline=False)
+
+        embed.set_footer(text="Recovered from the bot's message store")
+
+        await alert_channel.send(embed=embed)
+
+    @commands.Cog.listener(name="on_raw_bulk_message_delete")
+    async def raw_bulk_delete_logger(self, payload: discord.RawBulkMessageDeleteEvent):
+        records = self._message_store.get_many(payload.message_ids)
+
+        for message_id in payload.message_ids:
+            self._message_store.remove(message_id)
+
+        if payload.guild_id is None:
+            return
+
+        HuskyEvents.publish(ModerationEvents.MESSAGE_DELETE, payload.guild_id, channel_id=payload.channel_id,
+                            message_ids=sorted(payload.message_ids), bulk=True)
+
+        guild = self.bot.get_guild(payload.guild_id)
+        channel = guild.get_channel(payload.channel_id) if guild is not None else None
+
+        if channel is None:
+            return
+
+        alert_channel = self._get_message_log_channel(guild, channel.id, "messageDelete.bulk")
+
+        # Bulk deletes in the log channels are usually cleanups of our own output.
+        if alert_channel is None or self._is_log_channel(channel.id):
+            return
+
+        # Sort oldest first, which is also snowflake order.
+        recovered = [records[k] for k in sorted(records.keys())]
+
+        embed = discord.Embed(
+            description=f"{len(payload.message_ids)} messages were deleted from {channel.mention}. The content of "
+                        f"{len(recovered)} of them is attached.",
+            color=Colors.WARNING
+        )
+
+        embed.set_author(name=f"Bulk Delete in #{channel.name}")
+        embed.add_field(name="Delete Timestamp", value=HuskyUtils.get_timestamp(), inline=True)
+
+        if not recovered:
+            await alert_channel.send(embed=embed)
+            return
+
+        transcript = io.StringIO()
+        for record in recovered:
+            transcript.write(f"[{record.get_created_datetime().strftime(DATETIME_FORMAT)}] {record.author} "
+                             f"({record.author_id}) [{record.id}]: {record.content}\n")
+
+            for attachment in record.attachments:
+                transcript.write(f"    Attachment: {attachment}\n")
+
+        transcript_file = discord.File(io.BytesIO(transcript.getvalue().encode('utf-8')),
+                                       filename=f"bulk-delete-{channel.id}-{recovered[-1].id}.txt")
+
+        await alert_channel.send(embed=embed, file=transcript_file)
+
     @commands.group(name="logger", aliases=["logging"], brief="Parent command to manage the ServerLog module")
     @commands.has_permissions(administrator=True)
     async def logger(self, ctx: discord.ext.commands.Context):
@@ -1,14 +1,31 @@
+import asyncio
 import logging
 import re
+import time
 
 import discord
 from discord.ext import commands
 
 from HuskyBot import HuskyBot
-from libhusky import HuskyUtils, HuskyStatics
+from libhusky import HuskyEvents, HuskyUtils, HuskyStatics
+from libhusky.HuskyStatics import *
+from libhusky.managers.MemberUpdateManager import MemberChange, MemberDiff, MemberUpdateManager
 
 LOG = logging.getLogger("HuskyBot.Plugin." + __name__)
 
+# Members checked per chunk of a scan before yielding to the event loop.
+UBL_SCAN_CHUNK_SIZE = 1000
+
+# Seconds between kicks sent from the scan queue.
+UBL_KICK_INTERVAL = 1.0
+
+# Seconds between checks for a changed banned username list.
+UBL_CONFIG_CHECK_INTERVAL = 60
+
+# Default for `ubl.maxScanKicks`: the most kicks a scan will queue on its own. Automatic rescans that match more than
+# this kick nobody and alert staff instead, and /ubl scan asks for confirmation.
+UBL_SCAN_KICK_LIMIT = 25
+
 
 # noinspection PyMethodMayBeStatic
 class UniversalBanList(commands.Cog):
@@ -32,7 +49,8 @@ class UniversalBanList(commands.Cog):
                 'fish',
                 'pie'
             ],
-            "kickInviteUsernames": true
+            "kickInviteUsernames": true,
+            "maxScanKicks": 25
         }
 
     Banned usernames are the union of the bannedUsernames and bannedPhrases list. It will apply to both usernames as
@@ -41,13 +59,42 @@ class UniversalBanList(commands.Cog):
 
     The UBL will not apply (on message) to users with the MANAGE_MESSAGES permission. It will also not apply to users
     with the MANAGE_GUILD permission.
+
+    When the banned username list changes, every guild is rescanned so that existing members are held to the new
+    list. Kicks from a scan are queued and sent at a limited rate. If a rescan would kick more than `maxScanKicks`
+    members (default 25), it kicks nobody and alerts staff, who can review the list and run /ubl scan.
     """
 
     def __init__(self, bot: HuskyBot):
         self.bot = bot
 
+        self._member_updates = MemberUpdateManager(bot)
+        self._member_updates.subscribe(MemberChange.NICK | MemberChange.NAME, self.check_name_change)
+
+        # Compiled forms of the UBL lists, and the raw lists they were compiled from.
+        self._username_source = None
+        self._username_matchers = []
+        self._phrase_source = None
+        self._phrase_matchers = []
+
+        # The username list the last full rescan used. A differing list triggers a new rescan.
+        self._scanned_usernames = None
+        self._scan_locks = {}
+
+        # (member, reason) for kicks found by scans, and the IDs of members already waiting in it.
+        self._kick_queue = asyncio.Queue()
+        self._queued_kicks = set()
+
+        self._kick_task = self.bot.loop.create_task(self._process_kick_queue())
+        self._watch_task = self.bot.loop.create_task(self._watch_config())
+
         LOG.info("Loaded plugin!")
 
+    def cog_unload(self):
+        self._member_updates.unload_plugin(self)
+        self._kick_task.cancel()
+        self._watch_task.cancel()
+
     def get_banned_usernames(self):
         ubl_config = self.bot.config.get('ubl', {})
 
@@ -58,6 +105,53 @@ class UniversalBanList(commands.Cog):
 
         return banned_list
 
+    @staticmethod
+    def _compile_terms(terms: list) -> list:
+        matchers = []
+
+        for term in terms:
+            try:
+                matchers.append((term, re.compile(term, re.IGNORECASE)))
+            except re.error as e:
+                LOG.warning(f"Ignoring invalid UBL pattern {term!r}: {e}")
+
+        return matchers
+
+    def get_username_matchers(self) -> list:
+        """
+        Get (term, compiled pattern) pairs for the banned username list, compiling it again only if it changed.
+        """
+        banned_usernames = self.get_banned_usernames()
+
+        if banned_usernames != self._username_source:
+            self._username_matchers = self._compile_terms(banned_usernames)
+            self._username_source = banned_usernames
+
+        return self._username_matchers
+
+    def get_phrase_matchers(self) -> list:
+        banned_phrases = self.bot.config.get('ubl', {}).get('bannedPhrases', [])
+
+        if banned_phrases != self._phrase_source:
+            self._phrase_matchers = self._compile_terms(banned_phrases)
+            self._phrase_source = list(banned_phrases)
+
+        return self._phrase_matchers
+
+    def find_banned_name(self, member: discord.Member, matchers: list = None):
+        """
+        Check a member's nickname and username against the banned username list.
+
+        :return: A tuple of (name type, matching term), or None if neither name matches.
+        """
+        for ubl_term, regex in (matchers if matchers is not None else self.get_username_matchers()):
+            if member.nick is not None and regex.search(member.nick) is not None:
+                return 'nickname', ubl_term
+            elif member.name is not None and regex.search(member.name) is not None:
+                return 'username', ubl_term
+
+        return None
+
     async def filter_message(self, message: discord.Message, context: str = "new_message"):
         if not HuskyUtils.should_process_message(message):
             return
@@ -65,8 +159,8 @@ class UniversalBanList(commands.Cog):
         if message.author.permissions_in(message.channel).manage_messages:
             return
 
-        for ubl_term in self.bot.config.get('ubl', {}).get('bannedPhrases', []):
-            if re.search(ubl_term, message.content, re.IGNORECASE) is not None:
+        for ubl_term, regex in self.get_phrase_matchers():
+            if regex.search(message.content) is not None:
                 await message.author.ban(reason=f"User used UBL keyword `{ubl_term}`. Purging user...",
                                          delete_message_days=5)
                 await message.guild.unban(message.author, reason="UBL ban reversal")
@@ -87,31 +181,221 @@ class UniversalBanList(commands.Cog):
         if member.guild_permissions.manage_guild:
             return
 
-        for ubl_term in self.get_banned_usernames():
-            if re.search(ubl_term, member.display_name, re.IGNORECASE) is not None:
-                await member.kick(reason=f"[AUTOMATIC KICK - UBL Module] New user's name contains UBL keyword "
-                                         f"`{ubl_term}`")
+        for ubl_term, regex in self.get_username_matchers():
+            if regex.search(member.display_name) is not None:
+                await self._kick(member, f"[AUTOMATIC KICK - UBL Module] New user's name contains UBL keyword "
+                                          f"`{ubl_term}`")
                 LOG.info("Kicked UBL triggering new join of user %s (matching UBL %s)", member, ubl_term)
 
-    @commands.Cog.listener()
-    async def on_member_update(self, before: discord.Member, after: discord.Member):
+    async def check_name_change(self, diff: MemberDiff):
+        after = diff.after
+
         if after.guild_permissions.manage_guild:
             return
 
-        if before.nick == after.nick and before.name == after.name:
+        match = self.find_banned_name(after)
+
+        if match is None:
             return
 
-        for ubl_term in self.get_banned_usernames():
-            if after.nick is not None and re.search(ubl_term, after.nick, re.IGNORECASE) is not None:
-                u_type = 'nickname'
-            elif after.name is not None and re.search(ubl_term, after.name, re.IGNORECASE):
-                u_type = 'username'
+        u_type, ubl_term = match
+
+        await self._kick(after, f"[AUTOMATIC BAN - UBL Module] User {after} changed {u_type} to include UBL "
+                                 f"keyword {ubl_term}")
+        LOG.info("Kicked UBL triggering %s change of user %s (matching UBL %s)", u_type, after, ubl_term)
+
+    def get_scan_kick_limit(self) -> int:
+        return self.bot.config.get('ubl', {}).get('maxScanKicks', UBL_SCAN_KICK_LIMIT)
+
+    async def scan_guild(self, guild: discord.Guild, max_kicks: int = None) -> dict:
+        """
+        Check every member of a guild against the banned username list, queueing kicks for any that match.
+
+        Members are checked in chunks of UBL_SCAN_CHUNK_SIZE, yielding to the event loop between chunks so that even
+        very large guilds don't hold up the gateway.
+
+        :param max_kicks: If more than this many new kicks are found, queue none of them. None queues every kick.
+        :return: A dict of scan statistics (scanned, matched, queued, held back, and duration in seconds).
+        """
+        lock = self._scan_locks.setdefault(guild.id, asyncio.Lock())
+
+        async with lock:
+            started = time.monotonic()
+            matchers = self.get_username_matchers()
+            members = list(guild.members)
+
+            stats = {"scanned": 0, "matched": 0, "queued": 0, "held": 0}
+            kicks = []
+
+            for i in range(0, len(members), UBL_SCAN_CHUNK_SIZE):
+                for member in members[i:i + UBL_SCAN_CHUNK_SIZE]:
+                    match = self.find_banned_name(member, matchers)
+
+                    # Permissions are only worth computing for the (very few) members that match.
+                    if match is None or member.guild_permissions.manage_guild:
+                        continue
+
+                    stats['matched'] += 1
+
+                    if member.id in self._queued_kicks:
+                        continue
+
+                    u_type, ubl_term = match
+                    kicks.append((member, f"[AUTOMATIC KICK - UBL Module] User's {u_type} contains UBL keyword "
+                                          f"`{ubl_term}` (found by scan)"))
+
+                stats['scanned'] += len(members[i:i + UBL_SCAN_CHUNK_SIZE])
+                await asyncio.sleep(0)
+
+            if max_kicks is not None and len(kicks) > max_kicks:
+                # Far more matches than expected usually means a bad list entry. Don't act on it unsupervised.
+                stats['held'] = len(kicks)
             else:
+                for (member, reason) in kicks:
+                    self._queued_kicks.add(member.id)
+                    self._kick_queue.put_nowait((member, reason))
+
+                stats['queued'] = len(kicks)
+
+            stats['duration'] = time.monotonic() - started
+
+        LOG.info(f"UBL scan of {guild} checked {stats['scanned']} members in {stats['duration']:.2f} seconds, "
+                 f"queued {stats['queued']} kicks, and held back {stats['held']}.")
+
+        return stats
+
+    async def _kick(self, member: discord.Member, reason: str):
+        await member.kick(reason=reason)
+        HuskyEvents.publish(ModerationEvents.KICK, member.guild.id, user_id=member.id, user=str(member),
+                            source=self.__class__.__name__, reason=reason)
+
+    async def _process_kick_queue(self):
+        while True:
+            member, reason = await self._kick_queue.get()
+
+            try:
+                # Names can change while a kick waits in the queue, so check the member again before kicking.
+                current = member.guild.get_member(member.id)
+
+                if current is None or self.find_banned_name(current) is None:
+                    continue
+
+                await self._kick(current, reason)
+                LOG.info("Kicked UBL triggering user %s found by scan", current)
+            except discord.HTTPException as e:
+                LOG.warning(f"Could not kick UBL triggering user {member}: {e}")
+            finally:
+                self._queued_kicks.discard(member.id)
+
+            await asyncio.sleep(UBL_KICK_INTERVAL)
+
+    async def _watch_config(self):
+        await self.bot.wait_until_ready()
+
+        # Don't rescan everything just because the plugin (or bot) started.
+        self._scanned_usernames = self.get_banned_usernames()
+
+        while not self.bot.is_closed():
+            await asyncio.sleep(UBL_CONFIG_CHECK_INTERVAL)
+
+            banned_usernames = self.get_banned_usernames()
+
+            if banned_usernames == self._scanned_usernames:
                 continue
 
-            await after.kick(reason=f"[AUTOMATIC BAN - UBL Module] User {after} changed {u_type} to include UBL "
-                                    f"keyword {ubl_term}")
-            LOG.info("Kicked UBL triggering %s change of user %s (matching UBL %s)", u_type, after, ubl_term)
+            LOG.info("The UBL username list has changed. Rescanning all guilds.")
+            self._scanned_usernames = banned_usernames
+
+            for guild in self.bot.guilds:
+                stats = await self.scan_guild(guild, self.get_scan_kick_limit())
+
+                if stats['held']:
+                    await self._alert_held_scan(guild, stats)
+
+    async def _alert_held_scan(self, guild: discord.Guild, stats: dict):
+        LOG.warning(f"UBL rescan of {guild} matched {stats['held']} members, over the limit of "
+                    f"{self.get_scan_kick_limit()}. Nobody was kicked.")
+
+        alert_channel = self.bot.config.get('specialChannels', {}).get(ChannelKeys.STAFF_LOG.value, None)
+
+        if alert_channel is None:
+            return
+
+        alert_channel = guild.get_channel(alert_channel)
+
+        if alert_channel is None:
+            return
+
+        await alert_channel.send(embed=discord.Embed(
+            title=Emojis.WARNING + " UBL Rescan Held",
+            description=f"The UBL username list changed, and the rescan matched **{stats['held']}** members. That's "
+                        f"over the limit of {self.get_scan_kick_limit()} automatic kicks, so nobody was kicked.\n\n"
+                        f"Please check the UBL for overly broad entries, then run `/ubl scan` to kick the matching "
+                        f"members.",
+            color=Colors.WARNING
+        ))
+
+    @commands.group(name="ubl", brief="Manage the Universal Ban List")
+    @commands.has_permissions(manage_guild=True)
+    async def ubl(self, ctx: commands.Context):
+        pass
+
+    @ubl.command(name="scan", brief="Check all members against the UBL")
+    async def scan(self, ctx: commands.Context):
+        """
+        Check every member of the guild against the banned username list, and kick any that match.
+
+        This normally happens automatically whenever the banned username list changes. Kicks are sent through a
+        rate-limited queue, so they may still be going out for a while after this command reports. If more members
+        match than the automatic kick limit, the scan asks for confirmation before kicking anyone.
+
+        Parameters
+        ----------
+            ctx  :: Discord context <!nodoc>
+        """
+        stats = await self.scan_guild(ctx.guild, self.get_scan_kick_limit())
+
+        if stats['held']:
+            confirm_dialog: discord.Message = await ctx.send(embed=discord.Embed(
+                title="Confirm UBL Scan",
+                description=f"**{stats['held']}** members match the UBL, which is more than the limit of "
+                            f"{self.get_scan_kick_limit()} automatic kicks. Kick all of them?\n\n"
+                            f"To confirm, react with the {Emojis.CHECK} emoji. To cancel, either wait 30 seconds or "
+                            f"press the {Emojis.X} emoji.",
+                color=Colors.WARNING
+            ))
+
+            await confirm_dialog.add_reaction(Emojis.CHECK)
+            await confirm_dialog.add_reaction(Emojis.X)
+
+            reaction = None
+
+            try:
+                reaction, _ = await self.bot.wait_for('reaction_add', timeout=30.0,
+                                                      check=HuskyUtils.confirm_dialog_check(ctx.author))
+            except asyncio.TimeoutError:
+                pass
+
+            await confirm_dialog.clear_reactions()
+
+            if reaction is None or reaction.emoji != Emojis.CHECK:
+                await confirm_dialog.edit(embed=discord.Embed(
+                    title=Emojis.X + " UBL Scan Cancelled",
+                    description=f"No kicks were queued for the {stats['held']} matching members.",
+                    color=Colors.DANGER
+                ))
+                return
+
+            stats = await self.scan_guild(ctx.guild)
+
+        await ctx.send(embed=discord.Embed(
+            title="Universal Ban List Scan",
+            description=f"Checked **{stats['scanned']}** members in {stats['duration']:.2f} seconds.\n"
+                        f"**{stats['matched']}** members match the UBL, and **{stats['queued']}** new kicks were "
+                        f"queued.\n\n"
+                        f"{self._kick_queue.qsize()} kicks are waiting to be sent.",
+            color=Colors.INFO
+        ))
 
 
 def setup(bot: HuskyBot):
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for libhusky's hot paths.
+
+Every benchmark is timed with ``timeit`` (best of several repeats) and reported as nanoseconds per operation. Results
+can be written to JSON and compared against an earlier run to flag regressions:
+
+    python3 tools/benchmark.py --output baseline.json
+    python3 tools/benchmark.py --baseline baseline.json --threshold 0.15
+
+When a baseline is given, the process exits with status 1 if any benchmark got slower than the threshold allows.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import timeit
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+
+from libhusky import HuskyConfig, HuskyConverters, HuskyData, HuskyHTTP, HuskyUtils  # noqa: E402
+from libhusky.HuskyStatics import *  # noqa: E402
+
+import replay  # noqa: E402
+
+BENCHMARKS = {}
+
+SAMPLE_TEXT = "Hey @everyone, check out https://example.com/some/path?query=1 and discord.gg/husky *now*! " \
+              "It's got `code`, [links](https://example.org) and ~~strikes~~. " * 4
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function builds any fixtures and returns the zero-argument callable to time.
+    """
+
+    def decorator(f):
+        BENCHMARKS[name] = f
+        return f
+
+    return decorator
+
+
+def run_async(coro_factory, iterations: int = 100):
+    """
+    Wrap an async operation so it can be timed. Each call runs `iterations` awaits inside one loop turn, so the event
+    loop overhead doesn't drown out the operation itself; the reported number is divided back down.
+    """
+    loop = asyncio.new_event_loop()
+
+    async def batch():
+        for _ in range(iterations):
+            await coro_factory()
+
+    def call():
+        loop.run_until_complete(batch())
+
+    call.batch_size = iterations
+    return call
+
+
+# ---- HuskyConfig -------------------------------------------------------------------------------------------------
+
+
+@benchmark("WolfConfig.get")
+def bench_config_get():
+    config = HuskyConfig.WolfConfig()
+    config.set("antiSpam", {"__global__": {"exemptedRoles": [1, 2, 3]}})
+
+    return lambda: config.get("antiSpam", {})
+
+
+@benchmark("WolfConfig.get (missing key)")
+def bench_config_get_missing():
+    config = HuskyConfig.WolfConfig()
+
+    return lambda: config.get("doesNotExist", [])
+
+
+@benchmark("WolfConfig.set (in-memory)")
+def bench_config_set_memory():
+    config = HuskyConfig.WolfConfig()
+
+    return lambda: config.set("key", 1)
+
+
+@benchmark("WolfConfig.set (persistent)")
+def bench_config_set_persistent():
+    path = os.path.join(tempfile.mkdtemp(prefix="husky-bench-"), "config.json")
+    config = HuskyConfig.WolfConfig(path, create_if_nonexistent=True)
+
+    # Give it a realistically sized config, since every set() rewrites the whole file.
+    config.set("censors", {"global": [f"word{i}" for i in range(200)]})
+    config.set("responses", {f"!r{i}": {"response": "x" * 100, "isEmbed": False} for i in range(100)})
+
+    return lambda: config.set("key", 1)
+
+
+# ---- HuskyUtils --------------------------------------------------------------------------------------------------
+
+
+@benchmark("HuskyUtils.should_process_message")
+def bench_should_process_message():
+    HuskyConfig.__cache__.setdefault('config', HuskyConfig.WolfConfig())
+
+    guild = replay.ReplayGuild(replay.GUILD_ID, replay.ActionRecorder())
+    user = replay.ReplayUser(10000, "someone")
+    member = replay.ReplayMember(guild, user, discord.Permissions.none())
+    message = replay.ReplayMessage(1, guild.get_or_create_channel(100), member, "hello there")
+
+    return lambda: HuskyUtils.should_process_message(message)
+
+
+@benchmark("HuskyUtils.trim_string (short)")
+def bench_trim_string_short():
+    return lambda: HuskyUtils.trim_string("short string", 1000)
+
+
+@benchmark("HuskyUtils.trim_string (long)")
+def bench_trim_string_long():
+    text = SAMPLE_TEXT * 20
+
+    return lambda: HuskyUtils.trim_string(text, 1000)
+
+
+@benchmark("HuskyUtils.calculate_str_entropy")
+def bench_entropy():
+    return lambda: HuskyUtils.calculate_str_entropy(SAMPLE_TEXT)
+
+
+@benchmark("HuskyUtils.escape_markdown")
+def bench_escape_markdown():
+    return lambda: HuskyUtils.escape_markdown(SAMPLE_TEXT)
+
+
+@benchmark("HuskyUtils.get_sort_index (1000 items)")
+def bench_sort_index():
+    items = []
+    for i in range(1000):
+        mute = HuskyData.Mute()
+        mute.expiry = 1500000000 + i * 60
+        items.append(mute)
+
+    target = HuskyData.Mute()
+    target.expiry = 1500000000 + 750 * 60 + 30
+
+    return lambda: HuskyUtils.get_sort_index(items, target, 'expiry')
+
+
+def _write_image_fixtures(directory: str) -> dict:
+    png = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 640, 480) + b'\x08\x02\0\0\0'
+    gif = b'GIF89a' + struct.pack('<HH', 640, 480) + b'\0' * 16
+    jpeg = b'\xff\xd8' \
+           + b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0' + b'\x01\x01\0\0\x01\0\x01\0\0' \
+           + b'\xff\xc0' + struct.pack('>H', 17) + b'\x08' + struct.pack('>HH', 480, 640) + b'\0' * 16
+
+    paths = {}
+    for (name, data) in [("png", png), ("gif", gif), ("jpeg", jpeg)]:
+        paths[name] = os.path.join(directory, f"image.{name}")
+
+        with open(paths[name], 'wb') as f:
+            f.write(data)
+
+    return paths
+
+
+@benchmark("HuskyUtils.get_image_size")
+def bench_image_size():
+    paths = list(_write_image_fixtures(tempfile.mkdtemp(prefix="husky-bench-")).values())
+
+    def call():
+        for path in paths:
+            HuskyUtils.get_image_size(path)
+
+    return call
+
+
+@benchmark("TwitterSnowflake.new")
+def bench_snowflake_new():
+    return lambda: HuskyUtils.TwitterSnowflake.new(1577836800.123, 1, 42, epoch=DISCORD_EPOCH)
+
+
+@benchmark("TwitterSnowflake.load")
+def bench_snowflake_load():
+    return lambda: HuskyUtils.TwitterSnowflake.load(662466873693061120, epoch=DISCORD_EPOCH)
+
+
+# ---- HuskyStatics.Regex ------------------------------------------------------------------------------------------
+
+
+@benchmark("Regex.URL_REGEX findall")
+def bench_url_regex():
+    return lambda: re.findall(Regex.URL_REGEX, SAMPLE_TEXT, re.IGNORECASE)
+
+
+@benchmark("Regex.INVITE_REGEX finditer")
+def bench_invite_regex():
+    return lambda: list(re.finditer(Regex.INVITE_REGEX, SAMPLE_TEXT, flags=re.IGNORECASE))
+
+
+@benchmark("Regex.US_HAM_CALLSIGN_REGEX match")
+def bench_callsign_regex():
+    return lambda: re.match(Regex.US_HAM_CALLSIGN_REGEX + r'$', "KD2ABC")
+
+
+@benchmark("Regex.DICE_CONFIG match")
+def bench_dice_regex():
+    return lambda: re.match(Regex.DICE_CONFIG, "4d20+3a")
+
+
+# ---- HuskyData ---------------------------------------------------------------------------------------------------
+
+
+def _build_mute(i: int) -> HuskyData.Mute:
+    return HuskyData.Mute({
+        "user_id": 100000000000000000 + i,
+        "reason": "Spamming in general",
+        "guild": replay.GUILD_ID,
+        "channel": None if i % 2 else 100,
+        "expiry": 1500000000 + i if i % 5 else None,
+        "perms_cache": 12 if i % 3 else None
+    })
+
+
+@benchmark("Mute.to_data")
+def bench_mute_to_data():
+    mute = _build_mute(1)
+
+    return mute.to_data
+
+
+@benchmark("Mute.load_dict")
+def bench_mute_load_dict():
+    data = _build_mute(1).to_data()
+
+    return lambda: HuskyData.Mute(data)
+
+
+@benchmark("Mute list json.dumps (1000 mutes)")
+def bench_mute_dump():
+    mutes = [_build_mute(i) for i in range(1000)]
+
+    return lambda: json.dumps(mutes, sort_keys=True, default=HuskyConfig.override_dumper, indent=2)
+
+
+@benchmark("Mute.get_cached_override")
+def bench_mute_cached_override():
+    mute = _build_mute(1)
+
+    return mute.get_cached_override
+
+
+# ---- HuskyConverters ---------------------------------------------------------------------------------------------
+
+
+@benchmark("DateDiffConverter.convert")
+def bench_datediff_converter():
+    converter = HuskyConverters.DateDiffConverter()
+
+    return run_async(lambda: converter.convert(None, "1d2h30m15s"))
+
+
+@benchmark("InviteLinkConverter.convert")
+def bench_invite_converter():
+    converter = HuskyConverters.InviteLinkConverter()
+
+    return run_async(lambda: converter.convert(None, "https://discord.gg/husky"))
+
+
+@benchmark("CommandKV.convert")
+def bench_command_kv():
+    converter = HuskyConverters.CommandKV()
+
+    return run_async(lambda: converter.convert(None, "--reason being rude --days 7 --silent"))
+
+
+@benchmark("NicknameConverter.convert (provider)")
+def bench_nickname_converter():
+    converter = HuskyConverters.NicknameConverter()
+
+    return run_async(lambda: converter.convert(None, "%animal%"))
+
+
+# ---- HuskyHTTP ---------------------------------------------------------------------------------------------------
+
+
+class _RouterBot:
+    """
+    Just enough of a bot for HuskyRouter: plugins are looked up by name.
+    """
+
+    def __init__(self, cogs: dict):
+        self._cogs = cogs
+
+    def get_cog(self, name):
+        return self._cogs.get(name)
+
+
+def _build_router(param_routes: bool):
+    router = HuskyHTTP.HuskyRouter()
+
+    async def handler(self, request, **_):
+        return request
+
+    for plugin in range(8):
+        for endpoint in range(5):
+            router.add_route("GET", f"/plugin{plugin}/endpoint{endpoint}", f"Plugin{plugin}", handler)
+            router.add_route("POST", f"/plugin{plugin}/endpoint{endpoint}", f"Plugin{plugin}", handler)
+
+    if param_routes:
+        router.add_route("GET", "/plugin7/users/{user_id}/profile", "Plugin7", handler)
+
+    return router.handle(_RouterBot({f"Plugin{i}": object() for i in range(8)}))
+
+
+@benchmark("HuskyRouter.handle (static path)")
+def bench_router_static():
+    # Uses only what every router version supports, so results compare across versions with --baseline.
+    handle = _build_router(param_routes=False)
+    request = types.SimpleNamespace(path="/plugin7/endpoint4", method="GET")
+
+    return run_async(lambda: handle(request))
+
+
+@benchmark("HuskyRouter.handle (path parameter)")
+def bench_router_param():
+    handle = _build_router(param_routes=True)
+    request = types.SimpleNamespace(path="/plugin7/users/123456789/profile", method="GET")
+
+    return run_async(lambda: handle(request))
+
+
+# ---- Runner ------------------------------------------------------------------------------------------------------
+
+
+def time_benchmark(name: str, repeat: int) -> dict:
+    call = BENCHMARKS[name]()
+    batch_size = getattr(call, 'batch_size', 1)
+
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+
+    ns_per_op = best / (number * batch_size) * 1e9
+
+    return {
+        "ns_per_op": round(ns_per_op, 2),
+        "ops_per_sec": round(1e9 / ns_per_op, 1) if ns_per_op else 0.0,
+        "iterations": number * batch_size,
+        "repeat": repeat
+    }
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+
+    for name, result in results.items():
+        old = baseline.get('results', {}).get(name)
+
+        if old is None:
+            continue
+
+        ratio = result['ns_per_op'] / old['ns_per_op'] if old['ns_per_op'] else 1.0
+        result['baseline_ns_per_op'] = old['ns_per_op']
+        result['change'] = round(ratio - 1.0, 4)
+
+        if ratio > 1.0 + threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run libhusky microbenchmarks.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeats per benchmark (best is kept)")
+    parser.add_argument("--output", metavar="PATH", help="Write results as JSON to PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a previous JSON result")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Slowdown (as a fraction) before a benchmark counts as regressed")
+    parser.add_argument("--list", action="store_true", help="List the available benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS.keys()))
+        return
+
+    names = [n for n in BENCHMARKS.keys() if not args.filter or args.filter.lower() in n.lower()]
+
+    results = {}
+    for name in names:
+        results[name] = time_benchmark(name, args.repeat)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    for name, result in results.items():
+        line = f"{name:<42} {result['ns_per_op']:>14,.1f} ns/op"
+
+        if 'change' in result:
+            flag = "  REGRESSION" if name in regressions else ""
+            line += f"  ({result['change'] * 100:+.1f}% vs baseline){flag}"
+
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.datetime.utcnow().strftime(DATETIME_FORMAT),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "revision": get_git_revision()
+                },
+                "results": results
+            }, f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold * 100:.0f}%.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
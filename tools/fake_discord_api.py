@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the Discord REST API, used to measure how many outbound API calls HuskyBot makes.
+
+The stand-in implements the routes the bot actually uses (messages, bulk deletes, pins, reactions, bans and the ban
+list, kicks, member/role edits, channel overwrites, invites and audit logs). It simulates Discord's per-route rate
+limits - including 429 responses shaped the way discord.py expects them - and records every call it receives.
+
+HuskyBot already honors the ``DISCORD_API_URL`` environment variable, so pointing the bot at this server is just:
+
+    python3 tools/fake_discord_api.py --port 8089 --log calls.jsonl
+    DISCORD_API_URL=http://127.0.0.1:8089/api/v7 ...
+
+Only the REST API is emulated - there is no gateway. To drive events end-to-end without a network connection, use
+``tools/scenario.py``, which runs this server in-process and injects gateway events directly.
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import random
+import time
+
+from aiohttp import web
+
+LOG = logging.getLogger("HuskyBot.Tools.FakeDiscordAPI")
+
+API_PREFIX = "/api/v7"
+DISCORD_EPOCH_MS = 1420070400000
+
+# (limit, window in seconds) per bucket. Buckets are split by method, route and major parameter, just like Discord.
+DEFAULT_RATE_LIMITS = {
+    "POST /channels/{channel_id}/messages": (5, 5.0),
+    "PATCH /channels/{channel_id}/messages/{message_id}": (5, 5.0),
+    "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1.0),
+    "POST /channels/{channel_id}/messages/bulk-delete": (1, 1.0),
+    "GET /channels/{channel_id}/messages": (5, 5.0),
+    "GET /channels/{channel_id}/messages/{message_id}": (5, 5.0),
+    "GET /channels/{channel_id}/pins": (5, 5.0),
+    "PUT /channels/{channel_id}/pins/{message_id}": (5, 5.0),
+    "DELETE /channels/{channel_id}/pins/{message_id}": (5, 5.0),
+    "PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me": (1, 0.25),
+    "GET /channels/{channel_id}/messages/{message_id}/reactions/{emoji}": (5, 5.0),
+    "PUT /guilds/{guild_id}/bans/{user_id}": (5, 5.0),
+    "DELETE /guilds/{guild_id}/bans/{user_id}": (5, 5.0),
+    "GET /guilds/{guild_id}/bans": (5, 5.0),
+    "DELETE /guilds/{guild_id}/members/{user_id}": (5, 5.0),
+    "PATCH /guilds/{guild_id}/members/{user_id}": (10, 10.0),
+    "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+    "DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+    "GET /guilds/{guild_id}/audit-logs": (5, 5.0),
+    "GET /invite/{code}": (5, 5.0),
+}
+DEFAULT_BUCKET_LIMIT = (5, 5.0)
+GLOBAL_RATE_LIMIT = (50, 1.0)
+
+
+def _json(data, status: int = 200, headers: dict = None) -> web.Response:
+    """
+    A JSON response with a bare `application/json` content type. aiohttp's json_response adds a charset, and
+    discord.py 1.3 only decodes JSON when the content type is exactly `application/json`.
+    """
+    response_headers = {"Content-Type": "application/json"}
+    response_headers.update(headers or {})
+
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, headers=response_headers)
+
+
+class RateLimitBucket:
+    def __init__(self, name: str, limit: int, window: float):
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def consume(self, now: float) -> bool:
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+
+        if self.remaining <= 0:
+            return False
+
+        self.remaining -= 1
+        return True
+
+    def headers(self, now: float) -> dict:
+        return {
+            "X-RateLimit-Bucket": self.name,
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": f"{time.time() + max(0.0, self.reset_at - now):.3f}",
+            "X-RateLimit-Reset-After": f"{max(0.0, self.reset_at - now):.3f}"
+        }
+
+
+class FakeDiscordAPI:
+    """
+    The stand-in server itself. Holds just enough state to give plausible answers, and records every call made.
+    """
+
+    def __init__(self, rate_limits: dict = None, error_rate: float = 0.0, bot_user_id: int = 1,
+                 call_log: str = None):
+        self.rate_limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}
+        self.error_rate = error_rate
+        self.bot_user_id = bot_user_id
+
+        self.calls = []
+        self._call_log = open(call_log, 'a') if call_log else None
+        self._buckets = {}
+        self._global_bucket = RateLimitBucket("global", *GLOBAL_RATE_LIMIT)
+        self._rng = random.Random(0)
+        self._sequence = 0
+
+        # Fake state
+        self.users = {}
+        self.messages = collections.defaultdict(dict)
+        self.pins = collections.defaultdict(list)
+        self.reactions = collections.defaultdict(lambda: collections.defaultdict(set))
+        self.bans = collections.defaultdict(dict)
+        self.member_roles = collections.defaultdict(set)
+
+        self.app = web.Application(middlewares=[self._middleware])
+        self._add_routes()
+
+        self._runner = None
+
+    # ---- Public helpers -------------------------------------------------------------------------------------------
+
+    def next_snowflake(self) -> int:
+        self._sequence = (self._sequence + 1) % 4096
+        return ((int(time.time() * 1000) - DISCORD_EPOCH_MS) << 22) | self._sequence
+
+    def register_user(self, user: dict):
+        self.users[int(user['id'])] = user
+
+    def store_message(self, message: dict):
+        self.messages[int(message['channel_id'])][int(message['id'])] = message
+
+    def reset(self):
+        self.calls = []
+        self._buckets = {}
+
+    def summary(self) -> dict:
+        by_route = collections.Counter()
+        by_status = collections.Counter()
+        rate_limited = collections.Counter()
+
+        for call in self.calls:
+            by_route[call['route']] += 1
+            by_status[call['status']] += 1
+
+            if call['status'] == 429:
+                rate_limited[call['route']] += 1
+
+        return {
+            "total": len(self.calls),
+            "by_route": dict(by_route.most_common()),
+            "by_status": {str(k): v for (k, v) in by_status.items()},
+            "rate_limited": dict(rate_limited.most_common())
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+
+        # When asked for an ephemeral port, find out which one we actually got.
+        bound_port = site._server.sockets[0].getsockname()[1]
+
+        LOG.info(f"Fake Discord API listening on {host}:{bound_port}")
+        return f"http://{host}:{bound_port}{API_PREFIX}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+        if self._call_log is not None:
+            self._call_log.close()
+
+    # ---- Plumbing -------------------------------------------------------------------------------------------------
+
+    def _bucket_for(self, method: str, route: str, match_info) -> RateLimitBucket:
+        major = match_info.get('channel_id') or match_info.get('guild_id') or ""
+        key = f"{method} {route}:{major}"
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit, window = self.rate_limits.get(f"{method} {route}", DEFAULT_BUCKET_LIMIT)
+            bucket = RateLimitBucket(f"{method} {route}", limit, window)
+            self._buckets[key] = bucket
+
+        return bucket
+
+    def _record(self, request: web.Request, route: str, status: int):
+        call = {
+            "time": time.time(),
+            "method": request.method,
+            "route": f"{request.method} {route}",
+            "path": request.path,
+            "status": status,
+            "reason": request.headers.get('X-Audit-Log-Reason')
+        }
+
+        self.calls.append(call)
+
+        if self._call_log is not None:
+            self._call_log.write(json.dumps(call) + "\n")
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        route = resource.canonical[len(API_PREFIX):] if resource is not None else request.path
+
+        if route.startswith("/_"):
+            return await handler(request)
+
+        now = time.monotonic()
+        bucket = self._bucket_for(request.method, route, request.match_info)
+
+        if not self._global_bucket.consume(now):
+            self._record(request, route, 429)
+            retry_after = max(0.0, self._global_bucket.reset_at - now)
+            return self._rate_limited(retry_after, is_global=True, headers={"X-RateLimit-Global": "true"})
+
+        if not bucket.consume(now) or (self.error_rate and self._rng.random() < self.error_rate):
+            self._record(request, route, 429)
+            return self._rate_limited(max(0.0, bucket.reset_at - now), headers=bucket.headers(now))
+
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            response = e
+
+        response.headers.update(bucket.headers(now))
+        self._record(request, route, response.status)
+
+        return response
+
+    @staticmethod
+    def _rate_limited(retry_after: float, is_global: bool = False, headers: dict = None):
+        # discord.py treats a 429 without a Via header as a Cloudflare ban, so we must always send one.
+        response_headers = {"Via": "1.1 google", "Retry-After": str(max(1, int(retry_after + 0.999)))}
+        response_headers.update(headers or {})
+
+        return _json({
+            "message": "You are being rate limited.",
+            "retry_after": int(retry_after * 1000),
+            "global": is_global
+        }, status=429, headers=response_headers)
+
+    @staticmethod
+    def _not_found(what: str = "Unknown Message", code: int = 10008):
+        return _json({"message": what, "code": code}, status=404)
+
+    def _user_payload(self, user_id: int) -> dict:
+        return self.users.get(user_id, {
+            "id": str(user_id),
+            "username": f"user{user_id}",
+            "discriminator": "0001",
+            "avatar": None
+        })
+
+    def _message_payload(self, channel_id: int, content: str = "", embed: dict = None) -> dict:
+        message_id = self.next_snowflake()
+
+        return {
+            "id": str(message_id),
+            "channel_id": str(channel_id),
+            "author": self._user_payload(self.bot_user_id),
+            "content": content or "",
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [embed] if embed else [],
+            "pinned": False,
+            "type": 0
+        }
+
+    # ---- Routes ---------------------------------------------------------------------------------------------------
+
+    def _add_routes(self):
+        routes = [
+            ("GET", "/users/@me", self.get_me),
+            ("GET", "/gateway", self.get_gateway),
+            ("GET", "/gateway/bot", self.get_gateway),
+
+            ("POST", "/channels/{channel_id}/messages", self.create_message),
+            ("GET", "/channels/{channel_id}/messages", self.get_history),
+            ("GET", "/channels/{channel_id}/messages/{message_id}", self.get_message),
+            ("PATCH", "/channels/{channel_id}/messages/{message_id}", self.edit_message),
+            ("DELETE", "/channels/{channel_id}/messages/{message_id}", self.delete_message),
+            ("POST", "/channels/{channel_id}/messages/bulk-delete", self.bulk_delete),
+
+            ("GET", "/channels/{channel_id}/pins", self.get_pins),
+            ("PUT", "/channels/{channel_id}/pins/{message_id}", self.pin_message),
+            ("DELETE", "/channels/{channel_id}/pins/{message_id}", self.unpin_message),
+
+            ("PUT", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me", self.add_reaction),
+            ("DELETE", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{user_id}",
+             self.remove_reaction),
+            ("GET", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}", self.get_reactions),
+            ("DELETE", "/channels/{channel_id}/messages/{message_id}/reactions", self.clear_reactions),
+
+            ("PUT", "/channels/{channel_id}/permissions/{target_id}", self.no_content),
+            ("DELETE", "/channels/{channel_id}/permissions/{target_id}", self.no_content),
+            ("POST", "/channels/{channel_id}/typing", self.no_content),
+
+            ("GET", "/guilds/{guild_id}/bans", self.get_bans),
+            ("GET", "/guilds/{guild_id}/bans/{user_id}", self.get_ban),
+            ("PUT", "/guilds/{guild_id}/bans/{user_id}", self.ban),
+            ("DELETE", "/guilds/{guild_id}/bans/{user_id}", self.unban),
+            ("DELETE", "/guilds/{guild_id}/members/{user_id}", self.no_content),
+            ("PATCH", "/guilds/{guild_id}/members/{user_id}", self.edit_member),
+            ("PUT", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.add_role),
+            ("DELETE", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.remove_role),
+            ("GET", "/guilds/{guild_id}/audit-logs", self.get_audit_logs),
+
+            ("GET", "/invite/{code}", self.get_invite),
+            ("GET", "/invites/{code}", self.get_invite),
+        ]
+
+        for (method, path, handler) in routes:
+            self.app.router.add_route(method, API_PREFIX + path, handler)
+
+        self.app.router.add_route("GET", API_PREFIX + "/_stats", self.get_stats)
+        self.app.router.add_route("POST", API_PREFIX + "/_reset", self.post_reset)
+
+    async def get_stats(self, request: web.Request):
+        return _json(self.summary())
+
+    async def post_reset(self, request: web.Request):
+        self.reset()
+        return web.Response(status=204)
+
+    async def no_content(self, request: web.Request):
+        return web.Response(status=204)
+
+    async def get_me(self, request: web.Request):
+        user = dict(self._user_payload(self.bot_user_id))
+        user.update({"bot": True, "verified": True, "mfa_enabled": False, "flags": 0})
+        return _json(user)
+
+    async def get_gateway(self, request: web.Request):
+        return _json({"url": "ws://127.0.0.1:0", "shards": 1})
+
+    async def create_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+
+        if request.content_type == 'application/json':
+            body = await request.json()
+        else:
+            # Multipart (file uploads) - we only care that it happened.
+            body = {}
+
+        message = self._message_payload(channel_id, body.get('content'), body.get('embed'))
+        self.store_message(message)
+
+        return _json(message)
+
+    async def get_history(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        limit = int(request.query.get('limit', 50))
+        before = request.query.get('before')
+        after = request.query.get('after')
+
+        messages = sorted(self.messages[channel_id].values(), key=lambda m: int(m['id']), reverse=True)
+
+        if before is not None:
+            messages = [m for m in messages if int(m['id']) < int(before)]
+
+        if after is not None:
+            messages = [m for m in reversed(messages) if int(m['id']) > int(after)]
+
+        return _json(messages[:limit])
+
+    async def get_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        message = self.messages[channel_id].get(int(request.match_info['message_id']))
+
+        if message is None:
+            return self._not_found()
+
+        return _json(message)
+
+    async def edit_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        message = self.messages[channel_id].get(int(request.match_info['message_id']))
+
+        if message is None:
+            return self._not_found()
+
+        body = await request.json()
+        if 'content' in body:
+            message['content'] = body['content'] or ""
+        if 'embed' in body:
+            message['embeds'] = [body['embed']] if body['embed'] else []
+        message['edited_timestamp'] = datetime.datetime.utcnow().isoformat()
+
+        return _json(message)
+
+    async def delete_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+
+        if self.messages[channel_id].pop(int(request.match_info['message_id']), None) is None:
+            return self._not_found()
+
+        return web.Response(status=204)
+
+    async def bulk_delete(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        body = await request.json()
+
+        for message_id in body.get('messages', []):
+            self.messages[channel_id].pop(int(message_id), None)
+
+        return web.Response(status=204)
+
+    async def get_pins(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+
+        return _json([self.messages[channel_id][mid] for mid in reversed(self.pins[channel_id])
+                                  if mid in self.messages[channel_id]])
+
+    async def pin_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        message_id = int(request.match_info['message_id'])
+
+        if message_id not in self.messages[channel_id]:
+            return self._not_found()
+
+        if len(self.pins[channel_id]) >= 50:
+            return _json({"message": "Maximum number of pins reached (50)", "code": 30003}, status=400)
+
+        if message_id not in self.pins[channel_id]:
+            self.pins[channel_id].append(message_id)
+            self.messages[channel_id][message_id]['pinned'] = True
+
+        return web.Response(status=204)
+
+    async def unpin_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        message_id = int(request.match_info['message_id'])
+
+        if message_id in self.pins[channel_id]:
+            self.pins[channel_id].remove(message_id)
+
+        if message_id in self.messages[channel_id]:
+            self.messages[channel_id][message_id]['pinned'] = False
+
+        return web.Response(status=204)
+
+    async def add_reaction(self, request: web.Request):
+        message_id = int(request.match_info['message_id'])
+        self.reactions[message_id][request.match_info['emoji']].add(self.bot_user_id)
+
+        return web.Response(status=204)
+
+    async def remove_reaction(self, request: web.Request):
+        message_id = int(request.match_info['message_id'])
+        user_id = request.match_info['user_id']
+        user_id = self.bot_user_id if user_id == "@me" else int(user_id)
+
+        self.reactions[message_id][request.match_info['emoji']].discard(user_id)
+
+        return web.Response(status=204)
+
+    async def get_reactions(self, request: web.Request):
+        message_id = int(request.match_info['message_id'])
+        limit = int(request.query.get('limit', 25))
+        after = int(request.query.get('after', 0))
+
+        users = sorted(u for u in self.reactions[message_id][request.match_info['emoji']] if u > after)
+
+        return _json([self._user_payload(u) for u in users[:limit]])
+
+    async def clear_reactions(self, request: web.Request):
+        self.reactions.pop(int(request.match_info['message_id']), None)
+
+        return web.Response(status=204)
+
+    async def get_bans(self, request: web.Request):
+        guild_id = int(request.match_info['guild_id'])
+
+        return _json([{"reason": reason, "user": self._user_payload(user_id)}
+                                  for (user_id, reason) in self.bans[guild_id].items()])
+
+    async def get_ban(self, request: web.Request):
+        guild_id = int(request.match_info['guild_id'])
+        user_id = int(request.match_info['user_id'])
+
+        if user_id not in self.bans[guild_id]:
+            return self._not_found("Unknown Ban", 10026)
+
+        return _json({"reason": self.bans[guild_id][user_id], "user": self._user_payload(user_id)})
+
+    async def ban(self, request: web.Request):
+        guild_id = int(request.match_info['guild_id'])
+        user_id = int(request.match_info['user_id'])
+
+        self.bans[guild_id][user_id] = request.query.get('reason') or request.headers.get('X-Audit-Log-Reason')
+
+        return web.Response(status=204)
+
+    async def unban(self, request: web.Request):
+        guild_id = int(request.match_info['guild_id'])
+
+        if self.bans[guild_id].pop(int(request.match_info['user_id']), None) is None:
+            return self._not_found("Unknown Ban", 10026)
+
+        return web.Response(status=204)
+
+    async def edit_member(self, request: web.Request):
+        user_id = int(request.match_info['user_id'])
+        body = await request.json()
+
+        if 'roles' in body:
+            self.member_roles[user_id] = set(int(r) for r in body['roles'])
+
+        return web.Response(status=204)
+
+    async def add_role(self, request: web.Request):
+        self.member_roles[int(request.match_info['user_id'])].add(int(request.match_info['role_id']))
+
+        return web.Response(status=204)
+
+    async def remove_role(self, request: web.Request):
+        self.member_roles[int(request.match_info['user_id'])].discard(int(request.match_info['role_id']))
+
+        return web.Response(status=204)
+
+    async def get_audit_logs(self, request: web.Request):
+        return _json({"audit_log_entries": [], "users": [], "webhooks": []})
+
+    async def get_invite(self, request: web.Request):
+        code = request.match_info['code']
+
+        return _json({
+            "code": code,
+            "guild": {"id": str(abs(hash(code)) % (1 << 60)), "name": f"Guild for {code}", "icon": None,
+                      "splash": None, "features": []},
+            "channel": {"id": "1", "name": "general", "type": 0},
+            "approximate_member_count": 100,
+            "approximate_presence_count": 10
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Discord REST API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--log", metavar="PATH", help="Append every call to PATH as JSON lines")
+    parser.add_argument("--limits", metavar="PATH", help="JSON file of per-route rate limits to override")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls to answer with a 429")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(name)s: %(message)s")
+
+    rate_limits = None
+    if args.limits:
+        with open(args.limits, 'r') as f:
+            rate_limits = {route: tuple(limit) for (route, limit) in json.load(f).items()}
+
+    api = FakeDiscordAPI(rate_limits=rate_limits, error_rate=args.error_rate, call_log=args.log)
+
+    loop = asyncio.get_event_loop()
+    base_url = loop.run_until_complete(api.start(args.host, args.port))
+    print(f"Set DISCORD_API_URL={base_url} to point HuskyBot at this server. Stats are at {base_url}/_stats")
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(api.stop())
+        print(json.dumps(api.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,684 @@
+#!/usr/bin/env python3
+"""
+Offline replay harness for HuskyBot's moderation pipeline.
+
+This tool loads a trace of guild events (JSON lines) and pushes them through the same listeners the bot runs in
+production - ``HuskyBot.on_message``, Censor, AutoFlag, UniversalBanList, AutoResponder and AntiSpam (with every
+AntiSpam module enabled). Nothing ever talks to Discord: messages, members and channels are lightweight stand-ins that
+record whatever action the bot *would* have taken.
+
+Each line of a trace is a single event:
+
+    {"type": "join", "user": {"id": 200, "name": "someone", "permissions": ["manage_messages"]}}
+    {"type": "message", "id": 1000, "channel": 100, "author": 200, "content": "hello there"}
+    {"type": "edit", "id": 1000, "content": "hello there, edited"}
+
+Authors may be given either as a user ID (for members that already joined) or as a full user object. Messages may also
+carry ``mentions`` (a list of user IDs), ``attachments`` and ``embeds`` (counts).
+
+Usage:
+
+    python3 tools/replay.py --trace my_trace.jsonl
+    python3 tools/replay.py --synthetic 20000 --write-trace synthetic.jsonl --json report.json
+"""
+
+import argparse
+import asyncio
+import collections
+import contextvars
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "plugins"))
+
+import discord  # noqa: E402
+
+from libhusky import HuskyConfig  # noqa: E402
+from libhusky.HuskyStatics import *  # noqa: E402
+
+LOG = logging.getLogger("HuskyBot.Tools.Replay")
+
+REPLAY_PLUGINS = ["Censor", "AutoFlag", "UniversalBanList", "AutoResponder", "AntiSpam"]
+ANTISPAM_MODULES = ["AttachmentFilter", "EmbedFilter", "InviteFilter", "LinkFilter", "MentionFilter",
+                    "NonAsciiFilter", "NonUniqueFilter"]
+
+GUILD_ID = 1000
+EXTERNAL_GUILD_ID = 1001
+
+# The component currently handling an event. Tasks spawned by a handler (e.g. AntiSpam's module fan-out) inherit this,
+# so their actions are attributed to the right plugin.
+COMPONENT = contextvars.ContextVar("component", default="HuskyBot")
+
+
+def build_default_config() -> dict:
+    """
+    Build a configuration that exercises every replayed component.
+    """
+    return {
+        "guildId": GUILD_ID,
+        "prefix": "/",
+        "specialChannels": {
+            ChannelKeys.STAFF_LOG.value: 10,
+            ChannelKeys.STAFF_ALERTS.value: 11
+        },
+        "censors": {
+            "global": ["badword", r"free\s+nitro"]
+        },
+        "flaggedRegexes": ["suspicious", r"\bscam\b"],
+        "flaggedUsers": [],
+        "ubl": {
+            "bannedUsernames": ["spambot"],
+            "bannedPhrases": [r"buy\s+followers"],
+            "kickInviteUsernames": True
+        },
+        "responses": {
+            "!rules": {
+                "requiredRoles": None,
+                "allowedChannels": None,
+                "isEmbed": False,
+                "response": "Please read the rules channel."
+            }
+        },
+        "antiSpam": {name: {"enabled": True} for name in ANTISPAM_MODULES}
+    }
+
+
+class ActionRecorder:
+    """
+    Collects every side effect the replayed plugins attempt, keyed by the component that attempted it.
+    """
+
+    def __init__(self):
+        self.actions = collections.defaultdict(collections.Counter)
+        self.samples = []
+
+    def record(self, action: str, detail: str = None):
+        component = COMPONENT.get()
+        self.actions[component][action] += 1
+
+        if detail is not None and len(self.samples) < 50:
+            self.samples.append({"component": component, "action": action, "detail": detail})
+
+    def to_dict(self):
+        return {component: dict(counter) for component, counter in self.actions.items()}
+
+
+class ReplayUser:
+    """
+    Stand-in for the ``discord.User`` wrapped by a member.
+    """
+
+    def __init__(self, user_id: int, name: str, discriminator: str = "0001", bot: bool = False):
+        self.id = user_id
+        self.name = name
+        self.discriminator = discriminator
+        self.bot = bot
+        self.avatar = None
+        self.avatar_url = ""
+        self.default_avatar_url = ""
+        self.created_at = discord.utils.snowflake_time(user_id)
+
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+
+class ReplayMember(discord.Member):
+    """
+    Stand-in for ``discord.Member``. Moderation calls are recorded instead of being sent to Discord.
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, guild, user: ReplayUser, permissions: discord.Permissions, nick: str = None,
+                 joined_at: datetime.datetime = None):
+        self._user = user
+        self._state = None
+        self._roles = discord.utils.SnowflakeList([])
+        self._client_status = {None: 'online'}
+        self.guild = guild
+        self.nick = nick
+        self.joined_at = joined_at or datetime.datetime.utcnow()
+        self.premium_since = None
+        self.activities = ()
+        self._permissions = permissions
+
+    @property
+    def roles(self):
+        return [self.guild.default_role]
+
+    @property
+    def top_role(self):
+        return self.guild.default_role
+
+    @property
+    def guild_permissions(self):
+        return self._permissions
+
+    async def ban(self, *, reason=None, delete_message_days=1):
+        await self.guild.ban(self, reason=reason, delete_message_days=delete_message_days)
+
+    async def kick(self, *, reason=None):
+        await self.guild.kick(self, reason=reason)
+
+    async def add_roles(self, *roles, reason=None, atomic=True):
+        self.guild.recorder.record("add_roles", f"{self} +{roles}")
+
+    async def remove_roles(self, *roles, reason=None, atomic=True):
+        self.guild.recorder.record("remove_roles", f"{self} -{roles}")
+
+    async def edit(self, *, reason=None, **fields):
+        self.guild.recorder.record("edit_member", f"{self} {fields}")
+
+
+class ReplayTextChannel(discord.TextChannel):
+    """
+    Stand-in for ``discord.TextChannel``. Sends are recorded instead of being posted.
+    """
+
+    # noinspection PyMissingConstructor
+    def __init__(self, guild, channel_id: int, name: str):
+        self._state = None
+        self._type = discord.ChannelType.text.value
+        self._overwrites = []
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.topic = None
+        self.nsfw = False
+        self.category_id = None
+        self.position = 0
+        self.slowmode_delay = 0
+        self.last_message_id = None
+
+    def permissions_for(self, member):
+        return member.guild_permissions
+
+    async def send(self, content=None, *, embed=None, delete_after=None, **kwargs):
+        title = embed.title if (embed is not None and embed.title) else None
+        self.guild.recorder.record("send", f"#{self.name}: {title or content}")
+
+    async def delete_messages(self, messages):
+        self.guild.recorder.record("bulk_delete", f"#{self.name}: {len(messages)} messages")
+
+
+class ReplayRole:
+    def __init__(self, guild):
+        self.id = guild.id
+        self.name = "@everyone"
+        self.position = 0
+        self.permissions = discord.Permissions.general()
+
+    def is_default(self):
+        return True
+
+    def __str__(self):
+        return self.name
+
+
+class ReplayGuild:
+    """
+    Stand-in for ``discord.Guild``, holding all replayed members and channels.
+    """
+
+    def __init__(self, guild_id: int, recorder: ActionRecorder):
+        self.id = guild_id
+        self.name = "Replay Guild"
+        self.recorder = recorder
+        self.default_role = ReplayRole(self)
+        self._members = {}
+        self._channels = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    @property
+    def text_channels(self):
+        return list(self._channels.values())
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return self.default_role if role_id == self.id else None
+
+    def get_or_create_channel(self, channel_id: int):
+        channel = self._channels.get(channel_id)
+
+        if channel is None:
+            channel = ReplayTextChannel(self, channel_id, f"channel-{channel_id}")
+            self._channels[channel_id] = channel
+
+        return channel
+
+    def add_member(self, member: ReplayMember):
+        self._members[member.id] = member
+
+    async def ban(self, user, *, reason=None, delete_message_days=1):
+        self.recorder.record("ban", f"{user}: {reason}")
+        self._members.pop(user.id, None)
+
+    async def unban(self, user, *, reason=None):
+        self.recorder.record("unban", f"{user}: {reason}")
+
+    async def kick(self, user, *, reason=None):
+        self.recorder.record("kick", f"{user}: {reason}")
+        self._members.pop(user.id, None)
+
+
+class ReplayMessage:
+    """
+    Stand-in for ``discord.Message``.
+    """
+
+    def __init__(self, message_id: int, channel: ReplayTextChannel, author: ReplayMember, content: str,
+                 mentions: list = None, attachments: int = 0, embeds: int = 0):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.mentions = mentions or []
+        self.attachments = [_ReplayAttachment(message_id, i) for i in range(attachments)]
+        self.embeds = [discord.Embed() for _ in range(embeds)]
+        self.webhook_id = None
+        self.type = discord.MessageType.default
+        self.created_at = datetime.datetime.utcnow()
+        self.edited_at = None
+
+    @property
+    def clean_content(self):
+        return self.content
+
+    def is_system(self):
+        return False
+
+    async def delete(self, *, delay=None):
+        self.guild.recorder.record("delete", f"{self.id} by {self.author}")
+
+    async def add_reaction(self, emoji):
+        self.guild.recorder.record("add_reaction", f"{self.id}: {emoji}")
+
+
+class _ReplayAttachment:
+    def __init__(self, message_id: int, index: int):
+        self.id = message_id * 10 + index
+        self.filename = f"attachment-{index}.png"
+        self.url = f"https://cdn.example.invalid/{message_id}/{self.filename}"
+        self.proxy_url = self.url
+
+
+class ReplayHTTP:
+    """
+    Replaces the bot's HTTP client. Any raw route request (e.g. InviteFilter's invite lookups) gets a canned payload.
+    """
+
+    def __init__(self, recorder: ActionRecorder):
+        self._recorder = recorder
+
+    async def request(self, route, **kwargs):
+        self._recorder.record("http_request", f"{route.method} {route.path}")
+
+        return {
+            "code": "replay",
+            "guild": {"id": str(EXTERNAL_GUILD_ID), "name": "Some Other Guild"},
+            "channel": {"id": "1", "type": 0, "name": "general"}
+        }
+
+
+def build_replay_bot(config: dict, recorder: ActionRecorder, guild: ReplayGuild):
+    # The config must be seeded *before* the bot is created, as HuskyBot pulls it from the shared cache.
+    replay_config = HuskyConfig.WolfConfig()
+    for key, value in config.items():
+        replay_config.set(key, value)
+    HuskyConfig.__cache__['config'] = replay_config
+
+    from HuskyBot import HuskyBot
+
+    class ReplayBot(HuskyBot):
+        def __init__(self):
+            super().__init__()
+            self.http = ReplayHTTP(recorder)
+            self._connection.user = ReplayUser(1, "HuskyBot", bot=True)
+
+        def get_channel(self, channel_id):
+            return guild.get_channel(channel_id)
+
+        def get_guild(self, guild_id):
+            return guild if guild_id == guild.id else None
+
+        async def process_commands(self, message):
+            recorder.record("command", message.content.split(' ')[0])
+
+    bot = ReplayBot()
+
+    for plugin in REPLAY_PLUGINS:
+        bot.load_extension(plugin)
+
+    return bot
+
+
+class Replayer:
+    def __init__(self, bot, guild: ReplayGuild):
+        self.bot = bot
+        self.guild = guild
+
+        self._messages = {}
+        self._listeners = {}
+
+        self.latencies = collections.defaultdict(list)
+        self.component_latencies = collections.defaultdict(list)
+        self.event_counts = collections.Counter()
+
+        for event in ["on_message", "on_message_edit", "on_member_join"]:
+            listeners = []
+
+            bot_handler = getattr(bot, event, None)
+            if bot_handler is not None:
+                listeners.append(("HuskyBot", bot_handler))
+
+            for cog_name, cog in bot.cogs.items():
+                for listener_name, listener in cog.get_listeners():
+                    if listener_name == event:
+                        listeners.append((cog_name, listener))
+
+            self._listeners[event] = listeners
+
+    def _resolve_member(self, data) -> ReplayMember:
+        if isinstance(data, dict):
+            member = self.guild.get_member(data['id'])
+
+            if member is None:
+                member = self._build_member(data)
+                self.guild.add_member(member)
+
+            return member
+
+        member = self.guild.get_member(data)
+
+        if member is None:
+            member = self._build_member({"id": data})
+            self.guild.add_member(member)
+
+        return member
+
+    def _build_member(self, data: dict) -> ReplayMember:
+        user = ReplayUser(data['id'], data.get('name', f"user{data['id']}"), bot=data.get('bot', False))
+        permissions = discord.Permissions(**{p: True for p in data.get('permissions', [])})
+
+        joined_at = None
+        if data.get('joined_seconds_ago') is not None:
+            joined_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=data['joined_seconds_ago'])
+
+        return ReplayMember(self.guild, user, permissions, nick=data.get('nick'), joined_at=joined_at)
+
+    async def _run_listener(self, component: str, handler, args):
+        COMPONENT.set(component)
+        start = time.perf_counter()
+
+        try:
+            await handler(*args)
+        except Exception as e:
+            # In production, this would land in HuskyBot.on_error. Record it and keep replaying.
+            self.guild.recorder.record("error", f"{type(e).__name__}: {e}")
+
+        self.component_latencies[component].append(time.perf_counter() - start)
+
+    async def _dispatch(self, event: str, *args):
+        current = asyncio.current_task()
+        known_tasks = asyncio.all_tasks()
+
+        await asyncio.gather(*[self._run_listener(component, handler, args)
+                               for (component, handler) in self._listeners[event]])
+
+        # Handlers like AntiSpam and AutoFlag fan out with ensure_future; wait for those too so they're timed.
+        while True:
+            spawned = asyncio.all_tasks() - known_tasks - {current}
+            if not spawned:
+                break
+
+            known_tasks |= spawned
+            await asyncio.gather(*spawned, return_exceptions=True)
+
+    async def replay_event(self, event: dict):
+        event_type = event['type']
+
+        if event_type == 'join':
+            member = self._build_member(event['user'])
+            self.guild.add_member(member)
+            args = ("on_member_join", member)
+        elif event_type == 'message':
+            channel = self.guild.get_or_create_channel(event.get('channel', 100))
+            message = ReplayMessage(
+                message_id=event['id'],
+                channel=channel,
+                author=self._resolve_member(event['author']),
+                content=event.get('content', ''),
+                mentions=[self._resolve_member(m) for m in event.get('mentions', [])],
+                attachments=event.get('attachments', 0),
+                embeds=event.get('embeds', 0)
+            )
+            self._messages[message.id] = message
+            args = ("on_message", message)
+        elif event_type == 'edit':
+            before = self._messages.get(event['id'])
+
+            if before is None:
+                return
+
+            after = ReplayMessage(before.id, before.channel, before.author, event.get('content', ''),
+                                  mentions=before.mentions)
+            after.edited_at = datetime.datetime.utcnow()
+            self._messages[after.id] = after
+            args = ("on_message_edit", before, after)
+        else:
+            raise ValueError(f"Unknown trace event type {event_type}")
+
+        start = time.perf_counter()
+        await self._dispatch(*args)
+        self.latencies[event_type].append(time.perf_counter() - start)
+        self.event_counts[event_type] += 1
+
+    async def replay(self, events: list) -> float:
+        start = time.perf_counter()
+
+        for event in events:
+            await self.replay_event(event)
+
+        return time.perf_counter() - start
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def load_trace(path: str) -> list:
+    events = []
+
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+
+            if not line:
+                continue
+
+            events.append(json.loads(line))
+
+    return events
+
+
+def generate_synthetic_trace(count: int, seed: int = 0) -> list:
+    """
+    Generate a synthetic trace that roughly resembles a busy guild with some abuse mixed in.
+    """
+    rng = random.Random(seed)
+    events = []
+
+    normal_lines = ["hey everyone", "has anyone tried the new firmware?", "lol", "what board are you using",
+                    "check the pins for the wiring diagram", "thanks, that fixed it!", "brb", "good morning"]
+    abusive_lines = ["this is a badword", "free nitro here", "that looks suspicious", "buy followers cheap",
+                     "join discord.gg/spamspam", "https://a.example https://b.example https://c.example",
+                     "ẗ̸̢h̷̹̓i̶͎͝s̵̱̈ ̶̦̆ì̸̞s̸̰̈ ̵̣͘z̵̰̈́a̷̱̔l̸̢̈g̴̣̈́o̵̝͝", "!rules", "/ping"]
+
+    users = []
+    for i in range(50):
+        users.append({
+            "id": 10000 + i,
+            "name": f"regular{i}",
+            "permissions": ["manage_messages"] if i < 3 else [],
+            "joined_seconds_ago": 86400
+        })
+        events.append({"type": "join", "user": users[-1]})
+
+    message_id = 500000
+    while len(events) < count:
+        roll = rng.random()
+
+        if roll < 0.03:
+            user_id = 20000 + len(users)
+            name = "spambot" + str(user_id) if rng.random() < 0.3 else f"newcomer{user_id}"
+            users.append({"id": user_id, "name": name, "joined_seconds_ago": 0})
+            events.append({"type": "join", "user": users[-1]})
+        elif roll < 0.08 and message_id > 500000:
+            events.append({"type": "edit", "id": rng.randint(500000, message_id - 1),
+                           "content": rng.choice(normal_lines + abusive_lines)})
+        else:
+            message = {
+                "type": "message",
+                "id": message_id,
+                "channel": 100 + rng.randint(0, 9),
+                "author": rng.choice(users)['id'],
+                "content": rng.choice(abusive_lines) if rng.random() < 0.1 else rng.choice(normal_lines)
+            }
+
+            if rng.random() < 0.01:
+                message['mentions'] = [u['id'] for u in rng.sample(users, min(len(users), 12))]
+
+            if rng.random() < 0.02:
+                message['attachments'] = rng.randint(1, 3)
+
+            events.append(message)
+            message_id += 1
+
+    return events
+
+
+def build_report(replayer: Replayer, recorder: ActionRecorder, elapsed: float) -> dict:
+    all_latencies = [lat for lats in replayer.latencies.values() for lat in lats]
+    total_events = sum(replayer.event_counts.values())
+
+    def summarize(values):
+        return {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(max(values) * 1000, 3) if values else 0.0
+        }
+
+    return {
+        "events": total_events,
+        "elapsed_s": round(elapsed, 3),
+        "events_per_second": round(total_events / elapsed, 1) if elapsed else 0.0,
+        "messages_per_second": round(replayer.event_counts['message'] / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize(all_latencies),
+        "latency_by_event": {event: summarize(lats) for (event, lats) in replayer.latencies.items()},
+        "latency_by_component": {c: summarize(lats) for (c, lats) in replayer.component_latencies.items()},
+        "actions": recorder.to_dict(),
+        "action_samples": recorder.samples
+    }
+
+
+def print_report(report: dict):
+    print(f"Replayed {report['events']} events in {report['elapsed_s']}s "
+          f"({report['events_per_second']} events/s, {report['messages_per_second']} messages/s)")
+    print(f"Latency: p50={report['latency']['p50_ms']}ms p99={report['latency']['p99_ms']}ms "
+          f"max={report['latency']['max_ms']}ms")
+
+    print("\nLatency by event:")
+    for event, stats in sorted(report['latency_by_event'].items()):
+        print(f"  {event:<16} n={stats['count']:<8} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms")
+
+    print("\nLatency by component (handler only):")
+    for component, stats in sorted(report['latency_by_component'].items()):
+        print(f"  {component:<16} n={stats['count']:<8} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms")
+
+    print("\nActions that would have been taken:")
+    if not report['actions']:
+        print("  (none)")
+    for component, actions in sorted(report['actions'].items()):
+        summary = ", ".join(f"{action}={count}" for (action, count) in sorted(actions.items()))
+        print(f"  {component:<16} {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a message trace through HuskyBot's moderation pipeline.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="Path to a JSON lines trace to replay")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Generate and replay N synthetic events")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic trace generator")
+    parser.add_argument("--write-trace", metavar="PATH", help="Write the synthetic trace to PATH")
+    parser.add_argument("--config", help="A bot config JSON to replay against, instead of the built-in one")
+    parser.add_argument("--json", metavar="PATH", help="Write the full report as JSON to PATH")
+    args = parser.parse_args()
+
+    if args.trace:
+        events = load_trace(args.trace)
+    else:
+        events = generate_synthetic_trace(args.synthetic, args.seed)
+
+        if args.write_trace:
+            with open(args.write_trace, 'w') as f:
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    else:
+        config = build_default_config()
+
+    # The replay itself should never write into the real bot's config directory.
+    os.environ.setdefault('HUSKYBOT_CONFIG_PREFIX', 'replay')
+
+    recorder = ActionRecorder()
+    guild = ReplayGuild(config.get('guildId', GUILD_ID), recorder)
+
+    for channel_id in config.get('specialChannels', {}).values():
+        guild.get_or_create_channel(channel_id)
+
+    bot = build_replay_bot(config, recorder, guild)
+
+    # Plugins log every action they take, which would dominate the timings.
+    logging.getLogger("HuskyBot").setLevel(logging.WARNING)
+
+    replayer = Replayer(bot, guild)
+    elapsed = bot.loop.run_until_complete(replayer.replay(events))
+
+    report = build_report(replayer, recorder, elapsed)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
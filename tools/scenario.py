@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Scripted scenario runner for HuskyBot, backed by the local Discord REST stand-in.
+
+Unlike ``tools/replay.py`` (which stubs out every Discord call), this runner uses real discord.py objects and a real
+``HTTPClient``. Every REST call a plugin makes travels over HTTP to ``tools/fake_discord_api.py`` running in-process, so
+the numbers include discord.py's own rate limit handling. Gateway events are injected directly from the same JSON lines
+trace format the replay harness uses, extended with ``leave`` events:
+
+    {"type": "leave", "user": 200}
+
+The report breaks REST calls down per plugin and per event type, so it's easy to see what a single join or message
+costs in API traffic.
+
+Usage:
+
+    python3 tools/scenario.py --scenario raid --size 500
+    python3 tools/scenario.py --trace my_trace.jsonl --plugins Censor,AntiSpam,ServerLog
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "plugins"))
+
+import discord  # noqa: E402
+
+from libhusky import HuskyConfig  # noqa: E402
+from libhusky.HuskyStatics import *  # noqa: E402
+
+import fake_discord_api  # noqa: E402
+import replay  # noqa: E402
+
+LOG = logging.getLogger("HuskyBot.Tools.Scenario")
+
+DEFAULT_PLUGINS = replay.REPLAY_PLUGINS + ["ServerLog", "GuildSecurity"]
+
+MODERATOR_ROLE_ID = 2000
+MUTED_ROLE_ID = 2001
+
+
+def build_raid_scenario(size: int) -> list:
+    """
+    A join raid: `size` fresh accounts join, then each posts an invite and a mass mention.
+    """
+    events = []
+    regulars = [10000 + i for i in range(20)]
+
+    for i in range(size):
+        user_id = 30000 + i
+        events.append({"type": "join", "user": {"id": user_id, "name": f"raider{i}", "joined_seconds_ago": 0}})
+
+    message_id = 700000
+    for i in range(size):
+        user_id = 30000 + i
+        events.append({"type": "message", "id": message_id, "channel": 100, "author": user_id,
+                       "content": f"join discord.gg/raid{i % 7} now"})
+        events.append({"type": "message", "id": message_id + 1, "channel": 100, "author": user_id,
+                       "content": "hey", "mentions": regulars})
+        message_id += 2
+
+    return events
+
+
+SCENARIOS = {
+    "raid": build_raid_scenario,
+    "chatter": lambda size: replay.generate_synthetic_trace(size)
+}
+
+
+class ScenarioRunner:
+    def __init__(self, api: fake_discord_api.FakeDiscordAPI, plugins: list):
+        self.api = api
+        self.plugins = plugins
+
+        self.bot = None
+        self.guild = None
+
+        self.rest_calls = collections.defaultdict(collections.Counter)
+        self.rest_calls_by_event = collections.defaultdict(collections.Counter)
+        self.event_counts = collections.Counter()
+        self.latencies = collections.defaultdict(list)
+
+        self._messages = {}
+        self._listeners = {}
+
+    async def setup(self, config: dict, member_count: int):
+        # Config must be seeded before the bot exists, as HuskyBot pulls it from the shared cache.
+        scenario_config = HuskyConfig.WolfConfig()
+        for key, value in config.items():
+            scenario_config.set(key, value)
+        HuskyConfig.__cache__['config'] = scenario_config
+
+        from HuskyBot import HuskyBot
+
+        self.bot = HuskyBot()
+        self._instrument_http()
+
+        user_data = await self.bot.http.static_login("scenario-token", bot=True)
+        self.bot._connection.user = discord.ClientUser(state=self.bot._connection, data=user_data)
+
+        guild_data = self._build_guild_payload(config, member_count)
+        self.guild = discord.Guild(data=guild_data, state=self.bot._connection)
+        self.bot._connection._add_guild(self.guild)
+
+        for plugin in self.plugins:
+            self.bot.load_extension(plugin)
+
+        for event in ["on_message", "on_message_edit", "on_member_join", "on_member_remove"]:
+            listeners = []
+
+            bot_handler = getattr(self.bot, event, None)
+            if bot_handler is not None:
+                listeners.append(("HuskyBot", bot_handler))
+
+            for cog_name, cog in self.bot.cogs.items():
+                for listener_name, listener in cog.get_listeners():
+                    if listener_name == event:
+                        listeners.append((cog_name, listener))
+
+            self._listeners[event] = listeners
+
+        # Ignore anything the setup itself did (e.g. the login call).
+        self.api.reset()
+        self.rest_calls.clear()
+
+    async def teardown(self):
+        await self.bot.http.close()
+
+    def _instrument_http(self):
+        original_request = self.bot.http.request
+        event_type = self._current_event_type
+
+        async def request(route, **kwargs):
+            route_name = f"{route.method} {route.path}"
+            self.rest_calls[replay.COMPONENT.get()][route_name] += 1
+            self.rest_calls_by_event[event_type()][route_name] += 1
+            return await original_request(route, **kwargs)
+
+        self.bot.http.request = request
+
+    def _current_event_type(self):
+        return getattr(self, '_event_type', 'setup')
+
+    def _user_payload(self, data: dict) -> dict:
+        return {
+            "id": str(data['id']),
+            "username": data.get('name', f"user{data['id']}"),
+            "discriminator": "0001",
+            "avatar": None,
+            "bot": data.get('bot', False)
+        }
+
+    def _member_payload(self, data: dict) -> dict:
+        roles = [str(MODERATOR_ROLE_ID)] if data.get('permissions') else []
+        joined_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=data.get('joined_seconds_ago', 86400))
+
+        return {
+            "user": self._user_payload(data),
+            "roles": roles,
+            "joined_at": joined_at.isoformat(),
+            "premium_since": None,
+            "nick": data.get('nick'),
+            "deaf": False,
+            "mute": False
+        }
+
+    def _build_guild_payload(self, config: dict, member_count: int) -> dict:
+        guild_id = config.get('guildId', replay.GUILD_ID)
+        channel_ids = sorted(set(list(config.get('specialChannels', {}).values()) + list(range(100, 110))))
+
+        members = []
+        for i in range(member_count):
+            data = {"id": 10000 + i, "name": f"regular{i}", "permissions": ["manage_messages"] if i < 3 else []}
+            self.api.register_user(self._user_payload(data))
+            members.append(self._member_payload(data))
+
+        return {
+            "id": str(guild_id),
+            "name": "Scenario Guild",
+            "owner_id": "10000",
+            "member_count": member_count,
+            "roles": [
+                {"id": str(guild_id), "name": "@everyone", "permissions": discord.Permissions.general().value,
+                 "position": 0},
+                {"id": str(MODERATOR_ROLE_ID), "name": "Moderators",
+                 "permissions": discord.Permissions(manage_messages=True, kick_members=True,
+                                                    ban_members=True).value,
+                 "position": 2},
+                {"id": str(MUTED_ROLE_ID), "name": "Muted", "permissions": 0, "position": 1}
+            ],
+            "channels": [{"id": str(c), "type": 0, "name": f"channel-{c}", "position": i,
+                          "permission_overwrites": []} for (i, c) in enumerate(channel_ids)],
+            "members": members,
+            "emojis": [],
+            "features": []
+        }
+
+    def _get_member(self, data) -> discord.Member:
+        if isinstance(data, dict):
+            member = self.guild.get_member(data['id'])
+            return member or self._add_member(data)
+
+        return self.guild.get_member(data) or self._add_member({"id": data})
+
+    def _add_member(self, data: dict) -> discord.Member:
+        self.api.register_user(self._user_payload(data))
+        member = discord.Member(data=self._member_payload(data), guild=self.guild, state=self.bot._connection)
+        self.guild._add_member(member)
+        self.guild._member_count = len(self.guild._members)
+
+        return member
+
+    def _message_payload(self, event: dict, author: discord.Member, content: str) -> dict:
+        return {
+            "id": str(event['id']),
+            "channel_id": str(event.get('channel', 100)),
+            "guild_id": str(self.guild.id),
+            "author": self._user_payload({"id": author.id, "name": author.name, "bot": author.bot}),
+            "content": content,
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [self._user_payload({"id": m}) for m in event.get('mentions', [])],
+            "mention_roles": [],
+            "attachments": [{"id": str(event['id'] * 10 + i), "filename": f"file{i}.png", "size": 1024,
+                             "url": f"https://cdn.example.invalid/{event['id']}/{i}.png",
+                             "proxy_url": f"https://cdn.example.invalid/{event['id']}/{i}.png"}
+                            for i in range(event.get('attachments', 0))],
+            "embeds": [{"type": "rich"} for _ in range(event.get('embeds', 0))],
+            "pinned": False,
+            "type": 0
+        }
+
+    async def _run_listener(self, component: str, handler, args):
+        replay.COMPONENT.set(component)
+
+        try:
+            await handler(*args)
+        except Exception as e:
+            LOG.warning(f"{component} raised {type(e).__name__}: {e}")
+
+    async def _dispatch(self, event: str, *args):
+        current = asyncio.current_task()
+        known_tasks = asyncio.all_tasks()
+
+        await asyncio.gather(*[self._run_listener(component, handler, args)
+                               for (component, handler) in self._listeners[event]])
+
+        while True:
+            spawned = asyncio.all_tasks() - known_tasks - {current}
+            if not spawned:
+                break
+
+            known_tasks |= spawned
+            await asyncio.gather(*spawned, return_exceptions=True)
+
+    async def run_event(self, event: dict):
+        event_type = event['type']
+        self._event_type = event_type
+
+        if event_type == 'join':
+            args = ("on_member_join", self._add_member(event['user']))
+        elif event_type == 'leave':
+            user_id = event['user']['id'] if isinstance(event['user'], dict) else event['user']
+            member = self.guild.get_member(user_id)
+
+            if member is None:
+                return
+
+            self.guild._remove_member(member)
+            args = ("on_member_remove", member)
+        elif event_type == 'message':
+            author = self._get_member(event['author'])
+            payload = self._message_payload(event, author, event.get('content', ''))
+            self.api.store_message(payload)
+
+            channel = self.guild.get_channel(int(payload['channel_id']))
+            message = discord.Message(state=self.bot._connection, channel=channel, data=payload)
+            self._messages[message.id] = payload
+            args = ("on_message", message)
+        elif event_type == 'edit':
+            before_payload = self._messages.get(event['id'])
+
+            if before_payload is None:
+                return
+
+            after_payload = dict(before_payload, content=event.get('content', ''),
+                                 edited_timestamp=datetime.datetime.utcnow().isoformat())
+            channel = self.guild.get_channel(int(before_payload['channel_id']))
+            before = discord.Message(state=self.bot._connection, channel=channel, data=before_payload)
+            after = discord.Message(state=self.bot._connection, channel=channel, data=after_payload)
+            self._messages[after.id] = after_payload
+            args = ("on_message_edit", before, after)
+        else:
+            raise ValueError(f"Unknown trace event type {event_type}")
+
+        start = time.perf_counter()
+        await self._dispatch(*args)
+        self.latencies[event_type].append(time.perf_counter() - start)
+        self.event_counts[event_type] += 1
+
+    async def run(self, events: list) -> float:
+        start = time.perf_counter()
+
+        for event in events:
+            await self.run_event(event)
+
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> dict:
+        per_event = {}
+        for event_type, calls in self.rest_calls_by_event.items():
+            count = self.event_counts.get(event_type, 0)
+            per_event[event_type] = {
+                "events": count,
+                "rest_calls": sum(calls.values()),
+                "rest_calls_per_event": round(sum(calls.values()) / count, 3) if count else 0.0,
+                "by_route": dict(calls.most_common())
+            }
+
+        total_events = sum(self.event_counts.values())
+
+        return {
+            "events": total_events,
+            "elapsed_s": round(elapsed, 3),
+            "events_per_second": round(total_events / elapsed, 1) if elapsed else 0.0,
+            "latency_p50_ms": round(replay.percentile(sum(self.latencies.values(), []), 50) * 1000, 3),
+            "latency_p99_ms": round(replay.percentile(sum(self.latencies.values(), []), 99) * 1000, 3),
+            "rest_calls_by_plugin": {c: dict(calls.most_common()) for (c, calls) in self.rest_calls.items()},
+            "rest_calls_by_event": per_event,
+            "server": self.api.summary()
+        }
+
+
+def print_report(report: dict):
+    server = report['server']
+
+    print(f"Ran {report['events']} events in {report['elapsed_s']}s ({report['events_per_second']} events/s), "
+          f"p50={report['latency_p50_ms']}ms p99={report['latency_p99_ms']}ms")
+    print(f"Server saw {server['total']} REST calls, {sum(server['rate_limited'].values())} of them rate limited")
+
+    print("\nREST calls per event:")
+    for event_type, stats in sorted(report['rest_calls_by_event'].items()):
+        print(f"  {event_type:<10} {stats['rest_calls_per_event']:>8} calls/event ({stats['rest_calls']} total)")
+
+    print("\nREST calls by plugin:")
+    for component, calls in sorted(report['rest_calls_by_plugin'].items()):
+        print(f"  {component}:")
+        for route, count in calls.items():
+            print(f"    {count:>7}  {route}")
+
+    if server['rate_limited']:
+        print("\n429s by route:")
+        for route, count in server['rate_limited'].items():
+            print(f"  {count:>7}  {route}")
+
+
+async def run_scenario(args, events: list, config: dict) -> dict:
+    api = fake_discord_api.FakeDiscordAPI(error_rate=args.error_rate)
+    base_url = await api.start()
+
+    # HuskyBot reads this in its constructor, so it must be set before the bot is created.
+    os.environ['DISCORD_API_URL'] = base_url
+
+    plugins = args.plugins.split(',') if args.plugins else DEFAULT_PLUGINS
+    runner = ScenarioRunner(api, plugins)
+
+    try:
+        await runner.setup(config, args.members)
+        logging.getLogger("HuskyBot").setLevel(logging.WARNING)
+
+        elapsed = await runner.run(events)
+        return runner.report(elapsed)
+    finally:
+        await runner.teardown()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a scripted scenario against a local Discord REST stand-in.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="Path to a JSON lines trace to run")
+    source.add_argument("--scenario", choices=sorted(SCENARIOS.keys()), help="A built-in scenario to run")
+    parser.add_argument("--size", type=int, default=200, help="Size of the built-in scenario")
+    parser.add_argument("--members", type=int, default=1000, help="Number of pre-existing guild members")
+    parser.add_argument("--plugins", help="Comma-separated plugins to load (default: moderation plugins)")
+    parser.add_argument("--config", help="A bot config JSON to run against, instead of the built-in one")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls to randomly 429")
+    parser.add_argument("--json", metavar="PATH", help="Write the full report as JSON to PATH")
+    args = parser.parse_args()
+
+    events = replay.load_trace(args.trace) if args.trace else SCENARIOS[args.scenario](args.size)
+
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    else:
+        config = replay.build_default_config()
+        config['specialRoles'] = {SpecialRoleKeys.MUTED.value: MUTED_ROLE_ID}
+        config['loggers'] = {"userJoin": {}, "userLeave": {}, "userBan": {}, "messageDelete": {}}
+        config['specialChannels'][ChannelKeys.USER_LOG.value] = 12
+        config['specialChannels'][ChannelKeys.MESSAGE_LOG.value] = 13
+
+    # Keep the scenario from touching the real bot's config files.
+    os.environ.setdefault('HUSKYBOT_CONFIG_PREFIX', 'scenario')
+
+    report = asyncio.get_event_loop().run_until_complete(run_scenario(args, events, config))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()